@@ -0,0 +1,233 @@
+import os
+import io
+import sys
+import json
+import random
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+import fitz  # PyMuPDF: 합성 PDF 생성
+import c
+
+# ── 처리량 벤치마크 ──
+# 합성 PDF(페이지 수, 컬럼 수, 캡션 밀도, 가로선 수, 벡터 드로잉 수 조절 가능)와 실제 PDF 코퍼스에 대해
+# process_pdf를 DB 없이 실행하고, 문서별 pages/sec, 단계별 시간, 최대 RSS를 보고합니다.
+# 추출 결과(캡션, 테이블 영역, 클러스터 매칭)는 bench_baseline.json과 비교하여
+# 최적화로 인해 추출 영역이 바뀌지 않았는지 확인합니다.
+#
+#   python bench.py                      # 합성 코퍼스 벤치마크 + 기준 결과 비교
+#   python bench.py --corpus data        # data/의 실제 PDF도 함께 측정
+#   python bench.py --update-baseline    # 현재 결과를 기준 결과로 저장
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# 기본 합성 코퍼스: 이름과 생성 파라미터 (make_synthetic_pdf 참고)
+SYNTHETIC_CORPUS = [
+    {"name": "text_2col", "pages": 20, "columns": 2, "caption_density": 0.1, "rules": 0, "drawings": 0},
+    {"name": "figures_2col", "pages": 20, "columns": 2, "caption_density": 0.4, "rules": 0, "drawings": 40},
+    {"name": "tables_1col", "pages": 20, "columns": 1, "caption_density": 0.4, "rules": 6, "drawings": 0},
+    {"name": "dense_3col", "pages": 30, "columns": 3, "caption_density": 0.5, "rules": 4, "drawings": 120},
+    # 차트가 많은 문서: 페이지당 드로잉이 DRAWING_LOD_MIN_ELEMENTS 이상이 되어 드로잉 단순화(LOD) 경로를 거침
+    {"name": "charts_2col", "pages": 10, "columns": 2, "caption_density": 0.5, "rules": 0, "drawings": 400},
+]
+
+WORDS = ("data model layer result method value table figure sample error signal network system "
+         "analysis process feature training input output measure average metric section").split()
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 50
+GUTTER = 20
+
+def _paragraph(rng, n_words):
+    text = " ".join(rng.choice(WORDS) for _ in range(n_words))
+    return text[0].upper() + text[1:] + "."
+
+def make_synthetic_pdf(path, pages=10, columns=2, caption_density=0.3, rules=4, drawings=30, seed=0, **_):
+    """
+    벤치마크용 합성 PDF를 생성합니다. 같은 파라미터와 seed면 항상 같은 문서가 만들어집니다.
+    - columns: 페이지당 본문 컬럼 수
+    - caption_density: 본문 단락 자리마다 피규어/테이블이 들어갈 확률
+    - rules: 테이블마다 그리는 가로선 수 (0이면 테이블 대신 피규어만 생성)
+    - drawings: 페이지당 벡터 드로잉(사각형/선) 수. 피규어 영역들에 나누어 그립니다.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    col_width = (PAGE_WIDTH - 2 * MARGIN - GUTTER * (columns - 1)) / columns
+    fig_no = table_no = 0
+    for _ in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        figure_slots = []
+        for col in range(columns):
+            x0 = MARGIN + col * (col_width + GUTTER)
+            x1 = x0 + col_width
+            y = MARGIN
+            while y < PAGE_HEIGHT - MARGIN - 120:
+                if rng.random() < caption_density:
+                    height = rng.uniform(80, 140)
+                    if rules > 0 and rng.random() < 0.5:
+                        # 테이블: 캡션 아래에 가로선 rules개와 셀 텍스트
+                        table_no += 1
+                        page.insert_text((x0, y + 10), f"Table {table_no}. {_paragraph(rng, 4)}", fontsize=9)
+                        top = y + 18
+                        step = height / max(rules - 1, 1)
+                        for i in range(rules):
+                            line_y = top + i * step
+                            page.draw_line((x0, line_y), (x1, line_y), width=0.6)
+                            if i < rules - 1:
+                                page.insert_text((x0 + 4, line_y + 10), _paragraph(rng, 3), fontsize=7)
+                        y = top + height + 24
+                    else:
+                        # 피규어: 드로잉 영역과 그 아래 캡션
+                        fig_no += 1
+                        figure_slots.append(fitz.Rect(x0 + 10, y, x1 - 10, y + height))
+                        page.insert_text((x0, y + height + 14), f"Figure {fig_no}. {_paragraph(rng, 5)}", fontsize=9)
+                        y += height + 36
+                else:
+                    n_words = rng.randint(30, 70)
+                    box = fitz.Rect(x0, y, x1, y + 200)
+                    spare = page.insert_textbox(box, _paragraph(rng, n_words), fontsize=9)
+                    used = 200 - spare if spare >= 0 else 200
+                    y += used + 14
+        # 벡터 드로잉: 피규어 영역에 고르게 나누어 그림 (피규어가 없으면 생략)
+        for i in range(drawings if figure_slots else 0):
+            slot = figure_slots[i % len(figure_slots)]
+            w, h = rng.uniform(4, slot.width / 3), rng.uniform(4, slot.height / 3)
+            px, py = rng.uniform(slot.x0, slot.x1 - w), rng.uniform(slot.y0, slot.y1 - h)
+            if rng.random() < 0.5:
+                page.draw_rect(fitz.Rect(px, py, px + w, py + h), color=(0, 0, 0), width=0.5)
+            else:
+                page.draw_line((px, py), (px + w, py + h), width=0.5)
+    doc.save(path)
+    doc.close()
+
+def canonical_results(rows):
+    """
+    build_sql_rows 결과에서 영역 PDF 경로를 제외하고 좌표를 반올림한, 비교 가능한 형태로 바꿉니다.
+    (경로는 문서 키와 파이프라인 파라미터에 따라 달라지므로 비교 대상에서 제외)
+    """
+    def coords(values):
+        return [round(v, 2) for v in values]
+    captions = sorted([label, page, text, *coords(rest)] for label, page, text, *rest in rows["captions"])
+    tables = sorted([label, page, *coords(rest)] for label, _, page, *rest in rows["tables"])
+    clusters = sorted([label, page, *coords(rest)] for label, page, _, *rest in rows["clusters"])
+    return {"captions": captions, "tables": tables, "clusters": clusters}
+
+def _bench_document(input_path, workdir, streaming):
+    """워커 프로세스에서 문서 하나를 처리하고 (프로파일 레코드, DB 행)을 반환합니다."""
+    os.chdir(workdir)  # RegionWriter는 현재 디렉터리의 output/ 아래에 기록
+    profiler = c.StageProfiler(os.path.basename(input_path))
+    collector = c._RowCollector()
+    with contextlib.redirect_stdout(io.StringIO()):
+        c.process_pdf(input_path, os.path.join(workdir, os.path.basename(input_path)),
+                      sink=collector, streaming=streaming, profiler=profiler)
+    return profiler.records(), collector.rows
+
+def run_benchmark(documents, streaming=False, repeat=1):
+    """
+    documents: (이름, PDF 경로) 리스트. 문서마다 새 프로세스에서 repeat번 처리하고 가장 빠른 실행을 채택합니다.
+    - 반환값: {이름: {"pages", "wall", "pages_per_sec", "peak_rss_kb", "stages", "results"}}
+    """
+    report = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, path in documents:
+            best = None
+            for _ in range(repeat):
+                # 문서마다 새 프로세스를 사용하여 최대 RSS를 문서 단위로 측정
+                with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+                    records, rows = pool.apply(_bench_document, (os.path.abspath(path), workdir, streaming))
+                summary = records[-1]
+                if best is None or summary["wall"] < best[0]["wall"]:
+                    best = (summary, rows)
+            summary, rows = best
+            report[name] = {
+                "pages": summary["pages"],
+                "wall": summary["wall"],
+                "pages_per_sec": summary["pages"] / summary["wall"] if summary["wall"] > 0 else 0.0,
+                "peak_rss_kb": summary["peak_rss_kb"],
+                "stages": {stage: times["wall"] for stage, times in summary["stages"].items()},
+                "results": canonical_results(rows),
+            }
+    return report
+
+def print_report(report):
+    print(f"{'document':<32}{'pages':>7}{'wall(s)':>10}{'pages/s':>10}{'peak RSS(MB)':>14}")
+    for name, entry in report.items():
+        rss = f"{entry['peak_rss_kb'] / 1024:.1f}" if entry["peak_rss_kb"] else "-"
+        print(f"{name:<32}{entry['pages']:>7}{entry['wall']:>10.3f}{entry['pages_per_sec']:>10.1f}{rss:>14}")
+    totals = {}
+    for entry in report.values():
+        for stage, wall in entry["stages"].items():
+            totals[stage] = totals.get(stage, 0.0) + wall
+    total = sum(totals.values()) or 1.0
+    pages = sum(entry["pages"] for entry in report.values())
+    wall = sum(entry["wall"] for entry in report.values())
+    print(f"\n전체: {pages} 페이지, {wall:.3f}s, {pages / wall if wall else 0:.1f} pages/s")
+    print(f"\n{'stage':<24}{'wall(s)':>10}{'share':>8}")
+    for stage, wall in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+        print(f"{stage:<24}{wall:>10.3f}{wall / total:>8.1%}")
+
+def compare_baseline(report, baseline):
+    """기준 결과와 추출 결과를 비교하여 달라진 문서 이름 리스트를 반환합니다."""
+    changed = []
+    for name, entry in report.items():
+        if name not in baseline:
+            print(f"기준 결과 없음: {name}")
+            continue
+        if entry["results"] != baseline[name]:
+            changed.append(name)
+            for key in ("captions", "tables", "clusters"):
+                before, after = baseline[name][key], entry["results"][key]
+                if before != after:
+                    print(f"결과 변경: {name} {key} ({len(before)} -> {len(after)})")
+    return changed
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF 캡션/클러스터 추출 처리량 벤치마크")
+    parser.add_argument("--corpus", default=None, help="함께 측정할 실제 PDF 디렉터리 (예: data)")
+    parser.add_argument("--no-synthetic", action="store_true", help="합성 코퍼스를 생략")
+    parser.add_argument("--pages", type=int, default=None, help="합성 문서의 페이지 수 (기본값: 코퍼스 설정)")
+    parser.add_argument("--repeat", type=int, default=1, help="문서당 반복 횟수 (가장 빠른 실행을 채택)")
+    parser.add_argument("--streaming", action="store_true", help="페이지 단위 스트리밍 처리로 측정")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="기준 결과 파일 경로")
+    parser.add_argument("--update-baseline", action="store_true", help="현재 추출 결과를 기준 결과로 저장")
+    parser.add_argument("--json", default=None, help="측정 결과 전체를 JSON으로 저장할 경로")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        documents = []
+        if not args.no_synthetic:
+            for seed, spec in enumerate(SYNTHETIC_CORPUS):
+                params = dict(spec, pages=args.pages or spec["pages"])
+                path = os.path.join(corpus_dir, f"{spec['name']}.pdf")
+                make_synthetic_pdf(path, seed=seed, **params)
+                # 페이지 수를 바꾸면 결과도 달라지므로 기준 결과의 키에 포함
+                documents.append((f"synthetic/{spec['name']}/{params['pages']}p", path))
+        if args.corpus:
+            documents.extend((f"{os.path.basename(os.path.normpath(args.corpus))}/{filename}", os.path.join(args.corpus, filename))
+                             for filename in sorted(os.listdir(args.corpus)) if filename.lower().endswith(".pdf"))
+        report = run_benchmark(documents, streaming=args.streaming, repeat=args.repeat)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if args.update_baseline:
+        baseline.update({name: entry["results"] for name, entry in report.items()})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f"\n기준 결과 저장: {args.baseline} ({len(report)}개 문서)")
+        return
+    changed = compare_baseline(report, baseline)
+    if changed:
+        print(f"\n추출 결과가 기준과 다른 문서 {len(changed)}개: {', '.join(changed)}")
+        sys.exit(1)
+    print("\n추출 결과가 기준 결과와 같습니다.")
+
+if __name__ == '__main__':
+    main()
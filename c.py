@@ -1,37 +1,199 @@
 import os
-import re
+import sys
 import random
 import fitz  # PyMuPDF: PDF 파일 읽기 및 조작 라이브러리
 import math
-from collections import deque
+import bisect
+from collections import deque, OrderedDict
 import mysql.connector
+import mysql.connector.pooling
+import sqlite3
+import threading
 from datetime import datetime
 import time
+import json
+import csv
+import gzip
+import io
+import hashlib
+import zlib
+import struct
+import shutil
+import queue
+import signal
+import argparse
+import contextlib
+import cProfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import numpy as np
+import geometry
+import captions
+from records import CaptionRecord, TableRecord, MatchRecord, RegionStore
+
+try:
+    import resource  # 최대 메모리(RSS) 측정용, Unix 전용
+except ImportError:
+    resource = None
+
+try:
+    from PIL import Image  # 썸네일 WebP 인코딩용 (선택)
+except ImportError:
+    Image = None
+
+try:
+    import pyarrow as pa  # 컬럼형 내보내기(Parquet)용 (선택)
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
 # 그룹화 허용 오차: 텍스트 블록들의 x 좌표 차이 허용치 (컬럼 검출에 사용)
 GROUP_TOLERANCE = 10
+# 비텍스트 요소 클러스터링 거리 임계값 및 최소 클러스터 크기 (stage 6, 8)
+CLUSTER_THRESHOLD = 20
+MIN_CLUSTER_SIZE = 5
+# 캡션-클러스터 매칭 후보: 캡션마다 가까운 MATCH_K개, 거리 MATCH_MAX_DISTANCE 이하의 클러스터만 고려 (stage 9)
+# 가장 가까운 클러스터가 MATCH_MAX_DISTANCE보다 먼 캡션은 매칭되지 않습니다.
+# 둘 다 None으로 두면 거리와 관계없이 모든 클러스터를 후보로 보는 기존(Kuhn 매칭) 범위로 돌아갑니다.
+MATCH_K = 5
+MATCH_MAX_DISTANCE = 150
+# 캡션 검출기: 피규어와 테이블 (configure_captions로 언어/접두어 변경)
+CAPTION_DETECTOR = captions.CaptionDetector.for_languages()
+# 페이지 가지치기: None이면 끔. N이면 캡션 후보 페이지와 앞뒤 N쪽에서만 6~10단계 수행 (configure_page_pruning)
+PRUNE_NEIGHBOURS = None
+# 추출 결과에 영향을 주는 로직이 바뀌면 올려서 기존 실행 캐시를 무효화
+PIPELINE_VERSION = 2
+
+# ── 공간 인덱스: 사각형 근접/교차/포함 질의 ──
+class GridIndex:
+    """
+    균일 격자(uniform grid) 기반의 사각형 공간 인덱스입니다.
+    - 각 사각형을 자신이 걸치는 격자 칸(cell)에 등록하고, 질의 시 해당 칸들에 등록된 후보만 반환합니다.
+    - 후보는 닫힌 경계 기준으로 질의 영역과 맞닿는 모든 사각형을 포함하는 상위 집합이므로,
+      호출자는 후보에 대해 기존의 정확한 판정(is_near, intersects, contains 등)을 그대로 적용하면 됩니다.
+    - 너무 많은 칸에 걸치는 큰 사각형(페이지 배경 등)은 별도 목록에 두고 항상 후보에 포함합니다.
+    """
+    MAX_CELLS_PER_RECT = 256
+
+    def __init__(self, cell_size=50):
+        self.cell_size = float(cell_size)
+        self.cells = {}
+        self.oversized = []
+        self.rects = []
+
+    def _cell_range(self, x0, y0, x1, y1):
+        cs = self.cell_size
+        return (math.floor(x0 / cs), math.floor(y0 / cs), math.floor(x1 / cs), math.floor(y1 / cs))
+
+    def insert(self, rect):
+        """사각형을 인덱스에 추가하고 부여된 인덱스(삽입 순서)를 반환합니다."""
+        idx = len(self.rects)
+        self.rects.append(rect)
+        x0, y0 = min(rect.x0, rect.x1), min(rect.y0, rect.y1)
+        x1, y1 = max(rect.x0, rect.x1), max(rect.y0, rect.y1)
+        if not all(math.isfinite(v) for v in (x0, y0, x1, y1)):
+            self.oversized.append(idx)
+            return idx
+        cx0, cy0, cx1, cy1 = self._cell_range(x0, y0, x1, y1)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > self.MAX_CELLS_PER_RECT:
+            self.oversized.append(idx)
+            return idx
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self.cells.setdefault((cx, cy), []).append(idx)
+        return idx
+
+    def query(self, x0, y0, x1, y1):
+        """닫힌 영역 (x0, y0, x1, y1)과 맞닿을 수 있는 사각형 인덱스 후보 집합을 반환합니다."""
+        found = set(self.oversized)
+        if not all(math.isfinite(v) for v in (x0, y0, x1, y1)):
+            found.update(range(len(self.rects)))
+            return found
+        cx0, cy0, cx1, cy1 = self._cell_range(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.cells):
+            for bucket in self.cells.values():
+                found.update(bucket)
+            return found
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = self.cells.get((cx, cy))
+                if bucket:
+                    found.update(bucket)
+        return found
+
+    def near(self, rect, threshold):
+        """rect와의 경계 거리가 threshold 이하인 사각형 인덱스를 삽입 순서대로 반환합니다."""
+        candidates = self.query(rect.x0 - threshold, rect.y0 - threshold, rect.x1 + threshold, rect.y1 + threshold)
+        return [i for i in sorted(candidates) if is_near(rect, self.rects[i], threshold)]
+
+    def intersecting(self, rect):
+        """rect와 교차(면적이 있는 겹침)하는 사각형 인덱스를 삽입 순서대로 반환합니다."""
+        candidates = self.query(rect.x0, rect.y0, rect.x1, rect.y1)
+        return [i for i in sorted(candidates) if self.rects[i].intersects(rect)]
+
+    def containing(self, rect):
+        """rect를 포함하는 사각형 인덱스를 삽입 순서대로 반환합니다."""
+        candidates = self.query(rect.x0, rect.y0, rect.x1, rect.y1)
+        return [i for i in sorted(candidates) if self.rects[i].contains(rect)]
+
+    def candidates(self, rect):
+        """rect와 맞닿을 수 있는 (인덱스, 사각형) 후보를 삽입 순서대로 반환합니다."""
+        return [(i, self.rects[i]) for i in sorted(self.query(rect.x0, rect.y0, rect.x1, rect.y1))]
+
+class PageRectIndex:
+    """
+    (페이지 번호, 사각형, ...) 튜플 리스트를 대체하는 페이지별 공간 인덱스입니다.
+    - append / 순회 / len은 기존 리스트와 동일하게 동작하므로 drawn_rectangles 등을 그대로 대체할 수 있습니다.
+    - 질의는 해당 페이지의 GridIndex만 조회하므로 문서 길이에 비례해 느려지지 않습니다.
+    """
+    def __init__(self, entries=(), cell_size=50):
+        self.cell_size = cell_size
+        self.entries = []
+        self.pages = {}  # 페이지 번호 -> (GridIndex, 해당 페이지 엔트리 리스트)
+        for entry in entries:
+            self.append(entry)
+
+    def append(self, entry):
+        self.entries.append(entry)
+        page_number, rect = entry[0], entry[1]
+        if page_number not in self.pages:
+            self.pages[page_number] = (GridIndex(self.cell_size), [])
+        grid, page_entries = self.pages[page_number]
+        grid.insert(rect)
+        page_entries.append(entry)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def candidates(self, page_number, rect):
+        """page_number 페이지에서 rect와 맞닿을 수 있는 엔트리 후보를 삽입 순서대로 반환합니다."""
+        if page_number not in self.pages:
+            return []
+        grid, page_entries = self.pages[page_number]
+        return [page_entries[i] for i in sorted(grid.query(rect.x0, rect.y0, rect.x1, rect.y1))]
 
 def rect_overlap_ratio(r1, r2):
     """
     두 사각형(r1, r2) 간의 겹치는 면적 비율을 계산합니다.
     - 겹치는 영역의 면적을 두 사각형 중 작은 면적에 대해 비율로 반환합니다.
     - 캡션이나 영역의 중복 여부 판단 등 영역 비교에 사용됨.
+    - 여러 쌍을 한 번에 계산할 때는 geometry.pairwise_overlap_ratio를 사용.
     """
-    x0 = max(r1.x0, r2.x0)
-    y0 = max(r1.y0, r2.y0)
-    x1 = min(r1.x1, r2.x1)
-    y1 = min(r1.y1, r2.y1)
-    if x1 > x0 and y1 > y0:
-        inter_area = (x1 - x0) * (y1 - y0)
-        return inter_area / min(r1.get_area(), r2.get_area())
-    return 0
+    return geometry.overlap_ratio(r1, r2)
 
 def already_drawn(page_number, rect, drawn_list, threshold=0.8):
     """
     이미 그려진(rectangles) 영역과 현재 rect의 겹침 비율이 임계값(threshold) 이상이면
     이미 처리된 영역으로 판단합니다.
     주로 중복으로 캡션이나 클러스터 영역을 표시하지 않도록 하기 위해 사용됨.
+    drawn_list가 PageRectIndex이면 같은 페이지의 인접 후보만 검사합니다.
     """
+    if isinstance(drawn_list, PageRectIndex):
+        drawn_list = drawn_list.candidates(page_number, rect)
     for pn, r in drawn_list:
         if page_number == pn and rect_overlap_ratio(rect, r) > threshold:
             return True
@@ -42,6 +204,8 @@ def is_in_blocks(page_number, rect, drawn_list):
     drawn_list에 있는 사각형 중 하나라도 현재 rect를 포함하거나 교차하는지 검사합니다.
     이미 처리된 영역과의 중복을 방지하는 역할.
     """
+    if isinstance(drawn_list, PageRectIndex):
+        drawn_list = drawn_list.candidates(page_number, rect)
     for tup in drawn_list:
         pn, r = tup[0], tup[1]
         if page_number == pn and (r.contains(rect) or r.intersects(rect)):
@@ -53,6 +217,8 @@ def is_intersects_blocks(page_number, rect, drawn_list):
     drawn_list에 있는 사각형 중 하나라도 현재 rect와 교차하는지 확인합니다.
     영역 간의 겹침 여부를 보다 단순하게 체크할 때 사용됨.
     """
+    if isinstance(drawn_list, PageRectIndex):
+        drawn_list = drawn_list.candidates(page_number, rect)
     for tup in drawn_list:
         pn, r = tup[0], tup[1]
         if page_number == pn and r.intersects(rect):
@@ -65,17 +231,20 @@ def is_near(r1, r2, threshold):
     - 두 사각형 사이의 최소 거리(두 사각형 경계 사이의 거리)를 계산하고,
     그 값이 threshold 이하이면 가까이 있다고 판단.
     - 클러스터링 알고리즘에서 인접 요소 그룹화에 사용됨.
+    - 여러 쌍을 한 번에 계산할 때는 geometry.near_mask를 사용.
     """
-    dx = max(r1.x0 - r2.x1, r2.x0 - r1.x1, 0)
-    dy = max(r1.y0 - r2.y1, r2.y0 - r1.y1, 0)
-    return (dx**2 + dy**2)**0.5 <= threshold
+    return geometry.gap_distance(r1, r2) <= threshold
 
 def cluster_elements(rects, threshold=5):
     """
     비텍스트 요소(이미지, 드로잉 등)들의 사각형 리스트를 threshold 값을 기준으로 클러스터링합니다.
     - 너비, 높이 등의 거리를 비교하여 인접한 요소들을 하나의 그룹(클러스터)으로 묶습니다.
     - BFS/DFS와 유사하게 queue를 사용하여 인접한 모든 요소를 방문합니다.
+    - 인접 요소 탐색은 GridIndex로 근처 후보만 조회하므로 전체 쌍 비교(O(n²))를 피합니다.
     """
+    grid = GridIndex(cell_size=max(threshold * 2, 32))
+    for rect in rects:
+        grid.insert(rect)
     clusters = []
     visited = set()
     for i, rect in enumerate(rects):
@@ -89,21 +258,213 @@ def cluster_elements(rects, threshold=5):
                 continue
             visited.add(idx)
             cluster.append(rects[idx])
-            for j, other in enumerate(rects):
-                if j not in visited and is_near(rects[idx], other, threshold):
+            for j in grid.near(rects[idx], threshold):
+                if j not in visited:
                     queue.append(j)
         clusters.append(cluster)
     return clusters
 
+# ── 드로잉 단순화(LOD): 클러스터링 전 요소 수 줄이기 ──
+# 차트/그래프 페이지는 마커, 눈금, 해칭 때문에 드로잉 경로가 수천 개씩 나오므로, 클러스터링 전에
+# 서로 반드시 같은 클러스터가 되는 요소들을 그룹 하나로 묶고 그룹의 경계 상자(대표 사각형)만 클러스터링합니다.
+# - 다른 사각형에 완전히 포함된 사각형은 포함하는 사각형의 그룹에 넣습니다. (근접 관계와 합집합이 같음)
+# - 남은 사각형을 threshold / 2 크기의 점유 격자(occupancy grid)에 올리고, 같은 칸을 차지하는 사각형들을
+#   한 그룹(연속 구간)으로 합칩니다. 같은 칸에 닿는 두 사각형의 거리는 칸의 대각선(threshold * 0.71) 이하입니다.
+# - 대표 사각형은 그룹 요소들의 경계 상자이므로 실제 요소보다 넓습니다. 대표 사각형끼리 가까운 그룹 쌍은
+#   실제 요소끼리 threshold 이내인 쌍이 있는지 확인한 뒤에만 합치므로, 요소를 클러스터로 나누는 방식(분할)은
+#   cluster_elements와 같습니다. (클러스터 안의 요소 순서는 BFS 방문 순서가 아닌 입력 순서)
+DRAWING_LOD_MIN_ELEMENTS = 200  # 클러스터링 요소가 이 개수 이상인 페이지에만 단순화 적용
+
+def simplify_drawings(rects, threshold):
+    """
+    rects를 반드시 같은 클러스터에 속하는 요소들의 그룹으로 묶습니다.
+    - 반환값: [(대표 사각형, [rects 인덱스(오름차순)])] (그룹의 최소 인덱스 순)
+    - 대표 사각형은 그룹 요소 좌표의 경계 상자입니다. (면적이 없는 선분도 포함)
+    """
+    valid = []
+    groups = {}  # 그룹 대표 인덱스 -> [rects 인덱스]
+    for i, r in enumerate(rects):
+        if all(math.isfinite(v) for v in (r.x0, r.y0, r.x1, r.y1)) and r.x0 <= r.x1 and r.y0 <= r.y1:
+            valid.append(i)
+        else:
+            groups[i] = [i]  # 비정상 사각형은 단순화하지 않고 그대로 클러스터링
+    # 1) 포함 관계: 큰 사각형부터 받아들이고, 이미 받아들인 사각형에 포함되면 그 그룹에 넣음
+    valid.sort(key=lambda i: (-rects[i].width * rects[i].height, -(rects[i].width + rects[i].height), i))
+    accepted = GridIndex(cell_size=max(threshold * 2, 32))
+    accepted_ids = []
+    for i in valid:
+        r = rects[i]
+        owner = None
+        for k, a in accepted.candidates(r):
+            if a.x0 <= r.x0 and a.y0 <= r.y0 and r.x1 <= a.x1 and r.y1 <= a.y1:
+                owner = accepted_ids[k]
+                break
+        if owner is None:
+            accepted.insert(r)
+            accepted_ids.append(i)
+            groups[i] = [i]
+        else:
+            groups[owner].append(i)
+    # 2) 점유 격자: 같은 칸을 차지하는 사각형끼리 union-find로 합침
+    parent = {i: i for i in accepted_ids}
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    cell = threshold / 2
+    occupied = {}  # 격자 칸 -> 처음 차지한 사각형 인덱스
+    for i in (accepted_ids if cell > 0 else ()):  # threshold가 0이면 포함 관계로만 묶음
+        r = rects[i]
+        cx0, cy0 = math.floor(r.x0 / cell), math.floor(r.y0 / cell)
+        cx1, cy1 = math.floor(r.x1 / cell), math.floor(r.y1 / cell)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > GridIndex.MAX_CELLS_PER_RECT:
+            continue  # 큰 사각형은 그대로 두고 클러스터링에서 이웃을 찾음
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                other = occupied.setdefault((cx, cy), i)
+                ri, ro = find(i), find(other)
+                if ri != ro:
+                    parent[max(ri, ro)] = min(ri, ro)
+    merged = {}
+    for i in accepted_ids:
+        merged.setdefault(find(i), []).extend(groups.pop(i))
+    for i, members in groups.items():  # 비정상 사각형
+        merged[i] = members
+    simplified = []
+    for members in merged.values():
+        members.sort()
+        box = fitz.Rect(min(rects[i].x0 for i in members), min(rects[i].y0 for i in members),
+                        max(rects[i].x1 for i in members), max(rects[i].y1 for i in members))
+        simplified.append((box, members))
+    simplified.sort(key=lambda group: group[1][0])
+    return simplified
+
+def _groups_near(rects, group_a, group_b, threshold):
+    """두 그룹 (대표 사각형, 인덱스 리스트)의 실제 요소 중 threshold 이내인 쌍이 있는지 확인합니다."""
+    box_a, members_a = group_a
+    box_b, members_b = group_b
+    # 상대 그룹의 대표 사각형에서 먼 요소는 상대 그룹의 어떤 요소와도 멀기 때문에 제외
+    side_a = [rects[i] for i in members_a if is_near(rects[i], box_b, threshold)]
+    if not side_a:
+        return False
+    grid = GridIndex(cell_size=max(threshold * 2, 32))
+    for j in members_b:
+        if is_near(rects[j], box_a, threshold):
+            grid.insert(rects[j])
+    return any(grid.near(r, threshold) for r in side_a)
+
+def cluster_drawings(rects, threshold=5):
+    """
+    simplify_drawings로 요소를 그룹으로 묶은 뒤 그룹 단위로 클러스터링합니다.
+    - 반환값은 cluster_elements(rects, threshold)와 같은 분할(partition)입니다. 클러스터 순서(최소 인덱스 순)도
+      같지만, 클러스터 안의 요소는 cluster_elements의 BFS 방문 순서가 아닌 입력 순서입니다.
+    - 좌표가 유한하지 않은 사각형(NaN 등)이 있으면 is_near가 대칭이 아니어서 클러스터가 방문 순서에 따라
+      달라지므로, cluster_elements 결과를 그대로 반환합니다.
+    """
+    if not all(math.isfinite(v) for r in rects for v in (r.x0, r.y0, r.x1, r.y1)):
+        return cluster_elements(rects, threshold)
+    groups = simplify_drawings(rects, threshold)
+    parent = list(range(len(groups)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    grid = GridIndex(cell_size=max(threshold * 2, 32))
+    for box, _ in groups:
+        grid.insert(box)
+    for i, (box, _) in enumerate(groups):
+        for j in grid.near(box, threshold):
+            if j <= i:
+                continue
+            ri, rj = find(i), find(j)
+            if ri != rj and _groups_near(rects, groups[i], groups[j], threshold):
+                parent[max(ri, rj)] = min(ri, rj)
+    clusters = {}
+    for i, (_, members) in enumerate(groups):
+        clusters.setdefault(find(i), []).extend(members)
+    # 그룹은 최소 인덱스 순이고 루트는 가장 작은 그룹이므로, 클러스터도 최소 인덱스 순 (cluster_elements와 같음)
+    return [[rects[i] for i in sorted(members)] for _, members in sorted(clusters.items())]
+
 def merge_overlapping_rects(rects, tol=0):
     """
-    입력된 사각형 리스트 중 서로 겹치거나 인접(tol 이하 차이)하는 사각형들을 반복적으로 합칩니다.
+    입력된 사각형 리스트 중 서로 겹치거나 인접(tol 이하 차이)하는 사각형들을 합칩니다.
     - PDF 영역 추출 후 중복 또는 분할된 영역을 하나로 병합하는 알고리즘.
-    - while 루프를 사용하여 반복적으로 병합이 일어날 때까지 수행.
+    - x0 기준으로 정렬한 뒤 x 구간이 겹치는 사각형끼리만 비교하는 sweep-line과
+      union-find로 겹치는 그룹을 묶습니다.
+    - 합쳐진 영역이 다시 다른 그룹과 겹칠 수 있으므로, 그룹 경계 상자 사이에 더 이상 겹침이
+      없을 때까지 같은 sweep을 반복합니다. (대부분 한두 번이면 끝남)
+    - tol > 0이면 가로/세로 간격이 모두 tol 이하인 사각형도 인접한 것으로 보고 병합합니다.
+    - 결과는 기존 반복 병합 방식과 동일한 사각형들을, 각 그룹의 첫 입력 순서대로 반환합니다.
+    - 면적이 없는 사각형(선분 등)은 합집합에 반영되지 않아 병합 결과가 병합 순서에 따라 달라지므로,
+      입력에 하나라도 있으면 기존 반복 병합 방식(_merge_rects_iterative)으로 처리합니다.
+      (파이프라인의 클러스터 영역은 MIN_CLUSTER_SIZE 이상이므로 해당하지 않음)
     """
     if not rects:
         return []
-    merged = rects.copy()
+    if not all(r.x0 < r.x1 and r.y0 < r.y1 for r in rects):
+        return _merge_rects_iterative(rects, tol)
+    # 그룹: (경계 상자, 그룹 내 최소 입력 인덱스)
+    groups = [(r, i) for i, r in enumerate(rects)]
+    while True:
+        parent = list(range(len(groups)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        boxes = [(r.x0, r.y0, r.x1, r.y1) for r, _ in groups]
+        merged_any = False
+        active = []  # x 구간이 아직 열려 있는 그룹 인덱스
+        for i in sorted(range(len(groups)), key=lambda k: boxes[k][0]):
+            x0, y0, x1, y1 = boxes[i]
+            # 현재 사각형의 x0 이전에 끝난 그룹은 더 이상 겹칠 수 없으므로 제거
+            active = [j for j in active if boxes[j][2] + tol >= x0]
+            for j in active:
+                ox0, oy0, ox1, oy1 = boxes[j]
+                if tol > 0:
+                    overlapping = ox0 - tol <= x1 and x0 - tol <= ox1 and oy0 - tol <= y1 and y0 - tol <= oy1
+                else:
+                    # 면적이 있는 두 사각형은 포함 관계도 항상 교차이므로 교차 여부만 확인
+                    overlapping = ox0 < x1 and x0 < ox1 and oy0 < y1 and y0 < oy1
+                if overlapping:
+                    ri, rj = find(i), find(j)
+                    if ri != rj:
+                        parent[max(ri, rj)] = min(ri, rj)
+                        merged_any = True
+            active.append(i)
+        if not merged_any:
+            break
+        new_groups = {}
+        for i, (rect, first) in enumerate(groups):
+            root = find(i)
+            if root not in new_groups:
+                new_groups[root] = (rect, first)
+            else:
+                union, group_first = new_groups[root]
+                new_groups[root] = (union | rect, min(group_first, first))
+        groups = list(new_groups.values())
+    groups.sort(key=lambda g: g[1])
+    return [rect for rect, _ in groups]
+
+def _merge_rects_iterative(rects, tol=0):
+    """
+    겹치는 사각형을 하나씩 합쳐 나가는 기존 반복 병합 방식입니다. (입력 사각형은 바꾸지 않음)
+    - 면적이 없는 사각형이 섞인 입력에서 merge_overlapping_rects가 사용합니다.
+    """
+    def overlapping(a, b):
+        if tol > 0:
+            return b.x0 - tol <= a.x1 and a.x0 - tol <= b.x1 and b.y0 - tol <= a.y1 and a.y0 - tol <= b.y1
+        return a.intersects(b) or a.contains(b) or b.contains(a)
+
+    merged = [fitz.Rect(r) for r in rects]
     changed = True
     while changed:
         changed = False
@@ -112,7 +473,7 @@ def merge_overlapping_rects(rects, tol=0):
             current = merged.pop(0)
             i = 0
             while i < len(merged):
-                if current.intersects(merged[i]) or current.contains(merged[i]) or merged[i].contains(current):
+                if overlapping(current, merged[i]):
                     current |= merged.pop(i)  # 두 사각형의 합집합을 계산
                     changed = True
                 else:
@@ -147,30 +508,9 @@ def closest_points_between_rectangles(r1, r2):
     - 두 사각형의 상대적인 위치(겹치는지, 떨어져 있는지)에 따라
       서로 다른 점을 선택하여 최소 거리를 계산합니다.
     - 캡션과 클러스터 영역 매칭 시 두 영역 간의 거리를 계산하는 데 사용됨.
+    - 여러 쌍을 한 번에 계산할 때는 geometry.closest_point_pairs를 사용.
     """
-    if r1.x1 < r2.x0:
-        p1_x = r1.x1
-        p2_x = r2.x0
-    elif r2.x1 < r1.x0:
-        p1_x = r1.x0
-        p2_x = r2.x1
-    else:
-        overlap_x0 = max(r1.x0, r2.x0)
-        overlap_x1 = min(r1.x1, r2.x1)
-        p1_x = p2_x = (overlap_x0 + overlap_x1) / 2
-
-    if r1.y1 < r2.y0:
-        p1_y = r1.y1
-        p2_y = r2.y0
-    elif r2.y1 < r1.y0:
-        p1_y = r1.y0
-        p2_y = r2.y1
-    else:
-        overlap_y0 = max(r1.y0, r2.y0)
-        overlap_y1 = min(r1.y1, r2.y1)
-        p1_y = p2_y = (overlap_y0 + overlap_y1) / 2
-
-    return (p1_x, p1_y), (p2_x, p2_y)
+    return geometry.closest_points(r1, r2)
 
 def is_in_matched(cluster, matched_list):
     """
@@ -184,438 +524,1277 @@ def is_in_matched(cluster, matched_list):
             return True
     return False
 
+# ── 페이지 추출 캐시 ──
+class PageData:
+    """
+    한 페이지에서 파이프라인의 모든 단계가 사용하는 원시 정보를 한 번만 추출해 보관합니다.
+    - blocks: get_text("blocks") 결과 (x0, y0, x1, y1, text, block_no, block_type)
+    - words: 단어 경계 상자 (x0, y0, x1, y1). 클립 텍스트 조회 시 빈 후보 영역을 걸러내는 데 사용.
+    - drawings: 드로잉 path들의 경계 사각형 리스트 (get_drawings()의 "rect")
+    - image_rects: 페이지에 배치된 이미지 사각형 리스트 (get_images / get_image_rects 순서와 동일)
+    텍스트 블록과 단어는 하나의 TextPage에서 함께 추출하고, 드로잉은 가벼운 get_cdrawings()를 사용합니다.
+    드로잉과 이미지 영역은 처음 조회할 때 추출합니다.
+    """
+    def __init__(self, page, image_digests=None):
+        self.doc = page.parent
+        self.number = page.number
+        self.rect = page.rect
+        textpage = page.get_textpage(flags=fitz.TEXTFLAGS_BLOCKS)
+        self.blocks = page.get_text("blocks", textpage=textpage)
+        self.words = [tuple(w[:4]) for w in page.get_text("words", textpage=textpage)]
+        del textpage
+        self._image_digests = image_digests if image_digests is not None else {}
+        self._drawings = None
+        self._image_rects = None
+        self._clip_text_cache = {}
+
+    @property
+    def drawings(self):
+        # 드로잉/이미지 정보는 처음 사용할 때 추출 (스트리밍 1차 패스처럼 텍스트만 필요한 경우 생략)
+        if self._drawings is None:
+            page = self.doc[self.number]
+            get_drawings = getattr(page, "get_cdrawings", None) or page.get_drawings
+            self._drawings = [fitz.Rect(obj["rect"]) for obj in get_drawings() if "rect" in obj]
+        return self._drawings
+
+    @property
+    def image_rects(self):
+        if self._image_rects is None:
+            self._image_rects = self._extract_image_rects(self.doc[self.number], self._image_digests)
+        return self._image_rects
+
+    @staticmethod
+    def _extract_image_rects(page, image_digests):
+        """
+        page.get_image_rects(xref)와 동일한 결과를 만들되, 페이지의 이미지 정보는 한 번만 조회하고
+        이미지(xref)별 다이제스트는 문서 단위로 재사용합니다.
+        """
+        images = page.get_images(full=True)
+        if not images:
+            return []
+        infos = page.get_image_info(hashes=True)
+        rects = []
+        for img in images:
+            xref = img[0]
+            digest = image_digests.get(xref)
+            if digest is None:
+                pix = fitz.Pixmap(page.parent, xref)
+                digest = image_digests[xref] = pix.digest
+                del pix
+            rects.extend(fitz.Rect(info["bbox"]) for info in infos if info["digest"] == digest)
+        return rects
+
+    def clip_text(self, clip):
+        """
+        clip 영역의 텍스트를 반환합니다. (page.get_text("text", clip=clip)과 동일)
+        - 영역과 겹치는 단어가 하나도 없으면 MuPDF를 호출하지 않고 빈 문자열을 반환.
+        - 동일한 영역에 대한 반복 조회는 캐시된 결과를 사용.
+        """
+        key = (clip.x0, clip.y0, clip.x1, clip.y1)
+        if key in self._clip_text_cache:
+            return self._clip_text_cache[key]
+        if any(x0 < clip.x1 and x1 > clip.x0 and y0 < clip.y1 and y1 > clip.y0
+               for x0, y0, x1, y1 in self.words):
+            text = self.doc[self.number].get_text("text", clip=clip)
+        else:
+            text = ""
+        self._clip_text_cache[key] = text
+        return text
+
 # ── SQL 저장 함수 ──
-def save_to_sql(file_name, table_caption_regions, figure_caption_regions, drawn_table_regions, page_caption_matching):
+# MySQL 접속 정보는 환경 변수로 지정합니다. (비밀번호를 코드에 두지 않음)
+DB_CONFIG = {
+    "host": os.environ.get("PDF_PARSER_DB_HOST", "localhost"),
+    "user": os.environ.get("PDF_PARSER_DB_USER", "root"),
+    "password": os.environ.get("PDF_PARSER_DB_PASSWORD", ""),
+    "database": os.environ.get("PDF_PARSER_DB_NAME", "pdf_parser"),
+    "port": int(os.environ.get("PDF_PARSER_DB_PORT", "3306")),
+}
+
+# 로컬 테스트용 SQLite 스키마 (README의 MySQL 스키마와 동일한 컬럼)
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdf_documents (
+  pdf_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  file_name TEXT NOT NULL,
+  processed_date TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS captions (
+  caption_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  caption_name TEXT,
+  pdf_id INTEGER NOT NULL REFERENCES pdf_documents(pdf_id) ON DELETE CASCADE,
+  page_number INTEGER NOT NULL,
+  caption_text TEXT,
+  x0 REAL, y0 REAL, x1 REAL, y1 REAL
+);
+CREATE TABLE IF NOT EXISTS tables (
+  table_region_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  caption_id INTEGER NOT NULL REFERENCES captions(caption_id) ON DELETE CASCADE,
+  pdf_file_name TEXT,
+  page_number INTEGER NOT NULL,
+  x0 REAL, y0 REAL, x1 REAL, y1 REAL
+);
+CREATE TABLE IF NOT EXISTS clusters (
+  cluster_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  caption_id INTEGER REFERENCES captions(caption_id) ON DELETE SET NULL,
+  page_number INTEGER NOT NULL,
+  pdf_file_name TEXT,
+  x0 REAL, y0 REAL, x1 REAL, y1 REAL
+);
+"""
+
+def build_sql_rows(file_name, table_caption_regions, figure_caption_regions, drawn_table_regions, page_caption_matching):
     """
-    추출한 캡션, 테이블 영역, 클러스터 매칭 정보를 MySQL 데이터베이스에 저장합니다.
+    추출 결과를 DB에 넣을 행(row) 데이터로 변환합니다.
+    - 반환값은 튜플/문자열로만 구성되어 있어 프로세스 간 전달(pickle)과 JSON 직렬화가 가능합니다.
+    - captions: (caption_name, page_number, caption_text, x0, y0, x1, y1)
+    - tables: (caption_name, pdf_file_name, page_number, x0, y0, x1, y1)
+    - clusters: (caption_name, page_number, pdf_file_name, x0, y0, x1, y1)
+      tables / clusters의 caption_id는 저장 시점에 캡션 라벨로 연결합니다.
+    """
+    captions = []
+    for region in list(table_caption_regions) + list(figure_caption_regions):
+        captions.append((region.label, region.page, region.text, region.x0, region.y0, region.x1, region.y1))
+
+    # 테이블 캡션에 대한 PDF 파일 경로 매핑 생성 (영역 PDF를 출력한 캡션만)
+    table_pdf_mapping = {region.label: region.region_path for region in table_caption_regions if region.region_path is not None}
+    tables = []
+    for table in drawn_table_regions:
+        pdf_file_name = table_pdf_mapping.get(table.label, '')
+        tables.append((table.label, pdf_file_name, table.page, table.x0, table.y0, table.x1, table.y1))
+
+    clusters = []
+    for page_number, matching in page_caption_matching.items():
+        for cap_label, match in matching.items():
+            clusters.append((cap_label, page_number, match.region_path or "", match.x0, match.y0, match.x1, match.y1))
+
+    return {"file_name": file_name, "captions": captions, "tables": tables, "clusters": clusters}
+
+def delete_sql_rows(cursor, file_name, placeholder="%s"):
+    """
+    file_name으로 저장된 이전 처리 결과(pdf_documents 및 연결된 captions / tables / clusters)를 삭제합니다.
+    - clusters의 외래키는 ON DELETE SET NULL이므로 캐스케이드에 의존하지 않고 명시적으로 지웁니다.
+    """
+    ph = placeholder
+    pdf_ids = f"SELECT pdf_id FROM pdf_documents WHERE file_name = {ph}"
+    caption_ids = f"SELECT caption_id FROM captions WHERE pdf_id IN ({pdf_ids})"
+    cursor.execute(f"DELETE FROM clusters WHERE caption_id IN ({caption_ids})", (file_name,))
+    cursor.execute(f"DELETE FROM tables WHERE caption_id IN ({caption_ids})", (file_name,))
+    cursor.execute(f"DELETE FROM captions WHERE pdf_id IN ({pdf_ids})", (file_name,))
+    cursor.execute(f"DELETE FROM pdf_documents WHERE file_name = {ph}", (file_name,))
+
+def insert_sql_rows(cursor, rows, placeholder="%s", replace=True):
+    """
+    build_sql_rows()로 만든 문서 하나의 행들을 테이블별 executemany로 저장합니다.
     주요 단계:
       1. 파일 정보를 pdf_documents 테이블에 저장.
-      2. 캡션 정보를 captions 테이블에 저장 및 매핑 생성.
+      2. 캡션 정보를 captions 테이블에 한 번에 저장한 뒤, 캡션 라벨 -> caption_id 매핑을 조회.
       3. 테이블 영역 정보를 tables 테이블에 저장.
       4. 클러스터 영역(매칭) 정보를 clusters 테이블에 저장.
+    - replace가 True이면 같은 파일명으로 저장된 이전 결과를 먼저 삭제하여, 재처리 시 행이 중복되지 않습니다.
+    - 커밋은 호출자가 결정합니다.
     """
-    conn = mysql.connector.connect(
-        host='localhost',
-        user='root',
-        password='00000000',
-        database='pdf_parser',
-        port=3306
-    )
-
-    cursor = conn.cursor()
-    
+    ph = placeholder
+    if replace:
+        delete_sql_rows(cursor, rows["file_name"], ph)
     # 1. PDF 파일 정보 저장
-    cursor.execute("INSERT INTO pdf_documents (file_name) VALUES (%s)", (file_name,))
+    cursor.execute(f"INSERT INTO pdf_documents (file_name) VALUES ({ph})", (rows["file_name"],))
     pdf_id = cursor.lastrowid
-    
-    # 캡션 정보를 저장하기 위한 매핑 (캡션 라벨 -> caption_id)
-    caption_mapping = {}
-    
-    # 2. 캡션 정보 저장 (table_caption_regions, figure_caption_regions 모두)
-    for region in table_caption_regions + figure_caption_regions:
-        if len(region) == 5:
-            cap_rect, cap_label, cap_text, page_number, pdf_file_name = region
-        else:
-            cap_rect, cap_label, cap_text, page_number = region
-            pdf_file_name = ""
-        x0, y0, x1, y1 = cap_rect.x0, cap_rect.y0, cap_rect.x1, cap_rect.y1
-        cursor.execute(
-            "INSERT INTO captions (caption_name, pdf_id, page_number, caption_text, x0, y0, x1, y1) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
-            (cap_label, pdf_id, page_number, cap_text, x0, y0, x1, y1)
+
+    # 2. 캡션 정보 저장 및 매핑 생성 (같은 라벨이 여러 번 나오면 마지막 캡션을 사용)
+    if rows["captions"]:
+        cursor.executemany(
+            f"INSERT INTO captions (caption_name, pdf_id, page_number, caption_text, x0, y0, x1, y1) VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})",
+            [(label, pdf_id, page_number, text, x0, y0, x1, y1) for label, page_number, text, x0, y0, x1, y1 in rows["captions"]]
         )
-        caption_id = cursor.lastrowid
-        caption_mapping[cap_label] = caption_id
+    cursor.execute(f"SELECT caption_id, caption_name FROM captions WHERE pdf_id = {ph} ORDER BY caption_id", (pdf_id,))
+    caption_mapping = {cap_label: caption_id for caption_id, cap_label in cursor.fetchall()}
 
-    # 테이블 캡션에 대한 PDF 파일 경로 매핑 생성
-    table_pdf_mapping = {cap_label: pdf_file_name for (_, cap_label, _, _, pdf_file_name) in table_caption_regions}
-    
     # 3. 테이블 영역 정보 저장
-    for page_number, table_rect, cap_label in drawn_table_regions:
-        caption_id = caption_mapping.get(cap_label)
-        if caption_id is None:
-            continue
-        x0, y0, x1, y1 = table_rect.x0, table_rect.y0, table_rect.x1, table_rect.y1
-        pdf_file_name = table_pdf_mapping.get(cap_label, '')
-        cursor.execute(
-            "INSERT INTO tables (caption_id, pdf_file_name, page_number, x0, y0, x1, y1) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-            (caption_id, pdf_file_name, page_number, x0, y0, x1, y1)
+    table_rows = [(caption_mapping[label], pdf_file_name, page_number, x0, y0, x1, y1)
+                  for label, pdf_file_name, page_number, x0, y0, x1, y1 in rows["tables"] if label in caption_mapping]
+    if table_rows:
+        cursor.executemany(
+            f"INSERT INTO tables (caption_id, pdf_file_name, page_number, x0, y0, x1, y1) VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})",
+            table_rows
         )
-    
+
     # 4. 클러스터 영역 매칭 정보 저장
-    for page_number, matching in page_caption_matching.items():
-        for cap_label, match_data in matching.items():
-            # match_data: (cluster_rect, p_cluster, p_cap, distance, pdf_file_name)
-            cluster_rect, p_cluster, p_cap, distance, pdf_file_name = match_data
-            caption_id = caption_mapping.get(cap_label)
-            if caption_id is None:
-                continue
-            x0, y0, x1, y1 = cluster_rect.x0, cluster_rect.y0, cluster_rect.x1, cluster_rect.y1
-            cursor.execute(
-                "INSERT INTO clusters (caption_id, page_number, pdf_file_name, x0, y0, x1, y1) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                (caption_id, page_number, pdf_file_name, x0, y0, x1, y1)
-            )
-    
+    cluster_rows = [(caption_mapping[label], page_number, pdf_file_name, x0, y0, x1, y1)
+                    for label, page_number, pdf_file_name, x0, y0, x1, y1 in rows["clusters"] if label in caption_mapping]
+    if cluster_rows:
+        cursor.executemany(
+            f"INSERT INTO clusters (caption_id, page_number, pdf_file_name, x0, y0, x1, y1) VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})",
+            cluster_rows
+        )
+    return pdf_id
+
+def save_to_sql(file_name, table_caption_regions, figure_caption_regions, drawn_table_regions, page_caption_matching):
+    """
+    추출한 캡션, 테이블 영역, 클러스터 매칭 정보를 MySQL 데이터베이스에 저장합니다.
+    - 문서 하나를 단독으로 저장할 때 사용합니다. 여러 문서를 저장할 때는 SQLSink를 사용.
+    """
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    insert_sql_rows(cursor, build_sql_rows(file_name, table_caption_regions, figure_caption_regions,
+                                           drawn_table_regions, page_caption_matching))
     conn.commit()
     cursor.close()
     conn.close()
 
+# SQLSink가 저장하지 못한 행을 기록하는 기본 파일 (CLI / watch.py는 <output-dir>/sql_spill.jsonl을 지정)
+DEFAULT_SPILL_PATH = "sql_spill.jsonl"
+
+class SQLSink:
+    """
+    여러 문서의 추출 결과를 모아서 저장하는 DB 저장소입니다.
+    - connect: DB-API 연결을 반환하는 함수. 기본값은 MySQL 커넥션 풀(DB_CONFIG)에서 연결을 가져옵니다.
+    - placeholder: SQL 파라미터 표기 ("%s": MySQL, "?": SQLite)
+    - commit_every: N개 문서마다 한 번 커밋 (close() 시 남은 문서도 커밋)
+    - spill_path: DB가 느려 대기열이 가득 차거나 저장에 실패하면, 해당 문서의 행들을 이 파일에
+      JSON Lines로 덧붙여 기록합니다. (기본값: 현재 디렉터리의 sql_spill.jsonl)
+      추출 작업은 DB 때문에 멈추지 않으며, 기록된 행은 replay_spill()로 나중에 다시 저장할 수 있습니다.
+    - submit()은 대기열에 넣기만 하고 바로 반환하며, 실제 저장은 백그라운드 스레드에서 수행합니다.
+    """
+    def __init__(self, connect=None, placeholder="%s", commit_every=1, spill_path=DEFAULT_SPILL_PATH, queue_size=64, pool_size=2):
+        self.pool = None
+        self.pool_size = pool_size
+        self.connect = connect or self._pool_connect
+        self.placeholder = placeholder
+        self.commit_every = max(1, commit_every)
+        self.spill_path = spill_path or DEFAULT_SPILL_PATH
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.spill_lock = threading.Lock()
+        self.saved = 0
+        self.spilled = 0
+        self.thread = threading.Thread(target=self._run, name="sql-sink", daemon=True)
+        self.thread.start()
+
+    def _pool_connect(self):
+        # 커넥션 풀은 첫 저장 시점에 생성 (DB 장애 시에도 생성자에서 멈추지 않도록)
+        if self.pool is None:
+            self.pool = mysql.connector.pooling.MySQLConnectionPool(
+                pool_name="pdf_parser", pool_size=self.pool_size, **DB_CONFIG)
+        return self.pool.get_connection()
+
+    @classmethod
+    def sqlite(cls, path, **kwargs):
+        """SQLite 파일(또는 ":memory:")을 대상으로 하는 SQLSink를 생성합니다. 스키마가 없으면 만듭니다."""
+        def connect():
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.executescript(SQLITE_SCHEMA)
+            return conn
+        return cls(connect=connect, placeholder="?", **kwargs)
+
+    def write(self, file_name, table_caption_regions, figure_caption_regions, drawn_table_regions, page_caption_matching):
+        """save_to_sql과 같은 인자를 받아 저장 대기열에 넣습니다."""
+        self.submit(build_sql_rows(file_name, table_caption_regions, figure_caption_regions,
+                                   drawn_table_regions, page_caption_matching))
+
+    def submit(self, rows):
+        """build_sql_rows() 결과를 대기열에 넣습니다. 대기열이 가득 차면 spill 파일에 기록합니다."""
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            self._spill([rows], "queue full")
+
+    def _spill(self, batch, reason):
+        # 행을 버리지 않도록 항상 spill 파일에 기록
+        print(f"SQL 저장 지연 ({reason}): 문서 {len(batch)}개를 {self.spill_path}에 기록합니다.")
+        spill_dir = os.path.dirname(self.spill_path)
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        with self.spill_lock:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for rows in batch:
+                    f.write(json.dumps(rows, ensure_ascii=False) + "\n")
+            self.spilled += len(batch)
+
+    def _run(self):
+        conn = None
+        pending = []  # 커밋되지 않은 문서들
+        while True:
+            rows = self.queue.get()
+            if rows is not None:
+                pending.append(rows)
+            try:
+                if pending and (rows is None or len(pending) >= self.commit_every):
+                    if conn is None:
+                        conn = self.connect()
+                    cursor = conn.cursor()
+                    for doc_rows in pending:
+                        insert_sql_rows(cursor, doc_rows, self.placeholder)
+                    conn.commit()
+                    cursor.close()
+                    self.saved += len(pending)
+                    pending = []
+            except Exception as e:
+                if conn is not None:
+                    try:
+                        conn.rollback()
+                        conn.close()
+                    except Exception:
+                        pass
+                    conn = None
+                self._spill(pending, f"{type(e).__name__}: {e}")
+                pending = []
+            if rows is None:
+                if conn is not None:
+                    conn.close()
+                return
+
+    def close(self):
+        """남은 대기열을 모두 저장(커밋)하고 백그라운드 스레드를 종료합니다."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def replay_spill(self, path=None):
+        """
+        spill 파일에 기록된 행들을 DB에 다시 저장합니다.
+        - 모두 저장되면 파일을 비우고, 저장한 문서 수를 반환합니다.
+        """
+        path = path or self.spill_path
+        if not path or not os.path.exists(path):
+            return 0
+        with self.spill_lock:
+            with open(path, encoding="utf-8") as f:
+                batch = [json.loads(line) for line in f if line.strip()]
+            conn = self.connect()
+            cursor = conn.cursor()
+            for rows in batch:
+                insert_sql_rows(cursor, rows, self.placeholder)
+            conn.commit()
+            cursor.close()
+            conn.close()
+            open(path, "w").close()
+        return len(batch)
+
+# ── 컬럼형 내보내기: DB 없이 분석용 파일로 저장 ──
+# 테이블마다 SQL 스키마(SQLITE_SCHEMA / README의 MySQL 스키마)와 같은 컬럼, 같은 순서의 데이터셋을 만듭니다.
+EXPORT_COLUMNS = {
+    "pdf_documents": [("pdf_id", "int64"), ("file_name", "string"), ("processed_date", "string")],
+    "captions": [("caption_id", "int64"), ("caption_name", "string"), ("pdf_id", "int64"), ("page_number", "int64"),
+                 ("caption_text", "string"), ("x0", "float64"), ("y0", "float64"), ("x1", "float64"), ("y1", "float64")],
+    "tables": [("table_region_id", "int64"), ("caption_id", "int64"), ("pdf_file_name", "string"), ("page_number", "int64"),
+               ("x0", "float64"), ("y0", "float64"), ("x1", "float64"), ("y1", "float64")],
+    "clusters": [("cluster_id", "int64"), ("caption_id", "int64"), ("page_number", "int64"), ("pdf_file_name", "string"),
+                 ("x0", "float64"), ("y0", "float64"), ("x1", "float64"), ("y1", "float64")],
+}
+
+class ColumnarSink:
+    """
+    여러 문서의 추출 결과를 실행(run) 단위로 나눈 컬럼형 파일에 덧붙여 저장합니다.
+    SQLSink와 같은 write / submit / close를 제공하므로 run_batch / Extractor의 sink로 쓸 수 있고, DB 연결이 필요 없습니다.
+    - root/<테이블>/run=<run_id>/part-NNNNN.parquet (pyarrow가 있을 때) 또는 part-NNNNN.csv.gz
+      테이블마다 하나의 데이터셋이며, run=<run_id> 디렉터리는 Hive 형식 파티션으로 읽힙니다.
+    - run_id: 실행 ID (기본값: 시작 시각(마이크로초까지)-프로세스 ID). 이미 있는 실행 ID를 주면 ValueError.
+      파티션 디렉터리는 생성자에서 exist_ok=False로 만들므로, 같은 ID로 동시에 시작한 두 실행 중 하나는 반드시 실패합니다.
+    - format: "auto"(pyarrow가 있으면 parquet, 없으면 csv) / "parquet" / "csv"
+    - commit_every: N개 문서마다 테이블별 파일(shard)을 하나씩 씁니다. (close() 시 남은 문서도 기록)
+    - pdf_id / caption_id 등 ID 컬럼은 실행 안에서 1부터 매기며, tables / clusters의 caption_id는
+      insert_sql_rows와 같이 캡션 라벨로 연결합니다. (같은 라벨이 여러 번 나오면 마지막 캡션, 캡션이 없는 행은 제외)
+    - CSV는 헤더 한 줄과 RFC 4180 인용 규칙(따옴표 안의 따옴표는 두 번)을 따르므로, 압축을 풀어 그대로 적재할 수 있습니다.
+        LOAD DATA LOCAL INFILE 'part-00000.csv' INTO TABLE captions
+          FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY '' LINES TERMINATED BY '\\n' IGNORE 1 LINES;
+      (ID는 실행 안에서만 유일하므로, 이미 행이 있는 DB에 적재할 때는 SET 절로 ID에 오프셋을 더합니다)
+    """
+    FORMATS = ("auto", "parquet", "csv")
+
+    def __init__(self, root, format="auto", run_id=None, commit_every=20):
+        if format not in self.FORMATS:
+            raise ValueError(f"unknown export format: {format}")
+        if format == "auto":
+            format = "parquet" if pa is not None else "csv"
+        if format == "parquet" and pa is None:
+            raise ValueError("parquet export requires pyarrow (pip install pyarrow)")
+        self.root = root
+        self.format = format
+        self.run_id = run_id or f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}"
+        created = []
+        try:
+            for table in EXPORT_COLUMNS:
+                os.makedirs(self.partition_dir(table), exist_ok=False)
+                created.append(self.partition_dir(table))
+        except FileExistsError:
+            for directory in created:
+                os.rmdir(directory)
+            raise ValueError(f"export run already exists: {self.run_id}")
+        self.commit_every = max(1, commit_every)
+        self.lock = threading.Lock()
+        self.next_ids = {table: 1 for table in EXPORT_COLUMNS}
+        self.columns = {table: [] for table in EXPORT_COLUMNS}  # 아직 기록하지 않은 행
+        self.pending = 0  # 아직 기록하지 않은 문서 수
+        self.shards = 0
+        self.saved = 0
+        self.written = []  # 기록한 파일 경로
+
+    def partition_dir(self, table):
+        return os.path.join(self.root, table, f"run={self.run_id}")
+
+    def write(self, file_name, table_caption_regions, figure_caption_regions, drawn_table_regions, page_caption_matching):
+        """save_to_sql과 같은 인자를 받아 내보내기 버퍼에 넣습니다."""
+        self.submit(build_sql_rows(file_name, table_caption_regions, figure_caption_regions,
+                                   drawn_table_regions, page_caption_matching))
+
+    def submit(self, rows):
+        """build_sql_rows() 결과(문서 하나)를 버퍼에 넣고, commit_every개가 모이면 파일로 기록합니다."""
+        with self.lock:
+            self._append(rows)
+            self.pending += 1
+            if self.pending >= self.commit_every:
+                self._flush()
+
+    def _take_id(self, table):
+        value = self.next_ids[table]
+        self.next_ids[table] += 1
+        return value
+
+    def _append(self, rows):
+        pdf_id = self._take_id("pdf_documents")
+        self.columns["pdf_documents"].append((pdf_id, rows["file_name"], datetime.now().isoformat(sep=" ", timespec="seconds")))
+        caption_mapping = {}
+        for label, page_number, text, x0, y0, x1, y1 in rows["captions"]:
+            caption_id = self._take_id("captions")
+            caption_mapping[label] = caption_id
+            self.columns["captions"].append((caption_id, label, pdf_id, page_number, text, x0, y0, x1, y1))
+        for label, pdf_file_name, page_number, x0, y0, x1, y1 in rows["tables"]:
+            if label in caption_mapping:
+                self.columns["tables"].append((self._take_id("tables"), caption_mapping[label], pdf_file_name,
+                                               page_number, x0, y0, x1, y1))
+        for label, page_number, pdf_file_name, x0, y0, x1, y1 in rows["clusters"]:
+            if label in caption_mapping:
+                self.columns["clusters"].append((self._take_id("clusters"), caption_mapping[label], page_number,
+                                                 pdf_file_name, x0, y0, x1, y1))
+
+    def _flush(self):
+        if not self.pending:
+            return
+        for table, rows in self.columns.items():
+            if not rows:
+                continue
+            path = os.path.join(self.partition_dir(table), f"part-{self.shards:05d}.{'parquet' if self.format == 'parquet' else 'csv.gz'}")
+            if self.format == "parquet":
+                self._write_parquet(path, table, rows)
+            else:
+                self._write_csv(path, table, rows)
+            self.written.append(path)
+        self.shards += 1
+        self.saved += self.pending
+        self.pending = 0
+        self.columns = {table: [] for table in EXPORT_COLUMNS}
+
+    @staticmethod
+    def _write_parquet(path, table, rows):
+        columns = EXPORT_COLUMNS[table]
+        schema = pa.schema([(name, getattr(pa, type_name)()) for name, type_name in columns])
+        arrays = {name: [row[i] for row in rows] for i, (name, _) in enumerate(columns)}
+        pq.write_table(pa.Table.from_pydict(arrays, schema=schema), path, compression="zstd")
+
+    @staticmethod
+    def _write_csv(path, table, rows):
+        with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow([name for name, _ in EXPORT_COLUMNS[table]])
+            writer.writerows(rows)
+
+    def close(self):
+        """남은 버퍼를 파일로 기록합니다."""
+        with self.lock:
+            self._flush()
+
+# ── 영역 PDF 출력기 ──
+class RegionWriter:
+    """
+    문서 하나에서 추출한 캡션/클러스터 영역들을 PDF로 출력합니다.
+    - mode="files": 영역마다 output/<문서명>/<라벨>_<해시>.pdf 파일을 생성합니다.
+      해시는 문서 키(doc_key), 페이지 번호, 영역 좌표로 정해지므로 같은 입력을 다시 처리하면 같은 파일명이 됩니다.
+      원본 페이지는 페이지당 한 번만 가져오고(insert_pdf), cropbox만 바꿔 가며 직렬화한 뒤
+      파일 쓰기는 스레드 풀에서 수행합니다. (MuPDF 호출은 모두 호출 스레드에서만 실행)
+    - mode="bundle": 문서당 하나의 다중 페이지 PDF(output/<문서명>/<문서명>_regions.pdf)에
+      영역마다 잘라낸 한 페이지씩을 담고, 페이지별 라벨/원본 페이지/좌표를 담은
+      인덱스(<문서명>_regions.json)를 함께 저장합니다.
+    - mode="memory": files 모드와 같은 이름으로 영역 PDF를 만들되, 디스크에 쓰지 않고
+      buffers({경로: PDF bytes})에 보관합니다. (Extractor에서 사용)
+    - add()는 즉시 결과 경로를 반환하고, 실제 출력은 flush() 또는 close()에서 한 번에 수행합니다.
+      (스트리밍 처리에서는 페이지마다 flush()하여 주석을 그리기 전에 해당 페이지의 영역을 출력)
+    - thumbnails: ThumbnailWriter 옵션 dict (예: {"formats": ["png"], "dpis": [150]}).
+      주어지면 같은 영역의 래스터 썸네일도 함께 출력합니다.
+    """
+    MODES = ("files", "bundle", "memory")
+    FILE_MODES = ("files", "bundle")  # 디스크에 기록하는 모드 (명령행 옵션)
+
+    def __init__(self, doc, document_name, mode="files", max_workers=4, doc_key=None, thumbnails=None):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown region output mode: {mode}")
+        self.doc = doc
+        self.document_name = document_name
+        self.mode = mode
+        self.max_workers = max_workers
+        self.base_folder = os.path.join("output", document_name)
+        self.doc_key = doc_key or document_name
+        self.jobs = []  # (결과 경로, 라벨, 페이지 번호, 클립 사각형)
+        self.written = []  # 실제로 기록된 파일 경로
+        self.count = 0  # 지금까지 추가된 영역 수 (번들 페이지 번호)
+        self._bundle = None
+        self._index = []
+        self.buffers = {}  # memory 모드: 경로 -> PDF bytes
+        if mode in self.FILE_MODES:
+            os.makedirs(self.base_folder, exist_ok=True)
+        self.thumbnails = None
+        if thumbnails:
+            self.thumbnails = ThumbnailWriter(doc, document_name, doc_key=doc_key, max_workers=max_workers,
+                                              mode="memory" if mode == "memory" else "files", buffers=self.buffers,
+                                              **thumbnails)
+
+    @property
+    def bundle_path(self):
+        return os.path.join(self.base_folder, f"{self.document_name}_regions.pdf")
+
+    @property
+    def index_path(self):
+        return os.path.join(self.base_folder, f"{self.document_name}_regions.json")
+
+    def add(self, label, page_number, clip_rect):
+        """영역을 출력 대상에 추가하고, 해당 영역이 저장될 경로를 반환합니다."""
+        self.count += 1
+        if self.mode == "bundle":
+            filepath = f"{self.bundle_path}#page={self.count}"
+        else:
+            region_key = f"{self.doc_key}:{page_number}:{clip_rect.x0:.3f},{clip_rect.y0:.3f},{clip_rect.x1:.3f},{clip_rect.y1:.3f}"
+            digest = hashlib.sha1(region_key.encode("utf-8")).hexdigest()[:12]
+            filepath = os.path.join(self.base_folder, f"{label}_{digest}.pdf")
+        self.jobs.append((filepath, label, page_number, clip_rect))
+        if self.thumbnails is not None:
+            self.thumbnails.add(label, page_number, clip_rect)
+        return filepath
+
+    def flush(self):
+        """지금까지 추가된 영역을 출력합니다. 번들 모드에서는 번들 문서에 페이지를 추가만 하고 저장은 close()에서 수행합니다."""
+        if self.thumbnails is not None:
+            self.written.extend(self.thumbnails.flush())
+        if not self.jobs:
+            return
+        if self.mode == "bundle":
+            self._append_bundle()
+        else:
+            self._write_files()
+            if self.mode == "files":
+                self.written.extend(dict.fromkeys(job[0] for job in self.jobs))
+        self.jobs = []
+
+    def close(self):
+        """추가된 모든 영역을 출력합니다."""
+        self.flush()
+        if self._bundle is not None:
+            self._save_bundle()
+            self.written.extend([self.bundle_path, self.index_path])
+
+    @staticmethod
+    def _write_bytes(filepath, data):
+        with open(filepath, "wb") as f:
+            f.write(data)
+
+    def _write_files(self):
+        jobs_by_page = {}
+        for job in self.jobs:
+            jobs_by_page.setdefault(job[2], []).append(job)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = []
+            for page_number, jobs in jobs_by_page.items():
+                page_doc = fitz.open()
+                page_doc.insert_pdf(self.doc, from_page=page_number, to_page=page_number)
+                page = page_doc[0]
+                for filepath, _, _, clip_rect in jobs:
+                    page.set_cropbox(clip_rect)  # 원하는 영역만 추출
+                    if self.mode == "memory":
+                        self.buffers[filepath] = page_doc.tobytes()
+                    else:
+                        futures.append(pool.submit(self._write_bytes, filepath, page_doc.tobytes()))
+                page_doc.close()
+            for future in futures:
+                future.result()
+
+    def _append_bundle(self):
+        if self._bundle is None:
+            self._bundle = fitz.open()
+        for filepath, label, page_number, clip_rect in self.jobs:
+            self._bundle.insert_pdf(self.doc, from_page=page_number, to_page=page_number)
+            self._bundle[-1].set_cropbox(clip_rect)
+            self._index.append({
+                "page": len(self._index) + 1,
+                "label": label,
+                "source_page": page_number,
+                "rect": [clip_rect.x0, clip_rect.y0, clip_rect.x1, clip_rect.y1],
+            })
+
+    def _save_bundle(self):
+        # 같은 원본 페이지를 여러 번 삽입하므로 중복 객체(폰트, 이미지 등)를 병합하여 저장
+        self._bundle.save(self.bundle_path, garbage=4, deflate=True)
+        self._bundle.close()
+        self._bundle = None
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            json.dump({"document": self.document_name, "regions": self._index}, f, ensure_ascii=False, indent=2)
+
+# ── 영역 썸네일(래스터) 출력기 ──
+class PageRenderCache:
+    """
+    페이지 래스터(픽셀 배열)를 (페이지 번호, DPI)별로 보관하는 LRU 캐시입니다.
+    - 보관 중인 배열 크기의 합이 max_bytes를 넘으면 가장 오래 사용하지 않은 항목부터 버립니다.
+      (방금 렌더링한 항목은 max_bytes보다 커도 유지)
+    - 배열은 (높이, 너비, 채널) uint8이며, 렌더링(MuPDF 호출)은 호출 스레드에서만 수행합니다.
+    """
+    def __init__(self, doc, max_bytes=256 * 1024 * 1024):
+        self.doc = doc
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # (페이지 번호, DPI) -> 픽셀 배열
+        self.size = 0
+        self.renders = 0  # 실제 렌더링 횟수
+
+    def get(self, page_number, dpi):
+        key = (page_number, dpi)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        pix = self.doc[page_number].get_pixmap(dpi=dpi, alpha=False)
+        pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        self.renders += 1
+        self.entries[key] = pixels
+        self.size += pixels.nbytes
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.nbytes
+        return pixels
+
+def _png_chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+def encode_png(pixels):
+    """
+    (높이, 너비, 채널) uint8 배열을 PNG bytes로 인코딩합니다.
+    - MuPDF를 거치지 않고 zlib만 사용하므로 스레드 풀에서 병렬로 호출할 수 있습니다. (zlib은 GIL을 놓음)
+    """
+    height, width, channels = pixels.shape
+    color_type = {1: 0, 3: 2, 4: 6}[channels]  # 회색조 / RGB / RGBA
+    rows = np.empty((height, width * channels + 1), dtype=np.uint8)
+    rows[:, 0] = 0  # 행마다 필터 없음
+    rows[:, 1:] = pixels.reshape(height, width * channels)
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header)
+            + _png_chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)) + _png_chunk(b"IEND", b""))
+
+def encode_webp(pixels, quality=80):
+    """(높이, 너비, 채널) uint8 배열을 WebP bytes로 인코딩합니다. (Pillow 필요)"""
+    buffer = io.BytesIO()
+    Image.fromarray(pixels[:, :, 0] if pixels.shape[2] == 1 else pixels).save(buffer, format="WEBP", quality=quality)
+    return buffer.getvalue()
+
+class ThumbnailWriter:
+    """
+    영역 PDF와 같은 영역을 PNG / WebP 썸네일로 출력합니다. (RegionWriter의 thumbnails 옵션으로 사용)
+    - 원본 페이지는 DPI마다 한 번만 렌더링하고(PageRenderCache), 모든 영역을 그 픽셀 배열에서 잘라냅니다.
+    - 인코딩과 파일 쓰기는 스레드 풀에서 수행합니다. (MuPDF 호출은 호출 스레드에서만 실행)
+    - 파일: output/<문서명>/thumbs/<라벨>_<해시>_<DPI>dpi.<형식>
+      해시는 RegionWriter files 모드와 같이 문서 키, 페이지 번호, 영역 좌표로 정해집니다.
+    - formats: ("png", "webp") 중 일부. webp는 Pillow가 있어야 합니다.
+    - dpis: 렌더링 해상도 목록, cache_mb: 페이지 래스터 캐시 크기(MB)
+    - mode="memory"이면 디스크에 쓰지 않고 buffers({경로: 이미지 bytes})에 보관합니다.
+      (RegionWriter는 자신의 buffers를 넘겨 영역 PDF와 같은 dict에 모읍니다)
+    """
+    FORMATS = ("png", "webp")
+
+    def __init__(self, doc, document_name, doc_key=None, formats=("png",), dpis=(150,), cache_mb=256,
+                 max_workers=4, mode="files", buffers=None):
+        formats = tuple(formats)
+        for fmt in formats:
+            if fmt not in self.FORMATS:
+                raise ValueError(f"unknown thumbnail format: {fmt}")
+        if "webp" in formats and Image is None:
+            raise ValueError("webp thumbnails require Pillow (pip install pillow)")
+        self.doc = doc
+        self.formats = formats
+        self.dpis = tuple(int(dpi) for dpi in dpis)
+        self.mode = mode
+        self.max_workers = max_workers
+        self.folder = os.path.join("output", document_name, "thumbs")
+        self.doc_key = doc_key or document_name
+        self.cache = PageRenderCache(doc, max_bytes=int(cache_mb * 1024 * 1024))
+        self.jobs = []  # (파일 경로 앞부분, 페이지 번호, 클립 사각형)
+        self.buffers = buffers if buffers is not None else {}
+        if mode != "memory":
+            os.makedirs(self.folder, exist_ok=True)
+
+    def add(self, label, page_number, clip_rect):
+        region_key = f"{self.doc_key}:{page_number}:{clip_rect.x0:.3f},{clip_rect.y0:.3f},{clip_rect.x1:.3f},{clip_rect.y1:.3f}"
+        digest = hashlib.sha1(region_key.encode("utf-8")).hexdigest()[:12]
+        self.jobs.append((os.path.join(self.folder, f"{label}_{digest}"), page_number, clip_rect))
+
+    def _crop(self, pixels, page_number, clip_rect, dpi):
+        """페이지 좌표의 clip_rect에 해당하는 픽셀 영역 (페이지 회전 반영, 페이지 밖은 잘라냄)."""
+        page = self.doc[page_number]
+        rect = (clip_rect * page.rotation_matrix) * fitz.Matrix(dpi / 72, dpi / 72)
+        height, width = pixels.shape[:2]
+        x0, y0 = max(int(math.floor(rect.x0)), 0), max(int(math.floor(rect.y0)), 0)
+        x1, y1 = min(int(math.ceil(rect.x1)), width), min(int(math.ceil(rect.y1)), height)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return np.ascontiguousarray(pixels[y0:y1, x0:x1])
+
+    def _encode(self, path, fmt, crop):
+        data = encode_png(crop) if fmt == "png" else encode_webp(crop)
+        if self.mode == "memory":
+            self.buffers[path] = data
+        else:
+            with open(path, "wb") as f:
+                f.write(data)
+        return path
+
+    def flush(self):
+        """
+        추가된 영역의 썸네일을 출력하고, 디스크에 기록한 파일 경로 리스트를 반환합니다.
+        - 페이지 순으로 렌더링하므로 캐시에는 최근 페이지만 남습니다.
+        """
+        if not self.jobs:
+            return []
+        jobs_by_page = {}
+        for job in self.jobs:
+            jobs_by_page.setdefault(job[1], []).append(job)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = []
+            for page_number in sorted(jobs_by_page):
+                for dpi in self.dpis:
+                    pixels = self.cache.get(page_number, dpi)
+                    for stem, _, clip_rect in jobs_by_page[page_number]:
+                        crop = self._crop(pixels, page_number, clip_rect, dpi)
+                        if crop is None:
+                            continue
+                        for fmt in self.formats:
+                            futures.append(pool.submit(self._encode, f"{stem}_{dpi}dpi.{fmt}", fmt, crop))
+            written = [future.result() for future in futures]
+        self.jobs = []
+        return written if self.mode != "memory" else []
+
 # ── 캡션(테이블 영역) PDF 저장 함수 ──
-def save_regions_as_pdf(doc, regions, document_name, drawn_table_regions):
+def save_regions_as_pdf(doc, regions, document_name, drawn_table_regions, writer=None):
     """
     추출한 캡션 영역을 기반으로 별도의 PDF 파일로 저장합니다.
-    - regions: (캡션 사각형, 캡션 라벨, 캡션 텍스트, 페이지 번호)
-    - drawn_table_regions: 동일 페이지 및 캡션 라벨에 해당하는 테이블 영역 정보를 찾아 클립 영역 결정.
-    - 저장 후 생성된 PDF 파일 경로를 regions 튜플에 추가하여 반환.
+    - regions: CaptionRecord 목록 (RegionStore)
+    - drawn_table_regions: 동일 페이지 및 캡션 라벨에 해당하는 테이블 영역 정보를 찾아 클립 영역 결정. (RegionStore)
+    - writer: 문서 단위로 공유하는 RegionWriter. 없으면 파일 모드로 만들어 바로 출력합니다.
+    - 저장 후 생성된 PDF 파일 경로를 각 레코드의 region_path에 기록하고 regions를 그대로 반환.
     """
-    base_folder = os.path.join("output", document_name)
-    os.makedirs(base_folder, exist_ok=True)
-    updated_regions = []
+    own_writer = writer is None
+    if own_writer:
+        writer = RegionWriter(doc, document_name)
     for region in regions:
-        cap_rect, cap_label, cap_text, page_number = region
         # 동일 페이지와 캡션 라벨에 해당하는 테이블 영역 찾기
         table_region = None
-        for entry in drawn_table_regions:
-            pn, table_rect, table_cap_label = entry
-            if pn == page_number and table_cap_label == cap_label:
-                table_region = table_rect
+        for table in drawn_table_regions.page(region.page):
+            if table.label == region.label:
+                table_region = table.rect
                 break
         # 테이블 영역이 있다면 해당 영역으로 클립, 없으면 캡션 영역 사용
-        clip_rect = table_region if table_region is not None else cap_rect
-        timestamp = time.time_ns()
-        filename = f"{cap_label}_{timestamp}.pdf"
-        filepath = os.path.join(base_folder, filename)
-        new_doc = fitz.open()  # 새 PDF 생성
-        new_doc.insert_pdf(doc, from_page=page_number, to_page=page_number)
-        new_page = new_doc[0]
-        new_page.set_cropbox(clip_rect)  # 원하는 영역만 추출
-        new_doc.save(filepath)
-        new_doc.close()
-        updated_regions.append((cap_rect, cap_label, cap_text, page_number, filepath))
-    return updated_regions
+        clip_rect = table_region if table_region is not None else region.rect
+        region.region_path = writer.add(region.label, region.page, clip_rect)
+    if own_writer:
+        writer.close()
+    return regions
 
 # ── 클러스터 영역 PDF 저장 함수 ──
-def save_cluster_regions_as_pdf(doc, page_caption_matching, document_name):
+def save_cluster_regions_as_pdf(doc, page_caption_matching, document_name, writer=None):
     """
     캡션과 매칭된 클러스터 영역을 개별 PDF 파일로 저장합니다.
-    - page_caption_matching: {페이지 번호: {캡션 라벨: (클러스터 사각형, p_cluster, p_cap, 거리)}}
-    - 저장 후 각 매칭 튜플에 pdf_file_name을 추가하여 반환.
-    """
-    base_folder = os.path.join("output", document_name)
-    os.makedirs(base_folder, exist_ok=True)
-    updated_page_caption_matching = {}
-    for page_number, captions in page_caption_matching.items():
-        updated_captions = {}
-        for cap_label, match_data in captions.items():
-            cluster_rect, p_cluster, p_cap, distance = match_data
-            timestamp = time.time_ns()
-            filename = f"{cap_label}_{timestamp}.pdf"
-            filepath = os.path.join(base_folder, filename)
-            new_doc = fitz.open()
-            new_doc.insert_pdf(doc, from_page=page_number, to_page=page_number)
-            new_page = new_doc[0]
-            new_page.set_cropbox(cluster_rect)
-            new_doc.save(filepath)
-            new_doc.close()
-            updated_captions[cap_label] = (cluster_rect, p_cluster, p_cap, distance, filepath)
-        updated_page_caption_matching[page_number] = updated_captions
-    return updated_page_caption_matching
-
-def process_pdf(input_path, output_path):
+    - page_caption_matching: {페이지 번호: {캡션 라벨: MatchRecord}}
+    - writer: 문서 단위로 공유하는 RegionWriter. 없으면 파일 모드로 만들어 바로 출력합니다.
+    - 저장 후 생성된 PDF 파일 경로를 각 MatchRecord의 region_path에 기록하고 page_caption_matching을 그대로 반환.
     """
-    전체 PDF 처리 파이프라인:
-      1. PDF 파일 열기 및 텍스트, 이미지, 드로잉 요소 추출
-      2. 캡션(테이블, 피규어) 검출 및 영역 추출
-      3. 텍스트 블록을 기반으로 페이지 내 컬럼(열) 검출
-      4. 캡션과 관련된 가로선(라인) 분석을 통해 테이블 영역 결정
-      5. 이미지 및 드로잉 요소를 클러스터링하여 비텍스트 영역 검출
-      6. 클러스터 영역 내 캡션 재탐지 및 텍스트 보강 클러스터링
-      7. 캡션과 클러스터 영역을 DFS 기반 매칭 알고리즘을 통해 1:1 매칭 수행
-      8. 매칭되지 않은 클러스터 영역에 대해 후처리(병합) 수행
-      9. 캡션/클러스터 영역을 개별 PDF로 저장하고, 최종 결과를 PDF에 시각화
-      10. 최종 정보를 SQL 데이터베이스에 저장
+    own_writer = writer is None
+    if own_writer:
+        writer = RegionWriter(doc, document_name)
+    for page_number, page_matches in page_caption_matching.items():
+        for cap_label, match in page_matches.items():
+            match.region_path = writer.add(cap_label, page_number, match.rect)
+    if own_writer:
+        writer.close()
+    return page_caption_matching
+
+# ── 프로파일링: 단계별/페이지별 소요 시간 측정 ──
+class StageProfiler:
     """
-    doc = fitz.open(input_path)
-    global_main_blocks = []  # (페이지 번호, 사각형, 텍스트)
-    table_caption_regions = []  # (캡션 사각형, 라벨, 캡션 텍스트, 페이지 번호)
-    figure_caption_regions = []  # (캡션 사각형, 라벨, 캡션 텍스트, 페이지 번호)
-    drawn_table_regions = []  # (페이지 번호, 테이블 영역 사각형, 캡션 라벨)
-    drawn_rectangles = []     # (페이지 번호, 사각형) - 이미 처리된 영역 저장
+    process_pdf 한 번의 실행에 대해 단계별 wall/CPU 시간, 페이지별 시간, 주요 객체 수, 최대 메모리를 기록합니다.
+    - stage(name, page): 해당 구간의 시간을 측정하는 컨텍스트 매니저.
+      page가 주어지면 단계 합계와 함께 해당 페이지의 단계별 시간에도 더합니다.
+    - count(name, n, page): 객체 수 (blocks, drawings, images, clusters, captions, candidate_pairs 등)
+    - records(): JSON Lines로 기록할 레코드 리스트. 페이지마다 {"type": "page"} 레코드와
+      문서 전체 요약 {"type": "document"} 레코드 하나로 구성됩니다.
+    - 드로잉/이미지 영역은 처음 조회하는 단계(2~3, 6)의 시간에 포함됩니다.
+    """
+    enabled = True
 
-    # 캡션과 클러스터 매칭 정보를 저장할 딕셔너리
-    page_caption_matching = {}
-    # 페이지 내 전체 컬럼 영역: 추후 이미지/드로잉 요소의 제외 범위 결정에 사용
-    entire_col_rect = fitz.Rect()
+    def __init__(self, document):
+        self.document = document
+        self.stages = {}  # 단계 이름 -> [wall, cpu]
+        self.pages = {}  # 페이지 번호 -> {"stages": {단계 이름: wall}, "counts": {이름: 개수}}
+        self.counts = {}
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
 
-    # ── 그리기 작업(pending drawing instructions) 저장 리스트 ──
-    pending_rect_draws = []          # (페이지 번호, 사각형, 색상, 선 두께)
-    pending_main_text_rect_draws = []  # (페이지 번호, 사각형, 색상, 선 두께)
-    pending_text_inserts = []        # (페이지 번호, 텍스트, 위치, 색상, 폰트 크기)
-    pending_line_draws = []          # (페이지 번호, 시작점, 종료점, 색상, 선 두께)
+    def _page(self, page_number):
+        if page_number not in self.pages:
+            self.pages[page_number] = {"stages": {}, "counts": {}}
+        return self.pages[page_number]
 
-    # 캡션 판별용 정규 표현식: 피규어와 테이블
-    fig_pattern = re.compile(r'(?i)^(fig(?:ure)?\.?|첨부자료|첨부파일)(\d+(?:\.\d+)?)(?P<special>.)')
-    table_pattern = re.compile(r'(?i)^(table|테이블)(\d+(?:\.\d+)?)(?P<special>.)')
+    @contextlib.contextmanager
+    def stage(self, name, page=None):
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+            totals = self.stages.setdefault(name, [0.0, 0.0])
+            totals[0] += wall
+            totals[1] += cpu
+            if page is not None:
+                page_stages = self._page(page)["stages"]
+                page_stages[name] = page_stages.get(name, 0.0) + wall
 
-    # ── 1. 텍스트 블록 처리: 각 페이지별 텍스트 블록 추출 및 캡션 검출 ──
-    for page in doc:
-        text_blocks = page.get_text("blocks")
-        for block in text_blocks:
-            text = block[4].strip()
-            if not text:
-                continue
-            text_no_space = re.sub(r'\s+', '', text)
-            match_fig = fig_pattern.match(text_no_space)
-            match_table = table_pattern.match(text_no_space)
-            if match_fig:
-                # 피규어 캡션 검출: 특수문자가 포함된 경우에만 캡션으로 판단
-                special_char = match_fig.group("special")
-                if special_char.isalnum() or special_char.isspace():
-                    continue
-                cap_rect = fitz.Rect(block[:4])
-                if cap_rect.get_area() <= 0:
-                    continue
-                fig_label = f"Figure {match_fig.group(2)}"
-                pending_rect_draws.append((page.number, cap_rect, (1, 0, 0), 2))
-                pending_text_inserts.append((page.number, fig_label, (cap_rect.x0, cap_rect.y0), (0, 0, 0), 12))
-                drawn_rectangles.append((page.number, cap_rect))
-                figure_caption_regions.append((cap_rect, fig_label, text, page.number))
-            elif match_table:
-                # 테이블 캡션 검출: 피규어와 동일한 로직 사용
-                special_char = match_table.group("special")
-                if special_char.isalnum() or special_char.isspace():
-                    continue
-                cap_rect = fitz.Rect(block[:4])
-                if cap_rect.get_area() <= 0:
-                    continue
-                table_label = f"Table {match_table.group(2)}"
-                pending_rect_draws.append((page.number, cap_rect, (1, 0, 0), 2))
-                pending_text_inserts.append((page.number, table_label, (cap_rect.x0, cap_rect.y0), (0, 0, 0), 12))
-                table_caption_regions.append((cap_rect, table_label, text, page.number))
-                drawn_rectangles.append((page.number, cap_rect))
-            else:
-                block_rect = fitz.Rect(block[:4])
-                global_main_blocks.append((page.number, block_rect, text))
-    
+    def count(self, name, n, page=None):
+        self.counts[name] = self.counts.get(name, 0) + n
+        if page is not None:
+            page_counts = self._page(page)["counts"]
+            page_counts[name] = page_counts.get(name, 0) + n
+
+    def count_page(self, state, page):
+        """9~10단계가 끝난 페이지의 주요 객체 수를 기록합니다."""
+        clusters = len(state.merged_clusters_by_page.get(page.number, []))
+        figure_captions = len(state.figure_caption_regions.page(page.number))
+        table_captions = len(state.table_caption_regions.page(page.number))
+        self.count("blocks", len(page.blocks), page.number)
+        self.count("drawings", len(page.drawings), page.number)
+        self.count("images", len(page.image_rects), page.number)
+        self.count("clusters", clusters, page.number)
+        self.count("captions", figure_captions + table_captions, page.number)
+        # 9단계에서 거리를 계산하는 (클러스터, 피규어 캡션) 쌍의 수
+        self.count("candidate_pairs", clusters * figure_captions, page.number)
+
+    @staticmethod
+    def peak_rss_kb():
+        """현재 프로세스의 최대 RSS(KB). resource 모듈이 없는 플랫폼에서는 None."""
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak
+
+    def records(self):
+        """페이지 레코드들과 문서 요약 레코드를 반환합니다."""
+        records = []
+        for page_number in sorted(self.pages):
+            page = self.pages[page_number]
+            records.append({
+                "type": "page",
+                "document": self.document,
+                "page": page_number,
+                "wall": round(sum(page["stages"].values()), 6),
+                "stages": {name: round(wall, 6) for name, wall in page["stages"].items()},
+                "counts": page["counts"],
+            })
+        records.append({
+            "type": "document",
+            "document": self.document,
+            "pages": len(self.pages),
+            "wall": round(time.perf_counter() - self.started, 6),
+            "cpu": round(time.process_time() - self.started_cpu, 6),
+            "stages": {name: {"wall": round(wall, 6), "cpu": round(cpu, 6)} for name, (wall, cpu) in self.stages.items()},
+            "counts": self.counts,
+            "peak_rss_kb": self.peak_rss_kb(),
+        })
+        return records
+
+    def write(self, path):
+        """레코드를 JSON Lines 파일에 덧붙여 기록합니다."""
+        write_profile_records(path, self.records())
+
+class _NullProfiler:
+    """프로파일링을 사용하지 않을 때의 대체 객체. 모든 측정을 무시합니다."""
+    enabled = False
+
+    def stage(self, name, page=None):
+        return contextlib.nullcontext()
+
+    def count(self, name, n, page=None):
+        pass
+
+    def count_page(self, state, page):
+        pass
+
+NULL_PROFILER = _NullProfiler()
+
+def write_profile_records(path, records):
+    with open(path, "a", encoding="utf-8") as f:
+        for entry in records:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+# ── 파이프라인 단계: 페이지 단위 처리 ──
+class PipelineState:
+    """
+    파이프라인 단계들이 주고받는 중간 결과를 보관합니다.
+    - 일괄 처리(process_pdf)에서는 문서 전체에 대해 하나를 사용하고,
+      스트리밍 처리(iter_pdf_pages)에서는 페이지마다 새로 만들어 처리 후 버립니다.
+    - 샤드 처리(process_pdf_sharded)에서는 워커가 페이지별 state를 merge로 합쳐 돌려주고, 코디네이터가 다시 합칩니다.
+    - entire_col_rect: 문서 전체의 본문 컬럼 영역. 5단계(select_text_columns)에서 정해지며
+      6, 8단계에서 드로잉/텍스트 요소의 제외 범위를 결정하는 데 사용합니다.
+    """
+    def __init__(self, entire_col_rect=None):
+        self.global_main_blocks = []  # (페이지 번호, 사각형, 텍스트)
+        self.table_caption_regions = RegionStore()  # CaptionRecord (kind="table")
+        self.figure_caption_regions = RegionStore()  # CaptionRecord (kind="figure")
+        self.drawn_table_regions = RegionStore()  # TableRecord - 테이블 영역 사각형과 캡션 라벨
+        self.drawn_rectangles = PageRectIndex()  # (페이지 번호, 사각형) - 이미 처리된 영역 저장 (페이지별 공간 인덱스)
+        # 캡션과 클러스터 매칭 정보: {페이지 번호: {캡션 라벨: MatchRecord}}
+        self.page_caption_matching = {}
+        # 페이지 내 전체 컬럼 영역: 추후 이미지/드로잉 요소의 제외 범위 결정에 사용
+        self.entire_col_rect = entire_col_rect if entire_col_rect is not None else fitz.Rect()
+        self.merged_clusters_by_page = {}  # {페이지 번호: [클러스터 사각형]}
+        self.conflict_indexes = None  # {페이지 번호: ConflictIndex} - 10단계 직전에 build_conflict_indexes로 생성
+        self.skipped_pages = []  # 페이지 가지치기로 6~10단계를 건너뛴 페이지 번호
+
+        # ── 그리기 작업(pending drawing instructions) 저장 리스트 ──
+        self.pending_rect_draws = []          # (페이지 번호, 사각형, 색상, 선 두께)
+        self.pending_main_text_rect_draws = []  # (페이지 번호, 사각형, 색상, 선 두께)
+        self.pending_text_inserts = []        # (페이지 번호, 텍스트, 위치, 색상, 폰트 크기)
+        self.pending_line_draws = []          # (페이지 번호, 시작점, 종료점, 색상, 선 두께)
+
+    def merge(self, other):
+        """
+        다른 페이지 범위를 처리한 state(샤드 결과)의 1~10단계 결과를 뒤에 이어 붙입니다.
+        - 11단계 이후에 쓰는 결과(캡션, 테이블 영역, 클러스터, 매칭, 그리기 작업)만 합칩니다.
+          (global_main_blocks, drawn_rectangles, conflict_indexes는 10단계까지만 쓰므로 합치지 않음)
+        """
+        self.table_caption_regions.extend(other.table_caption_regions)
+        self.figure_caption_regions.extend(other.figure_caption_regions)
+        self.drawn_table_regions.extend(other.drawn_table_regions)
+        self.page_caption_matching.update(other.page_caption_matching)
+        self.merged_clusters_by_page.update(other.merged_clusters_by_page)
+        self.skipped_pages.extend(other.skipped_pages)
+        self.pending_rect_draws.extend(other.pending_rect_draws)
+        self.pending_main_text_rect_draws.extend(other.pending_main_text_rect_draws)
+        self.pending_text_inserts.extend(other.pending_text_inserts)
+        self.pending_line_draws.extend(other.pending_line_draws)
+
+    def mark_main_text(self, page_num, rect, color):
+        """5단계에서 선택된 본문 컬럼 블록을 시각화 대상 및 처리된 영역으로 등록합니다."""
+        self.pending_main_text_rect_draws.append((page_num, rect, color, 1))
+        self.drawn_rectangles.append((page_num, rect))
+
+def group_by_page(entries):
+    """(페이지 번호, ...) 형태의 항목들을 순서를 유지한 채 페이지별 리스트로 묶습니다."""
+    by_page = {}
+    for entry in entries:
+        by_page.setdefault(entry[0], []).append(entry)
+    return by_page
+
+def group_by_x_span(items, tolerance, rect_of=None):
+    """
+    (x0, x1)이 그룹 대표(그룹에 처음 들어온 항목)와 각각 tolerance 이내인 항목끼리 입력 순서대로 묶습니다.
+    - 조건을 만족하는 대표가 여럿이면 먼저 만들어진 그룹에 넣으므로, 대표를 앞에서부터 하나씩 비교하던 방식과 같은 그룹을 만듭니다.
+    - 대표를 (x0, x1) 격자(칸 크기 tolerance)에 색인하여 이웃 9칸의 대표만 비교하므로 O(항목 수)입니다.
+    - rect_of: 항목에서 사각형을 꺼내는 함수 (기본값: 항목 자체가 사각형)
+    """
+    cell = tolerance or 1.0
+    leaders = {}  # (x0 칸, x1 칸) -> [(그룹 번호, 대표 x0, 대표 x1)]
+    groups = []
+    for item in items:
+        rect = rect_of(item) if rect_of is not None else item
+        cx0, cx1 = math.floor(rect.x0 / cell), math.floor(rect.x1 / cell)
+        best = None
+        for i in (cx0 - 1, cx0, cx0 + 1):
+            for j in (cx1 - 1, cx1, cx1 + 1):
+                for idx, lx0, lx1 in leaders.get((i, j), ()):
+                    if (best is None or idx < best) and abs(rect.x0 - lx0) <= tolerance and abs(rect.x1 - lx1) <= tolerance:
+                        best = idx
+        if best is None:
+            best = len(groups)
+            leaders.setdefault((cx0, cx1), []).append((best, rect.x0, rect.x1))
+            groups.append([])
+        groups[best].append(item)
+    return groups
+
+def detect_columns(entries, tolerance=GROUP_TOLERANCE):
+    """
+    본문 블록 (페이지 번호, 사각형, 텍스트)들에서 컬럼을 차례로 찾아 반환합니다. (2단계, 5단계 공용)
+    - 매 라운드마다 (x0, x1)이 tolerance 이내인 블록끼리 그룹으로 묶고(group_by_x_span),
+      면적 합이 가장 큰 그룹을 컬럼으로 고른 뒤, 그 x 범위와 겹치는 블록을 제외하고 반복합니다.
+    - 라운드당 O(블록 수)입니다.
+    - 반환값: 찾은 순서대로의 컬럼(블록 리스트) 리스트
+    """
+    columns = []
+    remaining = list(entries)
+    while remaining:
+        groups = group_by_x_span(remaining, tolerance, rect_of=lambda entry: entry[1])
+        dominant = max(groups, key=lambda g: sum(entry[1].get_area() for entry in g))
+        columns.append(dominant)
+        dom_x0 = min(entry[1].x0 for entry in dominant)
+        dom_x1 = max(entry[1].x1 for entry in dominant)
+        remaining = [entry for entry in remaining if not (entry[1].x1 > dom_x0 and entry[1].x0 < dom_x1)]
+    return columns
+
+class HorizontalRuleIndex:
+    """
+    한 페이지의 가로선(높이 < 2, 너비 > 20인 드로잉)을 3단계 테이블 영역 검출용으로 색인합니다.
+    - 중심 x, x0 기준으로 한 번씩 정렬해 두고 범위 질의는 bisect로 찾습니다.
+    - 질의 결과는 항상 원래 가로선 순서로 반환하므로 선형 탐색과 같은 결과가 나옵니다.
+      (경계값의 부동소수점 오차를 피하기 위해 bisect 범위를 조금 넓힌 뒤 원래 조건으로 다시 거릅니다)
+    """
+    EPS = 1e-6
+
+    def __init__(self, drawings):
+        self.rules = [r for r in drawings if (r.y1 - r.y0) < 2 and (r.x1 - r.x0) > 20]
+        centers = [((r.x0 + r.x1) / 2, i) for i, r in enumerate(self.rules)]
+        centers.sort()
+        self._center_x = [cx for cx, _ in centers]
+        self._by_center_x = [i for _, i in centers]
+        starts = sorted((r.x0, i) for i, r in enumerate(self.rules))
+        self._x0 = [x0 for x0, _ in starts]
+        self._by_x0 = [i for _, i in starts]
+
+    def __len__(self):
+        return len(self.rules)
+
+    def near_center_x(self, center_x, tol):
+        """중심 x가 center_x와 tol 이내인 가로선."""
+        lo = bisect.bisect_left(self._center_x, center_x - tol - self.EPS)
+        hi = bisect.bisect_right(self._center_x, center_x + tol + self.EPS)
+        found = []
+        for i in sorted(self._by_center_x[lo:hi]):
+            line = self.rules[i]
+            if abs((line.x0 + line.x1) / 2 - center_x) <= tol:
+                found.append(line)
+        return found
+
+    def overlapping_x(self, x_min, x_max):
+        """line.x0 <= x_max 이고 line.x1 >= x_min 인 가로선. 좌표가 같은 선분은 처음 것만 남깁니다."""
+        hi = bisect.bisect_right(self._x0, x_max)
+        found = []
+        seen = set()
+        for i in sorted(self._by_x0[:hi]):
+            line = self.rules[i]
+            key = tuple(line)
+            if line.x0 <= x_max and line.x1 >= x_min and key not in seen:
+                seen.add(key)
+                found.append(line)
+        return found
+
+def _line_center_y(line):
+    return (line.y0 + line.y1) / 2
+
+def configure_captions(config=None, languages=None):
+    """
+    1, 7단계에서 사용할 캡션 검출기(CAPTION_DETECTOR)를 바꿉니다.
+    - config: CaptionDetector.from_config에 넘길 설정 dict 또는 JSON 파일 경로
+    - languages: 언어 코드 리스트 (예: ["en", "ko", "zh"]). config와 함께 주면 config의 languages를 대신합니다.
+    - 워커 프로세스는 fork 시점의 설정을 물려받으므로 run_batch 호출 전에 설정해야 합니다.
+    """
+    global CAPTION_DETECTOR
+    if isinstance(config, str):
+        with open(config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    config = dict(config or {})
+    if languages:
+        config["languages"] = list(languages)
+    CAPTION_DETECTOR = captions.CaptionDetector.from_config(config)
+    return CAPTION_DETECTOR
+
+def detect_captions(state, page):
+    """1. 텍스트 블록 처리: 페이지의 텍스트 블록에서 캡션을 검출하고 나머지는 본문 블록으로 분류합니다."""
+    for block, text, match in CAPTION_DETECTOR.detect_blocks(page.blocks):
+        if match is None:
+            block_rect = fitz.Rect(block[:4])
+            state.global_main_blocks.append((page.number, block_rect, text))
+            continue
+        kind, label = match
+        # 특수문자가 포함된 경우에만 캡션으로 판단 ("Figure 3 shows ..." 등은 제외)
+        if label is None:
+            continue
+        cap_rect = fitz.Rect(block[:4])
+        if cap_rect.get_area() <= 0:
+            continue
+        state.pending_rect_draws.append((page.number, cap_rect, (1, 0, 0), 2))
+        state.pending_text_inserts.append((page.number, label, (cap_rect.x0, cap_rect.y0), (0, 0, 0), 12))
+        if kind == captions.FIGURE:
+            state.drawn_rectangles.append((page.number, cap_rect))
+            state.figure_caption_regions.append(CaptionRecord(cap_rect, label, text, page.number, kind))
+        else:
+            # 테이블 캡션 검출: 피규어와 동일한 로직 사용
+            state.table_caption_regions.append(CaptionRecord(cap_rect, label, text, page.number, kind))
+            state.drawn_rectangles.append((page.number, cap_rect))
+
+def detect_table_regions(state, page, page_main_blocks):
+    """
+    2~3. 페이지의 본문 블록으로 열(컬럼)을 검출하고, 테이블 캡션의 위치와 가로선 정보로 테이블 영역을 결정합니다.
+    - page_main_blocks: 해당 페이지의 본문 블록 (1단계 결과 중 페이지 번호가 같은 항목)
+    - 가로선은 HorizontalRuleIndex로, 같은 페이지의 다른 캡션은 중심 x 정렬 리스트로 색인하여 캡션마다 전체를 훑지 않습니다.
+    """
+    page_captions = state.table_caption_regions.page(page.number)
+    if not page_captions:
+        return
     # ── 2. 열(컬럼) 검출: 본문 텍스트 블록 기반으로 페이지 내 열 영역 추출 ──
-    for page in doc:
-        page_main_blocks = [entry for entry in global_main_blocks if entry[0] == page.number]
-        page_columns = []
-        remaining_blocks = page_main_blocks.copy()
-        while remaining_blocks:
-            groups = []
-            for entry in remaining_blocks:
-                _, rect, _ = entry
-                placed = False
-                for group in groups:
-                    _, rep_rect, _ = group[0]
-                    if abs(rect.x0 - rep_rect.x0) <= GROUP_TOLERANCE and abs(rect.x1 - rep_rect.x1) <= GROUP_TOLERANCE:
-                        group.append(entry)
-                        placed = True
-                        break
-                if not placed:
-                    groups.append([entry])
-            dominant = max(groups, key=lambda g: sum(entry[1].get_area() for entry in g))
-            col_x_min = min(entry[1].x0 for entry in dominant)
-            col_x_max = max(entry[1].x1 for entry in dominant)
-            col_y_min = min(entry[1].y0 for entry in dominant)
-            col_y_max = max(entry[1].y1 for entry in dominant)
-            page_columns.append((col_x_min, col_x_max, col_y_min, col_y_max))
-            remaining_blocks = [entry for entry in remaining_blocks if not (entry[1].x1 > col_x_min and entry[1].x0 < col_x_max)]
-    
-        # 페이지 내 가로선 후보 추출: 높이 < 2, 너비 > 20인 선분
-        horz_lines = []
-        for obj in page.get_drawings():
-            if "rect" not in obj:
-                continue
-            r = obj["rect"]
-            if (r.y1 - r.y0) < 2 and (r.x1 - r.x0) > 20:
-                horz_lines.append(r)
-    
-        tol_x = 10  # 캡션 중앙 기준 x 오차 허용
-    
-        # ── 3. 테이블 캡션 블럭 처리: 캡션의 위치와 가로선 정보로 테이블 영역 결정 ──
-        for cap_rect, cap_label, text, cap_page in table_caption_regions:
-            if cap_page != page.number:
+    page_columns = []
+    for dominant in detect_columns(page_main_blocks):
+        col_x_min = min(entry[1].x0 for entry in dominant)
+        col_x_max = max(entry[1].x1 for entry in dominant)
+        col_y_min = min(entry[1].y0 for entry in dominant)
+        col_y_max = max(entry[1].y1 for entry in dominant)
+        page_columns.append((col_x_min, col_x_max, col_y_min, col_y_max))
+
+    # 페이지 내 가로선 후보 추출: 높이 < 2, 너비 > 20인 선분
+    horz_lines = HorizontalRuleIndex(page.drawings)
+
+    tol_x = 10  # 캡션 중앙 기준 x 오차 허용
+    x_tol2 = 10
+    # 같은 페이지 캡션의 (중심 x, 중심 y, 좌표)를 중심 x 순으로 정렬 (boundary_y 탐색용)
+    caption_centers = sorted((((r.x0 + r.x1) / 2, (r.y0 + r.y1) / 2, r.coords) for r in page_captions),
+                             key=lambda item: item[0])
+    caption_center_x = [item[0] for item in caption_centers]
+    # 이 페이지의 테이블 영역 (drawn_table_regions 중 페이지 번호가 같은 항목)
+    page_tables = list(state.drawn_table_regions.page(page.number))
+
+    def add_table(table_rect, cap_label):
+        table = TableRecord(page.number, table_rect, cap_label)
+        page_tables.append(table)
+        state.drawn_table_regions.append(table)
+
+    # ── 3. 테이블 캡션 블럭 처리: 캡션의 위치와 가로선 정보로 테이블 영역 결정 ──
+    for caption in page_captions:
+        cap_rect, cap_label = caption.rect, caption.label
+        cap_coords = caption.coords
+        cap_center_x = (cap_rect.x0 + cap_rect.x1) / 2
+        cap_center_y = (cap_rect.y0 + cap_rect.y1) / 2
+
+        selected_lines = horz_lines.near_center_x(cap_center_x, tol_x)
+        is_iside = False
+        if not selected_lines:
+            col_range = None
+            for col in page_columns:
+                col_x_min, col_x_max, _, _ = col
+                if cap_center_x >= col_x_min and cap_center_x <= col_x_max:
+                    col_range = (col_x_min, col_x_max)
+                    break
+            if col_range is None:
+                col_range = (cap_rect.x0, cap_rect.x1)
+            is_iside = len(horz_lines) > 0
+            selected_lines = horz_lines.overlapping_x(col_range[0] - tol_x, col_range[1] + tol_x)
+        if not selected_lines:
+            table_rect = fitz.Rect(col_range[0], cap_rect.y1, col_range[1], cap_rect.y1 + 20)
+            if any(rect_overlap_ratio(table.coords, table_rect) > 0.8 for table in page_tables):
+                state.pending_rect_draws.append((page.number, table_rect, (0, 1, 0), 2))
+                state.pending_text_inserts.append((page.number, cap_label, (table_rect.x0, table_rect.y0 - 10), (0, 0, 1), 12))
+            else:
+                state.pending_rect_draws.append((page.number, table_rect, (0, 1, 0), 2))
+                state.pending_text_inserts.append((page.number, cap_label, (table_rect.x0, table_rect.y0 - 10), (0, 1, 0), 12))
+                add_table(table_rect, cap_label)
+            continue
+
+        closest_line = min(selected_lines, key=lambda r: abs(_line_center_y(r) - cap_center_y))
+        closest_line_center_y = _line_center_y(closest_line)
+        direction = 1 if closest_line_center_y - cap_center_y > 0 else -1
+        candidate_lines = []
+        for line in selected_lines:
+            line_center_y = _line_center_y(line)
+            if ((line_center_y - cap_center_y) * (closest_line_center_y - cap_center_y) > 0 and not line.intersects(cap_rect)) or is_iside:
+                candidate_lines.append(line)
+        boundary_y = None
+        lo = bisect.bisect_left(caption_center_x, cap_center_x - tol_x - HorizontalRuleIndex.EPS)
+        hi = bisect.bisect_right(caption_center_x, cap_center_x + tol_x + HorizontalRuleIndex.EPS)
+        for other_center_x, other_center_y, other_coords in caption_centers[lo:hi]:
+            if other_coords == cap_coords or abs(other_center_x - cap_center_x) > tol_x:
                 continue
-            cap_center_x = (cap_rect.x0 + cap_rect.x1) / 2
-            cap_center_y = (cap_rect.y0 + cap_rect.y1) / 2
-    
-            selected_lines = []
-            for line in horz_lines:
-                line_center_x = (line.x0 + line.x1) / 2
-                if abs(line_center_x - cap_center_x) <= tol_x:
-                    selected_lines.append(line)
-            is_iside = False
-            if not selected_lines:
-                col_range = None
-                for col in page_columns:
-                    col_x_min, col_x_max, _, _ = col
-                    if cap_center_x >= col_x_min and cap_center_x <= col_x_max:
-                        col_range = (col_x_min, col_x_max)
-                        break
-                if col_range is None:
-                    col_range = (cap_rect.x0, cap_rect.x1)
-                for line in horz_lines:
-                    is_iside = True
-                    if line.x0 <= col_range[1] + tol_x and line.x1 >= col_range[0] - tol_x:
-                        if line not in selected_lines:
-                            selected_lines.append(line)
-            if not selected_lines:
-                table_rect = fitz.Rect(col_range[0], cap_rect.y1, col_range[1], cap_rect.y1 + 20)
-                if any(pn == page.number and rect_overlap_ratio(r, table_rect) > 0.8 for (pn, r, _) in drawn_table_regions):
-                    pending_rect_draws.append((page.number, table_rect, (0, 1, 0), 2))
-                    pending_text_inserts.append((page.number, cap_label, (table_rect.x0, table_rect.y0 - 10), (0, 0, 1), 12))
+            if direction == 1 and other_center_y > cap_center_y:
+                if boundary_y is None or other_center_y < boundary_y:
+                    boundary_y = other_center_y
+            elif direction == -1 and other_center_y < cap_center_y:
+                if boundary_y is None or other_center_y > boundary_y:
+                    boundary_y = other_center_y
+        filtered_candidates = []
+        if not is_iside:
+            for line in candidate_lines:
+                line_center_y = _line_center_y(line)
+                if direction == 1:
+                    if line_center_y > cap_center_y and (boundary_y is None or line_center_y < boundary_y):
+                        filtered_candidates.append(line)
                 else:
-                    pending_rect_draws.append((page.number, table_rect, (0, 1, 0), 2))
-                    pending_text_inserts.append((page.number, cap_label, (table_rect.x0, table_rect.y0 - 10), (0, 1, 0), 12))
-                    drawn_table_regions.append((page.number, table_rect, cap_label))
-                continue
-    
-            best_group = selected_lines
-            closest_line = min(best_group, key=lambda r: abs(((r.y0 + r.y1) / 2) - cap_center_y))
-            closest_line_center_y = (closest_line.y0 + closest_line.y1) / 2
-            direction = 1 if closest_line_center_y - cap_center_y > 0 else -1
-            candidate_lines = []
-            for line in selected_lines:
-                line_center_y = (line.y0 + line.y1) / 2
-                if ((line_center_y - cap_center_y) * (closest_line_center_y - cap_center_y) > 0 and not line.intersects(cap_rect)) or is_iside:
-                    candidate_lines.append(line)
-            boundary_y = None
-            for other_cap_rect, other_cap_label, other_text, other_cap_page in table_caption_regions:
-                if other_cap_page != page.number:
-                    continue
-                other_center_x = (other_cap_rect.x0 + other_cap_rect.x1) / 2
-                other_center_y = (other_cap_rect.y0 + other_cap_rect.y1) / 2
-                if other_cap_rect == cap_rect or abs(other_center_x - cap_center_x) > tol_x:
-                    continue
-                if direction == 1 and other_center_y > cap_center_y:
-                    if boundary_y is None or other_center_y < boundary_y:
-                        boundary_y = other_center_y
-                elif direction == -1 and other_center_y < cap_center_y:
-                    if boundary_y is None or other_center_y > boundary_y:
-                        boundary_y = other_center_y
-            filtered_candidates = []
-            if not is_iside:
-                for line in candidate_lines:
-                    line_center_y = (line.y0 + line.y1) / 2
-                    if direction == 1:
-                        if line_center_y > cap_center_y and (boundary_y is None or line_center_y < boundary_y):
-                            filtered_candidates.append(line)
+                    if line_center_y < cap_center_y and (boundary_y is None or line_center_y > boundary_y):
+                        filtered_candidates.append(line)
+        else:
+            filtered_candidates = candidate_lines
+
+        x_groups = group_by_x_span(filtered_candidates, x_tol2)
+        closest_key = tuple(closest_line)
+        closest_group = next((group for group in x_groups if any(tuple(line) == closest_key for line in group)), None)
+        if closest_group:
+            refined_x_min = min(r.x0 for r in closest_group)
+            refined_x_max = max(r.x1 for r in closest_group)
+            refined_y_min = min(r.y0 for r in closest_group)
+            refined_y_max = max(r.y1 for r in closest_group)
+            refined_rect = fitz.Rect(refined_x_min, refined_y_min, refined_x_max, refined_y_max)
+            if any(rect_overlap_ratio(table.coords, refined_rect) > 0.8 for table in page_tables):
+                state.pending_rect_draws.append((page.number, refined_rect, (0, 0, 1), 2))
+                state.pending_text_inserts.append((page.number, cap_label, (refined_rect.x0, refined_rect.y0 - 10), (0, 0, 1), 12))
+                state.drawn_rectangles.append((page.number, refined_rect))
+                group_keys = {tuple(line) for line in closest_group}
+                new_candidates = [line for line in selected_lines if tuple(line) not in group_keys]
+                if new_candidates:
+                    x_groups_new = group_by_x_span(new_candidates, x_tol2)
+                    new_closest_group = None
+                    min_diff = float('inf')
+                    for group in x_groups_new:
+                        for line in group:
+                            diff = abs(_line_center_y(line) - cap_center_y)
+                            if diff < min_diff:
+                                min_diff = diff
+                                new_closest_group = group
+                    if new_closest_group:
+                        new_refined_rect = fitz.Rect(
+                            min(r.x0 for r in new_closest_group),
+                            min(r.y0 for r in new_closest_group),
+                            max(r.x1 for r in new_closest_group),
+                            max(r.y1 for r in new_closest_group)
+                        )
+                        state.pending_rect_draws.append((page.number, new_refined_rect, (1, 0, 1), 2))
+                        state.drawn_rectangles.append((page.number, new_refined_rect))
+                        prev_entry = next((table for table in page_tables if rect_overlap_ratio(table.coords, refined_rect) > 0.8), None)
+                        upper_label = prev_entry.label if prev_entry is not None else cap_label
+                        state.pending_text_inserts.append((page.number, upper_label, (new_refined_rect.x0, new_refined_rect.y0 - 10), (1, 0, 1), 12))
                     else:
-                        if line_center_y < cap_center_y and (boundary_y is None or line_center_y > boundary_y):
-                            filtered_candidates.append(line)
+                        state.pending_rect_draws.append((page.number, refined_rect, (0, 1, 0), 2))
+                        state.pending_text_inserts.append((page.number, cap_label, (refined_rect.x0, refined_rect.y0 - 10), (0, 1, 0), 12))
+                        add_table(refined_rect, cap_label)
             else:
-                filtered_candidates = candidate_lines
-    
-            x_tol2 = 10
-            x_groups = []
-            for line in filtered_candidates:
-                placed = False
-                for group in x_groups:
-                    rep_line = group[0]
-                    if abs(line.x0 - rep_line.x0) <= x_tol2 and abs(line.x1 - rep_line.x1) <= x_tol2:
-                        group.append(line)
-                        placed = True
-                        break
-                if not placed:
-                    x_groups.append([line])
-    
-            closest_group = None
-            for group in x_groups:
-                if closest_line in group:
-                    closest_group = group
-                    break
-            if closest_group:
-                refined_x_min = min(r.x0 for r in closest_group)
-                refined_x_max = max(r.x1 for r in closest_group)
-                refined_y_min = min(r.y0 for r in closest_group)
-                refined_y_max = max(r.y1 for r in closest_group)
-                refined_rect = fitz.Rect(refined_x_min, refined_y_min, refined_x_max, refined_y_max)
-                if any(pn == page.number and rect_overlap_ratio(r, refined_rect) > 0.8 for (pn, r, _) in drawn_table_regions):
-                    pending_rect_draws.append((page.number, refined_rect, (0, 0, 1), 2))
-                    pending_text_inserts.append((page.number, cap_label, (refined_rect.x0, refined_rect.y0 - 10), (0, 0, 1), 12))
-                    drawn_rectangles.append((page.number, refined_rect))
-                    new_candidates = [line for line in selected_lines if line not in closest_group]
-                    if new_candidates:
-                        x_groups_new = []
-                        for line in new_candidates:
-                            placed = False
-                            for group in x_groups_new:
-                                rep_line = group[0]
-                                if abs(line.x0 - rep_line.x0) <= x_tol2 and abs(line.x1 - rep_line.x1) <= x_tol2:
-                                    group.append(line)
-                                    placed = True
-                                    break
-                            if not placed:
-                                x_groups_new.append([line])
-                        new_closest_group = None
-                        new_closest_line = None
-                        min_diff = float('inf')
-                        for group in x_groups_new:
-                            for line in group:
-                                line_center_y = (line.y0 + line.y1) / 2
-                                diff = abs(line_center_y - cap_center_y)
-                                if diff < min_diff:
-                                    min_diff = diff
-                                    new_closest_line = line
-                                    new_closest_group = group
-                        if new_closest_group:
-                            new_refined_rect = fitz.Rect(
-                                min(r.x0 for r in new_closest_group),
-                                min(r.y0 for r in new_closest_group),
-                                max(r.x1 for r in new_closest_group),
-                                max(r.y1 for r in new_closest_group)
-                            )
-                            pending_rect_draws.append((page.number, new_refined_rect, (1, 0, 1), 2))
-                            drawn_rectangles.append((page.number, new_refined_rect))
-                            prev_entry = next((entry for entry in drawn_table_regions if entry[0] == page.number and rect_overlap_ratio(entry[1], refined_rect) > 0.8), None)
-                            upper_label = prev_entry[2] if prev_entry is not None else cap_label
-                            pending_text_inserts.append((page.number, upper_label, (new_refined_rect.x0, new_refined_rect.y0 - 10), (1, 0, 1), 12))
-                        else:
-                            pending_rect_draws.append((page.number, refined_rect, (0, 1, 0), 2))
-                            pending_text_inserts.append((page.number, cap_label, (refined_rect.x0, refined_rect.y0 - 10), (0, 1, 0), 12))
-                            drawn_table_regions.append((page.number, refined_rect, cap_label))
-                else:
-                    pending_rect_draws.append((page.number, refined_rect, (0, 1, 0), 2))
-                    pending_text_inserts.append((page.number, cap_label, (refined_rect.x0, refined_rect.y0 - 10), (0, 1, 0), 12))
-                    drawn_table_regions.append((page.number, refined_rect, cap_label))
-    
-        # End of table caption horizontal line handling
-    
-    # ── 4. 본문 텍스트 블록 중 테이블 영역과 겹치는 부분 제거 ──
-    filtered_global_main_blocks = []
-    for entry in global_main_blocks:
+                state.pending_rect_draws.append((page.number, refined_rect, (0, 1, 0), 2))
+                state.pending_text_inserts.append((page.number, cap_label, (refined_rect.x0, refined_rect.y0 - 10), (0, 1, 0), 12))
+                add_table(refined_rect, cap_label)
+
+def filter_table_blocks(state, main_blocks):
+    """4. 본문 텍스트 블록 중 테이블 영역과 겹치는 블록을 제외한 리스트를 반환합니다."""
+    filtered_blocks = []
+    table_rects = {}  # 페이지 번호 -> [테이블 영역 fitz.Rect] (페이지마다 한 번만 생성)
+    for entry in main_blocks:
         page_num, rect, text = entry
-        skip = False
-        for (pn, table_rect, _) in drawn_table_regions:
-            if pn == page_num and rect.intersects(table_rect):
-                skip = True
-                break
-        if not skip:
-            filtered_global_main_blocks.append(entry)
-    
-    # ── 5. 열(컬럼) 검출 (시각화용): 추출된 텍스트 블록들을 그룹화하여 컬럼 영역 표시 ──
-    remaining_blocks = filtered_global_main_blocks.copy()
-    columns = []
-    while remaining_blocks:
-        groups = []
-        for entry in remaining_blocks:
-            pn, rect, _ = entry
-            placed = False
-            for group in groups:
-                _, rep_rect, _ = group[0]
-                if abs(rect.x0 - rep_rect.x0) <= GROUP_TOLERANCE and abs(rect.x1 - rep_rect.x1) <= GROUP_TOLERANCE:
-                    group.append(entry)
-                    placed = True
-                    break
-            if not placed:
-                groups.append([entry])
-        dominant = max(groups, key=lambda g: sum(entry[1].get_area() for entry in g))
-        columns.append(dominant)
-        dom_x0 = min(rect.x0 for (_, rect, _) in dominant)
-        dom_x1 = max(rect.x1 for (_, rect, _) in dominant)
-        remaining_blocks = [entry for entry in remaining_blocks if not (entry[1].x1 > dom_x0 and entry[1].x0 < dom_x1)]
-    
+        if page_num not in table_rects:
+            table_rects[page_num] = [table.rect for table in state.drawn_table_regions.page(page_num)]
+        if not any(rect.intersects(table_rect) for table_rect in table_rects[page_num]):
+            filtered_blocks.append(entry)
+    return filtered_blocks
+
+def select_text_columns(filtered_blocks):
+    """
+    5. 열(컬럼) 검출 (시각화용): 문서 전체의 본문 블록을 그룹화하여 본문 컬럼을 고릅니다.
+    - 반환값: (entire_col_rect, marks)
+      marks는 선택된 컬럼에 속한 블록들의 (페이지 번호, 사각형, 컬럼 색상) 리스트로,
+      PipelineState.mark_main_text로 각 페이지 상태에 반영합니다.
+    """
+    entire_col_rect = fitz.Rect()
+    marks = []
+    columns = detect_columns(filtered_blocks)
+
     group_info = []
     for group in columns:
         group_x_min = min(rect.x0 for (_, rect, _) in group)
@@ -649,308 +1828,1488 @@ def process_pdf(input_path, output_path):
         entire_col_rect |= col_rect
         for entry in group:
             page_num, rect, _ = entry
-            pending_main_text_rect_draws.append((page_num, rect, group_color, 1))
-            drawn_rectangles.append((page_num, rect))
-    
-    # ── 6. 이미지 및 드로잉 요소(비텍스트 요소) 클러스터링 및 추출 ──
-    merged_clusters_by_page = {}
-    for page in doc:
-        elements_to_cluster = []
-        # 페이지 내 이미지 영역 추출
-        for img in page.get_images(full=True):
-            xref = img[0]
-            img_rects = page.get_image_rects(xref)
-            for rect in img_rects:
-                if already_drawn(page.number, rect, drawn_rectangles):
-                    continue
-                skip = False
-                for (pn, table_rect, _) in drawn_table_regions:
-                    if pn == page.number and rect_overlap_ratio(rect, table_rect) > 0.8:
+            marks.append((page_num, rect, group_color))
+    return entire_col_rect, marks
+
+def cluster_page_graphics(state, page):
+    """6. 이미지 및 드로잉 요소(비텍스트 요소)를 클러스터링하여 페이지의 클러스터 영역을 구합니다."""
+    elements_to_cluster = []
+    table_rects = [table.rect for table in state.drawn_table_regions.page(page.number)]
+    # 페이지 내 이미지 영역 추출
+    for rect in page.image_rects:
+        if already_drawn(page.number, rect, state.drawn_rectangles):
+            continue
+        skip = False
+        for table_rect in table_rects:
+            if rect_overlap_ratio(rect, table_rect) > 0.8:
+                skip = True
+                break
+        if skip:
+            continue
+        elements_to_cluster.append(rect)
+    # 페이지 내 드로잉 요소(라인, 사각형 등) 추출
+    for rect in page.drawings:
+        skip = False
+        if not state.entire_col_rect.intersects(rect):
+            skip = True
+        if not skip:
+            for table_rect in table_rects:
+                if rect_overlap_ratio(rect, table_rect) > 0.8:
+                    skip = True
+                    break
+                if (rect.y1 - rect.y0) < 3:
+                    cp = fitz.Point((rect.x0+rect.x1)/2, (rect.y0+rect.y1)/2)
+                    if table_rect.contains(cp):
                         skip = True
                         break
-                if skip:
-                    continue
-                elements_to_cluster.append(rect)
-        # 페이지 내 드로잉 요소(라인, 사각형 등) 추출
-        for obj in page.get_drawings():
-            rect = obj.get("rect")
-            skip = False
-            if not entire_col_rect.intersects(rect):
-                skip = True
-            if not skip:
-                for (pn, table_rect, _) in drawn_table_regions:
-                    if pn == page.number:
-                        if rect_overlap_ratio(rect, table_rect) > 0.8:
-                            skip = True
-                            break
-                        if (rect.y1 - rect.y0) < 3:
-                            cp = fitz.Point((rect.x0+rect.x1)/2, (rect.y0+rect.y1)/2)
-                            if table_rect.contains(cp):
-                                skip = True
-                                break
-                        if (table_rect.contains(rect) or table_rect.intersects(rect)):
-                            skip = True
-                            break
-            if is_in_blocks(page.number, rect, drawn_rectangles):
-                skip = True
-            if is_intersects_blocks(page.number, rect, drawn_rectangles):
-                skip = True
-            if skip:
-                continue
-            elements_to_cluster.append(rect)
-    
-        # 클러스터링: 가까운 요소들을 그룹화하여 병합 영역 결정
-        clusters_rect = cluster_elements(elements_to_cluster, threshold=20)
-        merged_cluster_rects = []
-        for cluster in clusters_rect:
-            merged_rect = fitz.Rect()
-            for r in cluster:
-                merged_rect |= r
-            if merged_rect.width < 5 or merged_rect.height < 5:
-                continue
-            merged_cluster_rects.append(merged_rect)
-        merged_cluster_rects = merge_overlapping_rects(merged_cluster_rects)
-        merged_clusters_by_page[page.number] = merged_cluster_rects
-    
-    # ── 7. 클러스터 영역 내 캡션 재탐지 ──
-    # 본문 텍스트 블록과 클러스터 영역이 교차하는 경우, subtract_rect를 통해 후보 영역 분리 후
-    # 캡션 패턴에 따라 재탐지 수행
-    for entry in filtered_global_main_blocks:
+                if (table_rect.contains(rect) or table_rect.intersects(rect)):
+                    skip = True
+                    break
+        if is_in_blocks(page.number, rect, state.drawn_rectangles):
+            skip = True
+        if is_intersects_blocks(page.number, rect, state.drawn_rectangles):
+            skip = True
+        if skip:
+            continue
+        elements_to_cluster.append(rect)
+
+    # 클러스터링: 가까운 요소들을 그룹화하여 병합 영역 결정
+    # (차트처럼 드로잉이 많은 페이지는 드로잉을 먼저 단순화한 뒤 클러스터링, 결과는 같음)
+    if len(elements_to_cluster) >= DRAWING_LOD_MIN_ELEMENTS:
+        clusters_rect = cluster_drawings(elements_to_cluster, threshold=CLUSTER_THRESHOLD)
+    else:
+        clusters_rect = cluster_elements(elements_to_cluster, threshold=CLUSTER_THRESHOLD)
+    merged_cluster_rects = []
+    for cluster in clusters_rect:
+        merged_rect = fitz.Rect()
+        for r in cluster:
+            merged_rect |= r
+        if merged_rect.width < MIN_CLUSTER_SIZE or merged_rect.height < MIN_CLUSTER_SIZE:
+            continue
+        merged_cluster_rects.append(merged_rect)
+    merged_cluster_rects = merge_overlapping_rects(merged_cluster_rects)
+    state.merged_clusters_by_page[page.number] = merged_cluster_rects
+
+def redetect_cluster_captions(state, page, page_filtered_blocks):
+    """
+    7. 클러스터 영역 내 캡션 재탐지
+    본문 텍스트 블록과 클러스터 영역이 교차하는 경우, subtract_rect를 통해 후보 영역 분리 후
+    캡션 패턴에 따라 재탐지 수행
+    """
+    for entry in page_filtered_blocks:
         page_num, text_rect, text = entry
-        if page_num not in merged_clusters_by_page:
+        if page_num not in state.merged_clusters_by_page:
             continue
-        page = doc[page_num]
-        for cluster_rect in merged_clusters_by_page[page_num]:
+        for cluster_rect in state.merged_clusters_by_page[page_num]:
             if text_rect.intersects(cluster_rect):
                 candidates = subtract_rect(text_rect, cluster_rect)
                 for candidate in candidates:
-                    candidate_text = page.get_text("text", clip=candidate).strip()
+                    candidate_text = page.clip_text(candidate).strip()
                     if not candidate_text:
                         continue
-                    candidate_text_no_space = re.sub(r'\s+', '', candidate_text)
-                    match_fig = fig_pattern.match(candidate_text_no_space)
-                    match_table = table_pattern.match(candidate_text_no_space)
-                    if match_fig:
-                        special_char = match_fig.group("special")
-                        if special_char.isalnum() or special_char.isspace():
-                            continue
-                        fig_label = f"Figure {match_fig.group(2)}"
-                        pending_rect_draws.append((page_num, candidate, (1, 0, 0), 2))
-                        pending_text_inserts.append((page_num, fig_label, (candidate.x0, candidate.y0), (0, 0, 0), 12))
-                        drawn_rectangles.append((page_num, candidate))
-                        figure_caption_regions.append((candidate, fig_label, candidate_text, page_num))
-                    elif match_table:
-                        special_char = match_table.group("special")
-                        if special_char.isalnum() or special_char.isspace():
-                            continue
-                        table_label = f"Table {match_table.group(2)}"
-                        pending_rect_draws.append((page_num, candidate, (1, 0, 0), 2))
-                        pending_text_inserts.append((page_num, table_label, (candidate.x0, candidate.y0), (0, 0, 0), 12))
-                        table_caption_regions.append((candidate, table_label, candidate_text, page_num))
-                        drawn_rectangles.append((page_num, candidate))
-    
-    # ── 8. 텍스트 보강 클러스터링 기능 복원 ──
-    # 추가적으로 본문 텍스트 블록을 클러스터링하여 누락된 영역을 보완
-    for page in doc:
-        elements_to_cluster = []
-        for obj in page.get_text("blocks"):
-            rect = fitz.Rect(obj[:4])
-            skip = False
-            if page.number == 0:
-                skip = True
-            if not entire_col_rect.intersects(rect):
-                skip = True
-            if not skip:
-                for (pn, table_rect, _) in drawn_table_regions:
-                    if pn == page.number:
-                        if rect_overlap_ratio(rect, table_rect) > 0.8:
-                            skip = True
-                            break
-                        if (rect.y1 - rect.y0) < 3:
-                            cp = fitz.Point((rect.x0+rect.x1)/2, (rect.y0+rect.y1)/2)
-                            if table_rect.contains(cp):
-                                skip = True
-                                break
-                        if (table_rect.contains(rect) or table_rect.intersects(rect)):
-                            skip = True
-                            break
-                if is_in_blocks(page.number, rect, drawn_rectangles):
+                    match = CAPTION_DETECTOR.detect(candidate_text)
+                    if match is None or match[1] is None:
+                        continue
+                    kind, label = match
+                    state.pending_rect_draws.append((page_num, candidate, (1, 0, 0), 2))
+                    state.pending_text_inserts.append((page_num, label, (candidate.x0, candidate.y0), (0, 0, 0), 12))
+                    if kind == captions.FIGURE:
+                        state.drawn_rectangles.append((page_num, candidate))
+                        state.figure_caption_regions.append(CaptionRecord(candidate, label, candidate_text, page_num, kind))
+                    else:
+                        state.table_caption_regions.append(CaptionRecord(candidate, label, candidate_text, page_num, kind))
+                        state.drawn_rectangles.append((page_num, candidate))
+
+def cluster_page_text(state, page):
+    """8. 텍스트 보강 클러스터링: 본문 텍스트 블록을 클러스터링하여 누락된 영역을 보완합니다."""
+    elements_to_cluster = []
+    table_rects = [table.rect for table in state.drawn_table_regions.page(page.number)]
+    for obj in page.blocks:
+        rect = fitz.Rect(obj[:4])
+        skip = False
+        if page.number == 0:
+            skip = True
+        if not state.entire_col_rect.intersects(rect):
+            skip = True
+        if not skip:
+            for table_rect in table_rects:
+                if rect_overlap_ratio(rect, table_rect) > 0.8:
                     skip = True
-                if is_intersects_blocks(page.number, rect, drawn_rectangles):
+                    break
+                if (rect.y1 - rect.y0) < 3:
+                    cp = fitz.Point((rect.x0+rect.x1)/2, (rect.y0+rect.y1)/2)
+                    if table_rect.contains(cp):
+                        skip = True
+                        break
+                if (table_rect.contains(rect) or table_rect.intersects(rect)):
                     skip = True
-            if skip:
-                continue
-            elements_to_cluster.append(rect)
-        new_clusters = cluster_elements(elements_to_cluster, threshold=20)
-        new_cluster_rects = []
-        for cluster in new_clusters:
-            merged_rect = fitz.Rect()
-            for r in cluster:
-                merged_rect |= r
-            if merged_rect.width < 5 or merged_rect.height < 5:
-                continue
-            new_cluster_rects.append(merged_rect)
-        new_cluster_rects = merge_overlapping_rects(new_cluster_rects)
-        if page.number in merged_clusters_by_page:
-            merged_clusters_by_page[page.number].extend(new_cluster_rects)
-            merged_clusters_by_page[page.number] = merge_overlapping_rects(merged_clusters_by_page[page.number])
-        else:
-            merged_clusters_by_page[page.number] = new_cluster_rects
-    
-    # ── 9. 캡션과 클러스터 영역 매칭 (1:1) ──
-    # DFS(깊이 우선 탐색) 기반 매칭 알고리즘을 이용하여 캡션과 후보 클러스터를 1:1 매칭
-    for page in doc:
-        clusters = merged_clusters_by_page.get(page.number, [])
-        # 피규어 캡션만 대상으로 매칭 (테이블 캡션은 별도 처리)
-        captions_on_page = [(cap_rect, cap_label) for cap_rect, cap_label, _, cap_page in figure_caption_regions if cap_page == page.number]
-        if not captions_on_page or not clusters:
+                    break
+            if is_in_blocks(page.number, rect, state.drawn_rectangles):
+                skip = True
+            if is_intersects_blocks(page.number, rect, state.drawn_rectangles):
+                skip = True
+        if skip:
             continue
-        candidate_clusters = []
-        for i, (cap_rect, cap_label) in enumerate(captions_on_page):
-            candidates = []
-            for j, cluster_rect in enumerate(clusters):
-                # 두 영역 사이의 가장 가까운 경계상의 점을 계산
-                p_cluster, p_cap = closest_points_between_rectangles(cluster_rect, cap_rect)
-                distance = math.hypot(p_cluster[0] - p_cap[0], p_cluster[1] - p_cap[1])
-                candidates.append((j, distance, cluster_rect, p_cluster, p_cap))
-            candidates.sort(key=lambda x: x[1])
-            candidate_clusters.append(candidates)
-        match = {}
-        def dfs(caption_idx, visited):
-            """
-            DFS 기반 매칭 알고리즘:
-              - 각 캡션 인덱스(candidate_clusters의 인덱스)에 대해
-                후보 클러스터 목록을 순회하면서 매칭 가능한 클러스터를 찾음.
-              - 이미 매칭된 클러스터에 대해 재귀적으로 다른 캡션과 매칭 가능하면 교체.
-            """
-            for cand in candidate_clusters[caption_idx]:
-                cluster_idx = cand[0]
-                if cluster_idx in visited:
-                    continue
-                visited.add(cluster_idx)
-                if cluster_idx not in match or dfs(match[cluster_idx], visited):
-                    match[cluster_idx] = caption_idx
-                    return True
-            return False
-        for cap_idx in range(len(captions_on_page)):
-            dfs(cap_idx, set())
-        for cluster_idx, cap_idx in match.items():
-            chosen_candidate = next((cand for cand in candidate_clusters[cap_idx] if cand[0] == cluster_idx), None)
-            if chosen_candidate is not None:
-                cap_label = captions_on_page[cap_idx][1]
-                if page.number not in page_caption_matching:
-                    page_caption_matching[page.number] = {}
-                page_caption_matching[page.number][cap_label] = (chosen_candidate[2], chosen_candidate[3], chosen_candidate[4], chosen_candidate[1])
-    
-    # ── 10. 후처리: 매칭되지 않은 클러스터 영역 병합 ──
-    # 매칭되지 않은 클러스터 영역 중, 캡션과 충돌하지 않는 영역은 기존 매칭 영역과 병합
-    for page in doc:
-        if page.number not in merged_clusters_by_page:
+        elements_to_cluster.append(rect)
+    new_clusters = cluster_elements(elements_to_cluster, threshold=CLUSTER_THRESHOLD)
+    new_cluster_rects = []
+    for cluster in new_clusters:
+        merged_rect = fitz.Rect()
+        for r in cluster:
+            merged_rect |= r
+        if merged_rect.width < MIN_CLUSTER_SIZE or merged_rect.height < MIN_CLUSTER_SIZE:
             continue
-        if page.number not in page_caption_matching:
+        new_cluster_rects.append(merged_rect)
+    new_cluster_rects = merge_overlapping_rects(new_cluster_rects)
+    if page.number in state.merged_clusters_by_page:
+        state.merged_clusters_by_page[page.number].extend(new_cluster_rects)
+        state.merged_clusters_by_page[page.number] = merge_overlapping_rects(state.merged_clusters_by_page[page.number])
+    else:
+        state.merged_clusters_by_page[page.number] = new_cluster_rects
+
+def nearest_candidates(distances, k=MATCH_K, max_distance=MATCH_MAX_DISTANCE):
+    """
+    (행 x 열) 거리 행렬에서 행마다 가장 가까운 열을 최대 k개, 거리 max_distance 이하만 골라 반환합니다.
+    - k, max_distance가 None이면 해당 제한을 두지 않습니다.
+    - 반환값: 행마다 거리순(같으면 열 번호순) 열 번호 리스트
+    """
+    candidates = []
+    for row in distances:
+        order = np.argsort(row, kind="stable")
+        if k is not None:
+            order = order[:k]
+        if max_distance is not None:
+            order = order[row[order] <= max_distance]
+        candidates.append([int(j) for j in order])
+    return candidates
+
+def min_cost_assignment(cost):
+    """
+    (n x m) 비용 행렬에서 행과 열을 1:1로 짝지어 비용 합이 최소인 배정을 구합니다. (헝가리안 알고리즘, O(n^2 m))
+    - n과 m이 다르면 작은 쪽이 모두 배정됩니다.
+    - 반환값: [(행 번호, 열 번호)] (행 번호순)
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    if n == 0:
+        return []
+    # 행/열 포텐셜(u, v)과 열 j에 배정된 행 p[j] (1부터 시작, 0은 가상의 시작 열)
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used
+            free[0] = False
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free[1:] & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            j1 = int(np.argmin(np.where(free, minv, np.inf)))
+            delta = minv[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    pairs = [(int(p[j]) - 1, j - 1) for j in range(1, m + 1) if p[j]]
+    if transposed:
+        pairs = [(col, row) for row, col in pairs]
+    return sorted(pairs)
+
+def match_page_captions(state, page):
+    """
+    9. 캡션과 클러스터 영역 매칭 (1:1)
+    캡션마다 가까운 클러스터 후보(nearest_candidates)만 남긴 뒤, 매칭되는 캡션 수가 최대이면서
+    거리 합이 최소가 되도록 배정합니다. (min_cost_assignment)
+    - 매칭 수 최대는 후보 그래프 안에서의 최대입니다. 후보가 없는 캡션(가장 가까운 클러스터가
+      MATCH_MAX_DISTANCE보다 먼 캡션 등)은 매칭하지 않습니다. (MATCH_K / MATCH_MAX_DISTANCE가 None이면 제한 없음)
+    """
+    clusters = state.merged_clusters_by_page.get(page.number, [])
+    # 피규어 캡션만 대상으로 매칭 (테이블 캡션은 별도 처리)
+    captions_on_page = state.figure_caption_regions.page(page.number)
+    if not captions_on_page or not clusters:
+        return
+    # 캡션 x 클러스터 최근접 점/거리 행렬을 한 번에 계산한 뒤, 캡션별 후보만 남김 (캡션 좌표는 RegionStore의 페이지별 배열)
+    p_caps, p_clusters, distances = geometry.closest_point_pairs(state.figure_caption_regions.coords(page.number), clusters)
+    candidates = nearest_candidates(distances, MATCH_K, MATCH_MAX_DISTANCE)
+    # 어떤 캡션의 후보에도 들지 않는 클러스터는 배정 대상에서 제외
+    columns = sorted({j for row in candidates for j in row})
+    if not columns:
+        return
+    column_of = {j: c for c, j in enumerate(columns)}
+    # 후보가 아닌 쌍은 후보 거리의 합보다 큰 비용을 주어, 매칭 수를 먼저 최대화하고 그 안에서 거리 합을 최소화
+    penalty = 1.0 + sum(float(distances[i, j]) for i, row in enumerate(candidates) for j in row)
+    cost = np.full((len(captions_on_page), len(columns)), penalty)
+    for i, row in enumerate(candidates):
+        for j in row:
+            cost[i, column_of[j]] = distances[i, j]
+    for cap_idx, col in min_cost_assignment(cost):
+        cluster_idx = columns[col]
+        if cost[cap_idx, col] >= penalty:
             continue
-        matched_dict = page_caption_matching[page.number]
-        matched_list = [(label, tup[0]) for label, tup in matched_dict.items()]
-        unmatched = [cl for cl in merged_clusters_by_page[page.number] if not is_in_matched(cl, matched_list)]
-        merge_candidates = []
-        for cl in unmatched:
-            best_distance = float('inf')
-            best_label = None
-            best_matched = None
-            for label, m in matched_list:
-                p1, p2 = closest_points_between_rectangles(cl, m)
-                distance = math.hypot(p1[0]-p2[0], p1[1]-p2[1])
-                if distance < best_distance:
-                    best_distance = distance
-                    best_label = label
-                    best_matched = m
-            if best_label is not None:
-                merge_candidates.append((best_distance, best_label, cl))
-        merge_candidates.sort(key=lambda x: x[0])
-        for dist, label, cl in merge_candidates:
-            current_matched = matched_dict[label][0]
-            candidate_union = current_matched | cl
-            conflict = False
-            for pn, dr in drawn_rectangles:
-                if pn != page.number:
-                    continue
-                if candidate_union.intersects(dr) or candidate_union.contains(dr):
-                    conflict = True
-                    break
-            if conflict:
-                continue
-            for pn, tr, _ in drawn_table_regions:
-                if pn != page.number:
-                    continue
-                if candidate_union.intersects(tr) or candidate_union.contains(tr):
-                    conflict = True
-                    break
-            if conflict:
-                continue
-            for cap_rect, cap_label, text, cap_page in (figure_caption_regions + table_caption_regions):
-                if cap_page != page.number:
-                    continue
-                if (candidate_union.intersects(cap_rect) or 
-                    candidate_union.contains(cap_rect) or 
-                    cap_rect.contains(candidate_union)):
-                    conflict = True
-                    break
-            if conflict:
-                continue
-            matched_dict[label] = (candidate_union, (0,0), (0,0), 0)
-            for i, (lbl, m) in enumerate(matched_list):
-                if lbl == label:
-                    matched_list[i] = (lbl, candidate_union)
-                    break
-    
+        cap_label = captions_on_page[cap_idx].label
+        state.page_caption_matching.setdefault(page.number, {})[cap_label] = MatchRecord(
+            clusters[cluster_idx], tuple(p_clusters[cap_idx, cluster_idx].tolist()),
+            tuple(p_caps[cap_idx, cluster_idx].tolist()), float(distances[cap_idx, cluster_idx]))
+
+class ConflictIndex:
+    """
+    10단계에서 병합 영역이 기존 영역과 충돌하는지 검사하는 페이지별 공간 인덱스입니다.
+    - blocked: 처리된 영역(drawn_rectangles)과 테이블 영역. 병합 영역과 교차하거나 병합 영역에 포함되면 충돌
+    - captions: 피규어/테이블 캡션. 위 조건에 더해 캡션이 병합 영역을 포함해도 충돌
+    """
+    def __init__(self):
+        self.blocked = GridIndex()
+        self.captions = GridIndex()
+
+    def conflicts(self, rect):
+        """rect가 이 페이지의 처리된 영역, 테이블 영역, 캡션 중 하나와 충돌하면 True."""
+        for i in self.blocked.query(rect.x0, rect.y0, rect.x1, rect.y1):
+            r = self.blocked.rects[i]
+            if rect.intersects(r) or rect.contains(r):
+                return True
+        for i in self.captions.query(rect.x0, rect.y0, rect.x1, rect.y1):
+            r = self.captions.rects[i]
+            if rect.intersects(r) or rect.contains(r) or r.contains(rect):
+                return True
+        return False
+
+def build_conflict_indexes(state):
+    """
+    1~9단계 결과로 페이지별 ConflictIndex를 한 번에 만들어 state.conflict_indexes에 저장합니다.
+    - 10단계는 영역을 추가하지 않으므로, 10단계를 시작하기 전에 한 번만 만들면 됩니다.
+    """
+    indexes = {}
+    def index_for(page_number):
+        if page_number not in indexes:
+            indexes[page_number] = ConflictIndex()
+        return indexes[page_number]
+    for pn, rect in state.drawn_rectangles:
+        index_for(pn).blocked.insert(rect)
+    for table in state.drawn_table_regions:
+        index_for(table.page).blocked.insert(table.rect)
+    for caption in state.figure_caption_regions:
+        index_for(caption.page).captions.insert(caption.rect)
+    for caption in state.table_caption_regions:
+        index_for(caption.page).captions.insert(caption.rect)
+    state.conflict_indexes = indexes
+    return indexes
+
+def merge_unmatched_clusters(state, page):
+    """
+    10. 후처리: 매칭되지 않은 클러스터 영역 병합
+    매칭되지 않은 클러스터 영역 중, 캡션과 충돌하지 않는 영역은 기존 매칭 영역과 병합
+    - 충돌 검사는 페이지별 ConflictIndex로 병합 영역 주변만 확인합니다.
+    """
+    if page.number not in state.merged_clusters_by_page:
+        return
+    if page.number not in state.page_caption_matching:
+        return
+    if state.conflict_indexes is None:
+        build_conflict_indexes(state)
+    conflicts = state.conflict_indexes.get(page.number)
+    matched_dict = state.page_caption_matching[page.number]
+    matched_list = [(label, match.rect) for label, match in matched_dict.items()]
+    unmatched = [cl for cl in state.merged_clusters_by_page[page.number] if not is_in_matched(cl, matched_list)]
+    merge_candidates = []
+    if unmatched and matched_list:
+        # 매칭되지 않은 클러스터 x 매칭된 클러스터 거리 행렬에서 가장 가까운 매칭 영역 선택
+        _, _, distances = geometry.closest_point_pairs(unmatched, [m for _, m in matched_list])
+        nearest = np.argmin(distances, axis=1)
+        for i, (cl, k) in enumerate(zip(unmatched, nearest)):
+            merge_candidates.append((float(distances[i, k]), matched_list[k][0], cl))
+    merge_candidates.sort(key=lambda x: x[0])
+    unions = dict(matched_list)  # 라벨 -> 현재까지 병합된 영역 (레코드의 rect를 매번 다시 만들지 않음)
+    for dist, label, cl in merge_candidates:
+        # 같은 라벨에 앞서 병합된 결과에 이어서 병합
+        candidate_union = unions[label] | cl
+        if conflicts is not None and conflicts.conflicts(candidate_union):
+            continue
+        unions[label] = candidate_union
+        matched_dict[label] = MatchRecord(candidate_union)
+
+def annotation_ops(state):
+    """
+    12~13단계에서 그릴 항목을 페이지별로 모읍니다. (그리는 순서 유지)
+    - 반환값: {페이지 번호: [("rect", 사각형, 색상, 선 두께) / ("text", 위치, 텍스트, 색상, 폰트 크기)
+                             / ("line", 시작점, 종료점, 색상, 선 두께)]}
+    """
+    ops = {}
+    # ── 12. 매칭 결과 시각화: 클러스터 영역 및 캡션 라벨 ──
+    for page_num, matching in state.page_caption_matching.items():
+        page_ops = ops.setdefault(page_num, [])
+        for cap_label, match in matching.items():
+            cluster_rect = match.rect
+            page_ops.append(("rect", cluster_rect, (1, 0, 1), 5))
+            page_ops.append(("text", (cluster_rect.x0, cluster_rect.y0 - 10), cap_label, (1, 0, 1), 12))
+    # ── 13. pending 리스트에 저장된 그리기 작업 ──
+    for (page_num, rect, color, width) in state.pending_rect_draws:
+        ops.setdefault(page_num, []).append(("rect", rect, color, width))
+    for (page_num, rect, color, width) in state.pending_main_text_rect_draws:
+        ops.setdefault(page_num, []).append(("rect", rect, color, width))
+    for (page_num, text, pos, color, fontsize) in state.pending_text_inserts:
+        ops.setdefault(page_num, []).append(("text", pos, text, color, fontsize))
+    for (page_num, p1, p2, color, width) in state.pending_line_draws:
+        ops.setdefault(page_num, []).append(("line", p1, p2, color, width))
+    return ops
+
+def draw_annotations(doc, state):
+    """
+    12~13. 매칭 결과와 pending 리스트에 저장된 그리기 작업을 문서에 수행합니다.
+    - 페이지마다 하나의 Shape에 모아 한 번만 commit하므로 페이지당 content stream이 하나만 추가됩니다.
+      (Shape는 텍스트를 도형 뒤에 출력하므로 라벨은 항상 사각형/선 위에 그려집니다)
+    - 영역 PDF 출력(RegionWriter) 이후에 호출해야 영역 PDF에 주석이 섞이지 않습니다.
+    """
+    for page_num, page_ops in annotation_ops(state).items():
+        shape = doc[page_num].new_shape()
+        for op in page_ops:
+            if op[0] == "rect":
+                _, rect, color, width = op
+                shape.draw_rect(rect)
+                shape.finish(color=color, width=width)
+            elif op[0] == "text":
+                _, pos, text, color, fontsize = op
+                shape.insert_text(pos, text, color=color, fontsize=fontsize)
+            else:
+                _, p1, p2, color, width = op
+                shape.draw_line(p1, p2)
+                shape.finish(color=color, width=width, closePath=False)
+        shape.commit()
+
+def _svg_color(color):
+    return "rgb({})".format(",".join(str(round(c * 255)) for c in color))
+
+class AnnotationRenderer:
+    """
+    주석(12~13단계)을 출력하고 결과 파일을 저장합니다.
+    - mode: "pdf" (원본에 주석을 그린 PDF), "json" (주석 목록만 담은 오버레이 JSON),
+            "svg" (주석이 있는 페이지마다 페이지 크기의 SVG 오버레이)
+      json / svg는 PDF를 다시 쓰지 않으므로 큰 문서에서 저장 시간이 거의 들지 않습니다.
+    - save_mode: PDF 저장 방식
+      - "full": 문서 전체를 다시 씀 (기존 동작)
+      - "incremental": 원본 사본 뒤에 변경된 객체만 덧붙임 (open_document로 연 문서만 가능, 아니면 full)
+      - "compact": 사용하지 않는 객체 정리(garbage=3)와 스트림 압축(deflate) 후 전체 저장
+    - render()는 여러 번(스트리밍에서는 페이지마다) 호출할 수 있고, save()는 문서마다 한 번 호출합니다.
+    """
+    MODES = ("pdf", "json", "svg")
+    SAVE_MODES = ("full", "incremental", "compact")
+
+    def __init__(self, mode="pdf", save_mode="full"):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown annotation mode: {mode}")
+        if save_mode not in self.SAVE_MODES:
+            raise ValueError(f"unknown save mode: {save_mode}")
+        self.mode = mode
+        self.save_mode = save_mode
+        self.pages = {}  # json / svg: {페이지 번호: 주석 목록}
+
+    def open_document(self, input_path, output_path):
+        """
+        주석을 그릴 문서를 엽니다.
+        - save_mode가 "incremental"이면 원본을 output_path로 복사하여 열고, save()에서 변경분만 덧붙입니다.
+        """
+        if self.mode == "pdf" and self.save_mode == "incremental" and os.path.abspath(input_path) != os.path.abspath(output_path):
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            shutil.copyfile(input_path, output_path)
+            return fitz.open(output_path)
+        return fitz.open(input_path)
+
+    def render(self, doc, state):
+        if self.mode == "pdf":
+            draw_annotations(doc, state)
+            return
+        for page_num, page_ops in annotation_ops(state).items():
+            self.pages.setdefault(page_num, []).extend(page_ops)
+
+    def overlay(self, doc):
+        """json 오버레이 내용: 페이지 크기와 주석 목록 (좌표는 PDF 포인트, 원점은 왼쪽 위)."""
+        pages = []
+        for page_num in sorted(self.pages):
+            rect = doc[page_num].rect
+            items = []
+            for op in self.pages[page_num]:
+                if op[0] == "rect":
+                    items.append({"type": "rect", "rect": _rect_tuple(op[1]), "color": list(op[2]), "width": op[3]})
+                elif op[0] == "text":
+                    items.append({"type": "text", "pos": [op[1][0], op[1][1]], "text": op[2], "color": list(op[3]),
+                                  "fontsize": op[4]})
+                else:
+                    items.append({"type": "line", "p1": [op[1][0], op[1][1]], "p2": [op[2][0], op[2][1]],
+                                  "color": list(op[3]), "width": op[4]})
+            pages.append({"page": page_num, "width": rect.width, "height": rect.height, "items": items})
+        return {"pages": pages}
+
+    def _svg(self, page_rect, page_ops):
+        parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{page_rect.width}" height="{page_rect.height}" '
+                 f'viewBox="0 0 {page_rect.width} {page_rect.height}">']
+        for op in page_ops:
+            if op[0] == "rect":
+                r = op[1]
+                parts.append(f'<rect x="{r.x0}" y="{r.y0}" width="{r.width}" height="{r.height}" fill="none" '
+                             f'stroke="{_svg_color(op[2])}" stroke-width="{op[3]}"/>')
+            elif op[0] == "text":
+                text = op[2].replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+                parts.append(f'<text x="{op[1][0]}" y="{op[1][1]}" fill="{_svg_color(op[3])}" font-size="{op[4]}" '
+                             f'font-family="Helvetica">{text}</text>')
+            else:
+                parts.append(f'<line x1="{op[1][0]}" y1="{op[1][1]}" x2="{op[2][0]}" y2="{op[2][1]}" '
+                             f'stroke="{_svg_color(op[3])}" stroke-width="{op[4]}"/>')
+        parts.append("</svg>")
+        return "\n".join(parts)
+
+    def save(self, doc, output_path):
+        """
+        주석 결과를 저장하고 기록한 파일 경로 리스트를 반환합니다.
+        - pdf: output_path
+        - json: <output_path에서 .pdf를 뺀 경로>.overlay.json
+        - svg: <output_path에서 .pdf를 뺀 경로>_overlay/page_<페이지 번호>.svg
+        """
+        stem = os.path.splitext(output_path)[0]
+        if self.mode == "json":
+            path = stem + ".overlay.json"
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.overlay(doc), f, ensure_ascii=False)
+            return [path]
+        if self.mode == "svg":
+            folder = stem + "_overlay"
+            os.makedirs(folder, exist_ok=True)
+            written = []
+            for page_num in sorted(self.pages):
+                path = os.path.join(folder, f"page_{page_num + 1:04d}.svg")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(self._svg(doc[page_num].rect, self.pages[page_num]))
+                written.append(path)
+            return written
+        if self.save_mode == "incremental" and doc.name and os.path.abspath(doc.name) == os.path.abspath(output_path):
+            if doc.can_save_incrementally():
+                doc.saveIncr()
+            else:
+                # 복구된 문서 등 덧붙일 수 없는 경우: 임시 파일에 전체 저장 후 교체
+                doc.save(output_path + ".tmp")
+                os.replace(output_path + ".tmp", output_path)
+        elif self.save_mode == "compact":
+            doc.save(output_path, garbage=3, deflate=True)
+        else:
+            doc.save(output_path)
+        return [output_path]
+
+# ── 페이지 가지치기: 캡션 후보 페이지 주변에서만 무거운 단계 수행 ──
+def configure_page_pruning(neighbours=None):
+    """
+    페이지 가지치기(PRUNE_NEIGHBOURS)를 설정합니다.
+    - neighbours: None이면 끔. 0 이상이면 캡션 후보 페이지와 앞뒤 neighbours쪽에서만 6~10단계
+      (드로잉/이미지 추출, 클러스터링, 캡션 재탐지, 매칭)를 수행하고 나머지 페이지는 건너뜁니다.
+    - 결과가 달라질 수 있으므로 실행 캐시 키(pipeline_fingerprint)에 포함됩니다.
+    - 워커 프로세스는 fork 시점의 설정을 물려받으므로 run_batch 호출 전에 설정해야 합니다.
+    """
+    global PRUNE_NEIGHBOURS
+    if neighbours is not None and neighbours < 0:
+        raise ValueError("neighbours must be >= 0")
+    PRUNE_NEIGHBOURS = neighbours
+    return PRUNE_NEIGHBOURS
+
+def is_caption_page(state, page):
+    """
+    1단계를 마친 페이지가 캡션 후보 페이지인지 판단합니다. (텍스트 블록만 사용)
+    - 1단계에서 피규어/테이블 캡션이 검출된 페이지
+    - 블록의 둘째 줄 이후가 캡션 형식으로 시작하는 페이지: 7단계에서 클러스터와 겹친 블록을 나누면
+      캡션으로 재탐지될 수 있으므로 후보에 포함합니다.
+    """
+    if state.figure_caption_regions.page(page.number) or state.table_caption_regions.page(page.number):
+        return True
+    for block in page.blocks:
+        for line in block[4].strip().split("\n")[1:]:
+            match = CAPTION_DETECTOR.detect(line.strip())
+            if match is not None and match[1] is not None:
+                return True
+    return False
+
+def pages_to_process(caption_pages, page_count, neighbours):
+    """캡션 후보 페이지와 앞뒤 neighbours쪽의 페이지 번호 집합."""
+    keep = set()
+    for page_number in caption_pages:
+        keep.update(range(max(0, page_number - neighbours), min(page_count, page_number + neighbours + 1)))
+    return keep
+
+def write_prune_report(output_path, file_name, page_count, skipped_pages):
+    """
+    가지치기로 건너뛴 페이지 목록을 <주석 PDF 경로에서 확장자를 뺀 이름>.pruned.json에 기록하고 경로를 반환합니다.
+    (건너뛴 페이지의 캡션/클러스터 누락 여부를 나중에 확인하기 위한 기록)
+    """
+    path = os.path.splitext(output_path)[0] + ".pruned.json"
+    report = {
+        "file": file_name,
+        "page_count": page_count,
+        "neighbours": PRUNE_NEIGHBOURS,
+        "skipped_pages": sorted(skipped_pages),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False)
+    print(f"페이지 가지치기: {file_name} {page_count}쪽 중 {len(skipped_pages)}쪽 건너뜀")
+    return path
+
+def run_pipeline(doc, profiler=None):
+    """
+    열린 문서에 대해 1~10단계(캡션 검출 ~ 매칭 후처리)를 수행하고 결과가 담긴 PipelineState를 반환합니다.
+    - 문서는 수정하지 않습니다. 영역 PDF 출력, 주석, DB 저장은 호출하는 쪽(process_pdf, Extractor)에서 수행합니다.
+    - 페이지 가지치기(PRUNE_NEIGHBOURS)를 켜면 6~10단계는 캡션 후보 페이지 주변에서만 수행하고,
+      건너뛴 페이지 번호를 state.skipped_pages에 남깁니다.
+    """
+    profiler = profiler or NULL_PROFILER
+    state = PipelineState()
+
+    # 페이지별 텍스트 블록, 단어, 드로잉, 이미지 영역을 한 번만 추출하여 모든 단계에서 공유
+    image_digests = {}
+    pages = []
+    for page in doc:
+        with profiler.stage("0.load_page", page.number):
+            pages.append(PageData(page, image_digests))
+
+    # ── 1. 텍스트 블록 처리: 각 페이지별 텍스트 블록 추출 및 캡션 검출 ──
+    for page in pages:
+        with profiler.stage("1.captions", page.number):
+            detect_captions(state, page)
+
+    # 페이지 가지치기: 캡션 후보 페이지 주변만 6~10단계 대상으로 남김
+    heavy_pages = pages
+    if PRUNE_NEIGHBOURS is not None:
+        with profiler.stage("prune"):
+            caption_pages = [page.number for page in pages if is_caption_page(state, page)]
+            keep = pages_to_process(caption_pages, len(pages), PRUNE_NEIGHBOURS)
+            heavy_pages = [page for page in pages if page.number in keep]
+            state.skipped_pages = [page.number for page in pages if page.number not in keep]
+
+    # ── 2~3. 열(컬럼) 검출 및 테이블 캡션 블럭 처리 ──
+    main_blocks_by_page = group_by_page(state.global_main_blocks)
+    for page in pages:
+        with profiler.stage("2-3.tables", page.number):
+            detect_table_regions(state, page, main_blocks_by_page.get(page.number, []))
+
+    # ── 4. 본문 텍스트 블록 중 테이블 영역과 겹치는 부분 제거 ──
+    with profiler.stage("4.filter_tables"):
+        filtered_global_main_blocks = filter_table_blocks(state, state.global_main_blocks)
+
+    # ── 5. 열(컬럼) 검출 (시각화용): 추출된 텍스트 블록들을 그룹화하여 컬럼 영역 표시 ──
+    with profiler.stage("5.columns"):
+        state.entire_col_rect, marks = select_text_columns(filtered_global_main_blocks)
+        for page_num, rect, color in marks:
+            state.mark_main_text(page_num, rect, color)
+
+    # ── 6. 이미지 및 드로잉 요소(비텍스트 요소) 클러스터링 및 추출 ──
+    for page in heavy_pages:
+        with profiler.stage("6.cluster_graphics", page.number):
+            cluster_page_graphics(state, page)
+
+    # ── 7. 클러스터 영역 내 캡션 재탐지 ──
+    filtered_blocks_by_page = group_by_page(filtered_global_main_blocks)
+    for page in heavy_pages:
+        with profiler.stage("7.recaption", page.number):
+            redetect_cluster_captions(state, page, filtered_blocks_by_page.get(page.number, []))
+
+    # ── 8. 텍스트 보강 클러스터링 기능 복원 ──
+    for page in heavy_pages:
+        with profiler.stage("8.cluster_text", page.number):
+            cluster_page_text(state, page)
+
+    # ── 9. 캡션과 클러스터 영역 매칭 (1:1) ──
+    for page in heavy_pages:
+        with profiler.stage("9.match", page.number):
+            match_page_captions(state, page)
+
+    # ── 10. 후처리: 매칭되지 않은 클러스터 영역 병합 ──
+    with profiler.stage("10.conflict_index"):
+        build_conflict_indexes(state)
+    for page in heavy_pages:
+        with profiler.stage("10.merge_unmatched", page.number):
+            merge_unmatched_clusters(state, page)
+        profiler.count_page(state, page)
+    for page_number in state.skipped_pages:
+        profiler.count("pruned", 1, page_number)
+    return state
+
+def process_pdf(input_path, output_path, region_mode="files", sink=None, doc_key=None, streaming=False,
+                profiler=None, annotation_mode="pdf", save_mode="full", thumbnails=None, shards=1):
+    """
+    전체 PDF 처리 파이프라인:
+      1. PDF 파일 열기 및 텍스트, 이미지, 드로잉 요소 추출
+      2. 캡션(테이블, 피규어) 검출 및 영역 추출
+      3. 텍스트 블록을 기반으로 페이지 내 컬럼(열) 검출
+      4. 캡션과 관련된 가로선(라인) 분석을 통해 테이블 영역 결정
+      5. 이미지 및 드로잉 요소를 클러스터링하여 비텍스트 영역 검출
+      6. 클러스터 영역 내 캡션 재탐지 및 텍스트 보강 클러스터링
+      7. 캡션과 클러스터 영역을 DFS 기반 매칭 알고리즘을 통해 1:1 매칭 수행
+      8. 매칭되지 않은 클러스터 영역에 대해 후처리(병합) 수행
+      9. 캡션/클러스터 영역을 개별 PDF로 저장하고, 최종 결과를 PDF에 시각화
+      10. 최종 정보를 SQL 데이터베이스에 저장
+    - region_mode: 영역 PDF 출력 방식 ("files": 영역별 개별 파일, "bundle": 문서당 하나의 PDF + 인덱스)
+    - sink: 결과 저장소 (write() 메서드를 가진 SQLSink 등). 없으면 save_to_sql로 바로 저장.
+    - doc_key: 문서 키 (document_key 참고). 영역 PDF 파일명을 정하는 데 사용되며, 없으면 새로 계산.
+    - streaming: True이면 페이지 단위 스트리밍 처리(iter_pdf_pages)로 수행하여 메모리 사용량을 페이지 수와 무관하게 유지.
+    - profiler: StageProfiler. 주어지면 단계별/페이지별 시간과 객체 수를 기록합니다.
+    - annotation_mode, save_mode: 주석 출력 형식(pdf / json / svg)과 PDF 저장 방식 (AnnotationRenderer 참고)
+    - thumbnails: 영역 썸네일 옵션 dict (ThumbnailWriter 참고). 없으면 썸네일을 만들지 않음.
+    - shards: 2 이상이면 페이지 범위를 나눠 여러 프로세스에서 처리합니다. (process_pdf_sharded, streaming보다 우선)
+    - 페이지 가지치기(configure_page_pruning)를 켜면 건너뛴 페이지 목록을 <출력 이름>.pruned.json에 기록합니다.
+    - 반환값: 이번 처리로 기록된 출력 파일 경로 리스트 (주석 PDF 또는 오버레이 + 가지치기 기록 + 영역 PDF / 썸네일)
+    """
+    if shards > 1:
+        return process_pdf_sharded(input_path, output_path, shards, region_mode=region_mode, sink=sink, doc_key=doc_key,
+                                   profiler=profiler, annotation_mode=annotation_mode, save_mode=save_mode,
+                                   thumbnails=thumbnails)
+    if streaming:
+        pages = iter_pdf_pages(input_path, output_path, region_mode=region_mode, sink=sink, doc_key=doc_key,
+                               profiler=profiler, annotation_mode=annotation_mode, save_mode=save_mode,
+                               thumbnails=thumbnails)
+        while True:
+            try:
+                next(pages)
+            except StopIteration as stop:
+                return stop.value
+
+    profiler = profiler or NULL_PROFILER
+    renderer = AnnotationRenderer(annotation_mode, save_mode)
+    with profiler.stage("open"):
+        doc = renderer.open_document(input_path, output_path)
+    state = run_pipeline(doc, profiler)
+    return finish_document(doc, state, renderer, input_path, output_path, region_mode, sink, doc_key, profiler, thumbnails)
+
+def finish_document(doc, state, renderer, input_path, output_path, region_mode="files", sink=None, doc_key=None,
+                    profiler=NULL_PROFILER, thumbnails=None):
+    """
+    1~10단계를 마친 문서 전체의 state로 11단계(영역 PDF), 12~13단계(주석), 저장, DB 기록을 수행하고 doc을 닫습니다.
+    - 반환값: process_pdf와 같은 출력 파일 경로 리스트
+    """
     # ── 11. 캡션 영역(테이블 영역)과 클러스터 영역을 별도 PDF로 저장 ──
     # 원본 파일명(확장자 제외)을 사용하여 output 폴더에 저장
     document_name = os.path.splitext(os.path.basename(input_path))[0]
-    table_caption_regions = save_regions_as_pdf(doc, table_caption_regions, document_name, drawn_table_regions)
-    page_caption_matching = save_cluster_regions_as_pdf(doc, page_caption_matching, document_name)
+    if doc_key is None:
+        doc_key = document_key(input_path)
+    with profiler.stage("11.regions"):
+        region_writer = RegionWriter(doc, document_name, mode=region_mode, doc_key=doc_key, thumbnails=thumbnails)
+        table_caption_regions = save_regions_as_pdf(doc, state.table_caption_regions, document_name, state.drawn_table_regions, writer=region_writer)
+        page_caption_matching = save_cluster_regions_as_pdf(doc, state.page_caption_matching, document_name, writer=region_writer)
+        region_writer.close()
 
-    # ── 12. 매칭 결과 시각화: PDF에 클러스터 영역 및 캡션 라벨 표시 ──
-    for page in doc:
-        matching = page_caption_matching.get(page.number, {})
-        for cap_label, match_data in matching.items():
-            # match_data: (클러스터 사각형, p_cluster, p_cap, 거리)
-            cluster_rect = match_data[0]
-            page.draw_rect(cluster_rect, (1,0,1), width=5)
-            page.insert_text((cluster_rect.x0, cluster_rect.y0 - 10), cap_label, color=(1,0,1), fontsize=12)
-    
-    # ── 13. pending 리스트에 저장된 그리기 작업 최종 수행 ──
-    for (page_num, rect, color, width) in pending_rect_draws:
-        doc[page_num].draw_rect(rect, color=color, width=width)
-    for (page_num, rect, color, width) in pending_main_text_rect_draws:
-        doc[page_num].draw_rect(rect, color=color, width=width)
-    for (page_num, text, pos, color, fontsize) in pending_text_inserts:
-        doc[page_num].insert_text(pos, text, color=color, fontsize=fontsize)
-    for (page_num, p1, p2, color, width) in pending_line_draws:
-        doc[page_num].draw_line(p1, p2, color=color, width=width)
-    
-    doc.save(output_path)
-    doc.close()
+    # ── 12~13. 매칭 결과 및 pending 그리기 작업 수행 ──
+    with profiler.stage("12-13.annotate"):
+        renderer.render(doc, state)
+
+    with profiler.stage("save"):
+        annotated = renderer.save(doc, output_path)
+        if PRUNE_NEIGHBOURS is not None:
+            annotated.append(write_prune_report(output_path, os.path.basename(input_path), doc.page_count, state.skipped_pages))
+        doc.close()
     
     # ── 최종 SQL 저장: PDF 처리 후 모든 결과 정보를 MySQL 데이터베이스에 저장 ──
-    save_to_sql(os.path.basename(input_path), table_caption_regions, figure_caption_regions, drawn_table_regions, page_caption_matching)
+    with profiler.stage("sql"):
+        if sink is None:
+            save_to_sql(os.path.basename(input_path), table_caption_regions, state.figure_caption_regions, state.drawn_table_regions, page_caption_matching)
+        else:
+            sink.write(os.path.basename(input_path), table_caption_regions, state.figure_caption_regions, state.drawn_table_regions, page_caption_matching)
+    print(f"Processed and saved: {os.path.basename(input_path)}")
+    return annotated + region_writer.written
+
+# ── 스트리밍 처리: 두 번의 패스로 페이지 단위 처리 ──
+def scan_page(page):
+    """
+    1~4단계만 수행하여 5단계(컬럼 선택)에 넘길 본문 블록과 캡션 후보 페이지 여부를 구합니다.
+    - 반환값: ([(페이지 번호, 사각형, None)], 캡션 후보 페이지 여부)
+    """
+    state = PipelineState()
+    detect_captions(state, page)
+    is_candidate = is_caption_page(state, page)
+    detect_table_regions(state, page, state.global_main_blocks)
+    column_blocks = [(pn, rect, None) for pn, rect, _ in filter_table_blocks(state, state.global_main_blocks)]
+    return column_blocks, is_candidate
+
+def process_page(page, entire_col_rect, marks, skip=False, profiler=NULL_PROFILER):
+    """
+    페이지 하나에 대해 1~10단계를 수행하고 그 페이지만 담긴 PipelineState를 반환합니다. (스트리밍/샤드 처리용)
+    - entire_col_rect, marks: 1차 패스(5단계)에서 구한 문서 단위 본문 컬럼 영역과 이 페이지의 컬럼 블록 표시
+    - skip: True이면 페이지 가지치기로 6~10단계를 건너뜁니다.
+    """
+    state = PipelineState(entire_col_rect)
+    with profiler.stage("1.captions", page.number):
+        detect_captions(state, page)
+    with profiler.stage("2-3.tables", page.number):
+        detect_table_regions(state, page, state.global_main_blocks)
+    with profiler.stage("4.filter_tables", page.number):
+        filtered_blocks = filter_table_blocks(state, state.global_main_blocks)
+    for page_num, rect, color in marks:
+        state.mark_main_text(page_num, rect, color)
+    if skip:
+        state.skipped_pages.append(page.number)
+        profiler.count("pruned", 1, page.number)
+        return state
+    with profiler.stage("6.cluster_graphics", page.number):
+        cluster_page_graphics(state, page)
+    with profiler.stage("7.recaption", page.number):
+        redetect_cluster_captions(state, page, filtered_blocks)
+    with profiler.stage("8.cluster_text", page.number):
+        cluster_page_text(state, page)
+    with profiler.stage("9.match", page.number):
+        match_page_captions(state, page)
+    with profiler.stage("10.merge_unmatched", page.number):
+        merge_unmatched_clusters(state, page)
+    profiler.count_page(state, page)
+    return state
+
+def scan_text_columns(doc, profiler=NULL_PROFILER):
+    """
+    스트리밍 1차 패스: 페이지를 하나씩 읽어 1~4단계만 수행하고, 문서 단위 통계인 본문 컬럼을 계산합니다.
+    - 페이지별 상태와 PageData는 바로 버리고, 컬럼 선택에 필요한 (페이지 번호, 사각형)만 유지합니다.
+    - 페이지 가지치기용 캡션 후보 페이지(is_caption_page)도 함께 구합니다.
+    - 반환값: (entire_col_rect, {페이지 번호: [(페이지 번호, 사각형, 컬럼 색상)]}, [캡션 후보 페이지 번호])
+    """
+    image_digests = {}
+    column_blocks = []
+    caption_pages = []
+    for page in doc:
+        with profiler.stage("scan", page.number):
+            page_blocks, is_candidate = scan_page(PageData(page, image_digests))
+            column_blocks.extend(page_blocks)
+            if is_candidate:
+                caption_pages.append(page.number)
+    with profiler.stage("5.columns"):
+        entire_col_rect, marks = select_text_columns(column_blocks)
+    return entire_col_rect, group_by_page(marks), caption_pages
+
+def iter_pdf_pages(input_path, output_path, region_mode="files", sink=None, doc_key=None, profiler=None,
+                   annotation_mode="pdf", save_mode="full", thumbnails=None):
+    """
+    process_pdf의 스트리밍 버전. 페이지 단위 결과를 차례로 반환(yield)하는 제너레이터입니다.
+    - 1차 패스(scan_text_columns)에서 entire_col_rect 등 문서 단위 통계를 구하고,
+      2차 패스에서 페이지마다 1~10단계를 수행한 뒤 영역 PDF를 출력하고 주석을 그립니다.
+    - 페이지별 중간 결과는 해당 페이지 처리가 끝나면 버리므로, 메모리 사용량은 가장 큰 페이지에 비례합니다.
+      (문서 전체에 대해 유지하는 것은 DB 저장용 결과 레코드뿐)
+    - 각 페이지 결과: {"page", "table_captions", "figure_captions", "table_regions", "matches", "skipped"}
+      (캡션/테이블 영역은 RegionStore, matches는 {캡션 라벨: MatchRecord}, skipped는 페이지 가지치기로 6~10단계를 건너뛰었는지 여부)
+    - 모든 페이지를 소비하면 주석 PDF를 저장하고 결과를 sink(없으면 save_to_sql)에 기록하며,
+      제너레이터의 반환값(StopIteration.value)은 process_pdf와 같은 출력 파일 경로 리스트입니다.
+    - 일괄 처리와 영역/매칭 결과는 같고, 결과 리스트의 순서만 페이지 순으로 정렬됩니다.
+    """
+    profiler = profiler or NULL_PROFILER
+    renderer = AnnotationRenderer(annotation_mode, save_mode)
+    with profiler.stage("open"):
+        doc = renderer.open_document(input_path, output_path)
+    entire_col_rect, marks_by_page, caption_pages = scan_text_columns(doc, profiler)
+    keep = None
+    if PRUNE_NEIGHBOURS is not None:
+        keep = pages_to_process(caption_pages, doc.page_count, PRUNE_NEIGHBOURS)
+    skipped_pages = []
+
+    document_name = os.path.splitext(os.path.basename(input_path))[0]
+    if doc_key is None:
+        doc_key = document_key(input_path)
+    region_writer = RegionWriter(doc, document_name, mode=region_mode, doc_key=doc_key, thumbnails=thumbnails)
+
+    table_caption_regions = RegionStore()
+    figure_caption_regions = RegionStore()
+    drawn_table_regions = RegionStore()
+    page_caption_matching = {}
+    image_digests = {}
+    for page_number in range(doc.page_count):
+        with profiler.stage("0.load_page", page_number):
+            page = PageData(doc[page_number], image_digests)
+        skipped = keep is not None and page_number not in keep
+        state = process_page(page, entire_col_rect, marks_by_page.get(page_number, []), skipped, profiler)
+        skipped_pages.extend(state.skipped_pages)
+
+        # 주석을 그리기 전에 이 페이지의 영역 PDF를 먼저 출력
+        with profiler.stage("11.regions", page_number):
+            page_tables = save_regions_as_pdf(doc, state.table_caption_regions, document_name, state.drawn_table_regions, writer=region_writer)
+            page_matching = save_cluster_regions_as_pdf(doc, state.page_caption_matching, document_name, writer=region_writer)
+            region_writer.flush()
+        with profiler.stage("12-13.annotate", page_number):
+            renderer.render(doc, state)
+        del page
+
+        table_caption_regions.extend(page_tables)
+        figure_caption_regions.extend(state.figure_caption_regions)
+        drawn_table_regions.extend(state.drawn_table_regions)
+        page_caption_matching.update(page_matching)
+        yield {
+            "page": page_number,
+            "table_captions": page_tables,
+            "figure_captions": state.figure_caption_regions,
+            "table_regions": state.drawn_table_regions,
+            "matches": page_matching.get(page_number, {}),
+            "skipped": skipped,
+        }
+
+    with profiler.stage("11.regions"):
+        region_writer.close()
+    with profiler.stage("save"):
+        annotated = renderer.save(doc, output_path)
+        if keep is not None:
+            annotated.append(write_prune_report(output_path, os.path.basename(input_path), doc.page_count, skipped_pages))
+        doc.close()
+
+    with profiler.stage("sql"):
+        if sink is None:
+            save_to_sql(os.path.basename(input_path), table_caption_regions, figure_caption_regions, drawn_table_regions, page_caption_matching)
+        else:
+            sink.write(os.path.basename(input_path), table_caption_regions, figure_caption_regions, drawn_table_regions, page_caption_matching)
     print(f"Processed and saved: {os.path.basename(input_path)}")
+    return annotated + region_writer.written
+
+# ── 샤드 처리: 문서 하나의 페이지 범위를 여러 프로세스로 나눠 처리 ──
+# fitz.Document는 스레드/프로세스 간에 공유할 수 없으므로, 워커 프로세스마다 파일을 따로 열어 자신의 페이지 범위만 처리합니다.
+# - 1차: 워커가 페이지별 1~4단계(scan_page)를 수행하고, 코디네이터가 모아서 5단계(본문 컬럼 선택)를 한 번 수행
+# - 2차: 워커가 페이지별 1~10단계(process_page)를 수행하고, 코디네이터가 샤드 결과를 페이지 순으로 합친 뒤
+#   11단계(영역 PDF), 12~13단계(주석), 저장, DB 기록을 한 번만 수행 (finish_document)
+# - 워커는 fork 시점의 모듈 설정(캡션 검출기, 페이지 가지치기 등)을 물려받습니다.
+
+def shard_ranges(page_count, shards, chunks_per_shard=4):
+    """
+    페이지 범위를 연속된 (시작, 끝) 구간들로 나눕니다.
+    - 그림이 많은 페이지가 한쪽에 몰려도 부하가 고르게 나뉘도록 워커 수보다 잘게(chunks_per_shard배) 나눕니다.
+    """
+    chunks = max(1, min(page_count, shards * chunks_per_shard))
+    bounds = [page_count * i // chunks for i in range(chunks + 1)]
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if start < stop]
+
+def _shard_scan(input_path, start, stop):
+    """샤드 워커: 페이지 [start, stop)의 1~4단계. 반환값: (본문 블록 리스트, 캡션 후보 페이지 번호 리스트)"""
+    doc = fitz.open(input_path)
+    try:
+        image_digests = {}
+        column_blocks = []
+        caption_pages = []
+        for page_number in range(start, stop):
+            page_blocks, is_candidate = scan_page(PageData(doc[page_number], image_digests))
+            column_blocks.extend(page_blocks)
+            if is_candidate:
+                caption_pages.append(page_number)
+        return column_blocks, caption_pages
+    finally:
+        doc.close()
+
+def _shard_pages(input_path, start, stop, entire_col_rect, marks_by_page, keep):
+    """샤드 워커: 페이지 [start, stop)의 1~10단계. 반환값: 페이지 결과를 합친 PipelineState"""
+    doc = fitz.open(input_path)
+    try:
+        image_digests = {}
+        shard_state = PipelineState(entire_col_rect)
+        for page_number in range(start, stop):
+            page = PageData(doc[page_number], image_digests)
+            skip = keep is not None and page_number not in keep
+            shard_state.merge(process_page(page, entire_col_rect, marks_by_page.get(page_number, []), skip))
+        return shard_state
+    finally:
+        doc.close()
+
+def process_pdf_sharded(input_path, output_path, shards, region_mode="files", sink=None, doc_key=None, profiler=None,
+                        annotation_mode="pdf", save_mode="full", thumbnails=None):
+    """
+    process_pdf의 샤드 버전. 문서 하나의 페이지를 shards개 워커 프로세스로 나눠 처리합니다.
+    - 페이지 수가 매우 많은 문서 하나가 전체 처리 시간을 좌우할 때 사용합니다.
+    - 영역/매칭 결과는 일괄 처리와 같습니다. (페이지별 처리 결과는 스트리밍 처리와 같은 방식으로 구함)
+    - profiler에는 코디네이터 단계(scan, 5.columns, pages, 11.regions 등)만 기록되며, 워커의 페이지별 시간은 남지 않습니다.
+    - 반환값: process_pdf와 같은 출력 파일 경로 리스트
+    """
+    profiler = profiler or NULL_PROFILER
+    renderer = AnnotationRenderer(annotation_mode, save_mode)
+    with profiler.stage("open"):
+        doc = renderer.open_document(input_path, output_path)
+    ranges = shard_ranges(doc.page_count, shards)
+    # 예외(제한 시간 초과 등)로 빠져나가면 with 블록이 워커를 바로 종료(terminate)합니다.
+    with multiprocessing.Pool(processes=min(shards, len(ranges))) as pool:
+        # ── 1차: 페이지별 1~4단계 (워커) -> 5. 본문 컬럼 선택 (코디네이터) ──
+        with profiler.stage("scan"):
+            scans = pool.starmap(_shard_scan, [(input_path, start, stop) for start, stop in ranges])
+        with profiler.stage("5.columns"):
+            column_blocks = [entry for blocks, _ in scans for entry in blocks]
+            entire_col_rect, marks = select_text_columns(column_blocks)
+            marks_by_page = group_by_page(marks)
+            keep = None
+            if PRUNE_NEIGHBOURS is not None:
+                keep = pages_to_process([pn for _, pages in scans for pn in pages], doc.page_count, PRUNE_NEIGHBOURS)
+
+        # ── 2차: 페이지별 1~10단계 (워커) ──
+        with profiler.stage("pages"):
+            jobs = [(input_path, start, stop, entire_col_rect,
+                     {pn: marks_by_page[pn] for pn in range(start, stop) if pn in marks_by_page}, keep)
+                    for start, stop in ranges]
+            shard_states = pool.starmap(_shard_pages, jobs)
+
+    with profiler.stage("merge"):
+        state = PipelineState(entire_col_rect)
+        for shard_state in shard_states:
+            state.merge(shard_state)
+    return finish_document(doc, state, renderer, input_path, output_path, region_mode, sink, doc_key, profiler, thumbnails)
+
+# ── 라이브러리 API: 메모리 입력과 구조화된 결과 ──
+@dataclass(frozen=True)
+class Caption:
+    """검출된 캡션. kind는 "figure" 또는 "table", rect는 (x0, y0, x1, y1)."""
+    label: str
+    kind: str
+    page: int
+    rect: tuple
+    text: str
+    region_path: str = None  # 테이블 캡션의 영역 PDF 경로 (영역 출력을 켠 경우)
+
+@dataclass(frozen=True)
+class TableRegion:
+    """가로선/컬럼 정보로 결정된 테이블 영역."""
+    label: str
+    page: int
+    rect: tuple
+
+@dataclass(frozen=True)
+class FigureCluster:
+    """이미지/드로잉/텍스트 클러스터링으로 찾은 비텍스트 영역 (매칭 여부와 무관)."""
+    page: int
+    rect: tuple
+
+@dataclass(frozen=True)
+class Match:
+    """피규어 캡션과 매칭된 클러스터 영역. 10단계에서 병합된 영역은 distance가 0입니다."""
+    label: str
+    page: int
+    rect: tuple
+    distance: float
+    region_path: str = None  # 영역 PDF 경로 (영역 출력을 켠 경우)
+
+@dataclass
+class ExtractionResult:
+    """Extractor.extract의 결과."""
+    document: str
+    page_count: int
+    captions: list
+    table_regions: list
+    clusters: list
+    matches: list
+    annotated_pdf: bytes = None  # annotate=True이고 output_path가 없을 때의 주석 PDF
+    overlay: dict = None  # annotation_mode가 json / svg이고 output_path가 없을 때의 주석 오버레이
+    regions: dict = field(default_factory=dict)  # regions="memory"일 때 {경로: 영역 PDF bytes}
+    skipped_pages: list = field(default_factory=list)  # 페이지 가지치기로 6~10단계를 건너뛴 페이지 번호
+    outputs: list = field(default_factory=list)  # 디스크에 기록된 파일 경로
+
+def _rect_tuple(rect):
+    return (rect.x0, rect.y0, rect.x1, rect.y1)
+
+class Extractor:
+    """
+    process_pdf를 서비스 등에 내장하기 위한 라이브러리 API입니다.
+    - 입력은 PDF bytes, read()를 가진 파일 객체, 또는 파일 경로를 받으며 메모리에서 바로 엽니다. (fitz.open(stream=...))
+    - 결과는 ExtractionResult(Caption, TableRegion, FigureCluster, Match 리스트)로 반환합니다.
+    - 부수 효과는 모두 선택 사항이며 기본값은 전부 꺼져 있어 디스크나 DB에 접근하지 않습니다.
+      - annotate: 주석(캡션/테이블/클러스터 표시) PDF를 만듭니다. output_path가 없으면 bytes로 반환.
+        annotation_mode가 "json" / "svg"이면 PDF 대신 오버레이를 만들고, output_path가 없으면 dict로 반환.
+      - regions: 영역 PDF 출력 방식 (None: 출력 안 함, "memory": bytes로 반환, "files" / "bundle": RegionWriter 참고)
+      - sink: write() 메서드를 가진 결과 저장소 (SQLSink 등)
+      - thumbnails: regions와 함께 출력할 영역 썸네일 옵션 dict (ThumbnailWriter 참고). memory 모드이면 result.regions에 포함.
+
+    사용 예:
+        result = Extractor(annotate=True, regions="memory").extract(upload_bytes, name="paper.pdf")
+        for match in result.matches:
+            png_source = result.regions[match.region_path]
+    """
+    def __init__(self, annotate=False, regions=None, sink=None, annotation_mode="pdf", thumbnails=None):
+        if regions is not None and regions not in RegionWriter.MODES:
+            raise ValueError(f"unknown region output mode: {regions}")
+        if annotation_mode not in AnnotationRenderer.MODES:
+            raise ValueError(f"unknown annotation mode: {annotation_mode}")
+        self.annotate = annotate
+        self.annotation_mode = annotation_mode
+        self.thumbnails = thumbnails
+        self.regions = regions
+        self.sink = sink
+
+    @staticmethod
+    def _open(source, name):
+        """입력을 열어 (문서, 문서 이름, 문서 키 계산용 원본)을 반환합니다."""
+        if isinstance(source, (str, os.PathLike)):
+            path = os.fspath(source)
+            return fitz.open(path), name or os.path.basename(path), path
+        data = source.read() if hasattr(source, "read") else bytes(source)
+        name = name or os.path.basename(getattr(source, "name", "") or "") or "document.pdf"
+        return fitz.open(stream=data, filetype="pdf"), name, data
+
+    def extract(self, source, name=None, output_path=None, profiler=None):
+        """
+        PDF 하나를 처리하여 ExtractionResult를 반환합니다.
+        - name: 결과와 DB에 기록할 문서 이름 (기본값: 파일 이름 또는 "document.pdf")
+        - output_path: annotate=True일 때 주석 PDF를 저장할 경로 (없으면 result.annotated_pdf)
+        - profiler: StageProfiler (선택)
+        """
+        profiler = profiler or NULL_PROFILER
+        with profiler.stage("open"):
+            doc, name, key_source = self._open(source, name)
+        try:
+            state = run_pipeline(doc, profiler)
+            result = ExtractionResult(document=name, page_count=doc.page_count, captions=[],
+                                      table_regions=[], clusters=[], matches=[], skipped_pages=list(state.skipped_pages))
+
+            table_caption_regions = state.table_caption_regions
+            page_caption_matching = state.page_caption_matching
+            if self.regions is not None:
+                document_name = os.path.splitext(name)[0]
+                with profiler.stage("11.regions"):
+                    writer = RegionWriter(doc, document_name, mode=self.regions, doc_key=document_key(key_source),
+                                          thumbnails=self.thumbnails)
+                    table_caption_regions = save_regions_as_pdf(doc, table_caption_regions, document_name, state.drawn_table_regions, writer=writer)
+                    page_caption_matching = save_cluster_regions_as_pdf(doc, page_caption_matching, document_name, writer=writer)
+                    writer.close()
+                result.regions = writer.buffers
+                result.outputs.extend(writer.written)
+
+            for region in table_caption_regions:
+                result.captions.append(Caption(region.label, region.kind, region.page, region.coords, region.text,
+                                               region.region_path))
+            for region in state.figure_caption_regions:
+                result.captions.append(Caption(region.label, region.kind, region.page, region.coords, region.text))
+            for table in state.drawn_table_regions:
+                result.table_regions.append(TableRegion(table.label, table.page, table.coords))
+            for page_number, clusters in state.merged_clusters_by_page.items():
+                result.clusters.extend(FigureCluster(page_number, _rect_tuple(rect)) for rect in clusters)
+            for page_number, matching in page_caption_matching.items():
+                for cap_label, match in matching.items():
+                    result.matches.append(Match(cap_label, page_number, match.coords, float(match.distance),
+                                                match.region_path))
+
+            if self.annotate:
+                renderer = AnnotationRenderer(self.annotation_mode)
+                with profiler.stage("12-13.annotate"):
+                    renderer.render(doc, state)
+                with profiler.stage("save"):
+                    if output_path:
+                        result.outputs[:0] = renderer.save(doc, output_path)
+                    elif self.annotation_mode == "pdf":
+                        result.annotated_pdf = doc.tobytes()
+                    else:
+                        result.overlay = renderer.overlay(doc)
+            if self.sink is not None:
+                with profiler.stage("sql"):
+                    self.sink.write(name, table_caption_regions, state.figure_caption_regions, state.drawn_table_regions, page_caption_matching)
+        finally:
+            doc.close()
+        return result
+
+# ── 실행 캐시: 내용 해시 기반 증분 처리 ──
+def pipeline_fingerprint():
+    """추출 결과에 영향을 주는 파이프라인 파라미터를 하나의 문자열로 직렬화합니다."""
+    return json.dumps({
+        "version": PIPELINE_VERSION,
+        "group_tolerance": GROUP_TOLERANCE,
+        "cluster_threshold": CLUSTER_THRESHOLD,
+        "min_cluster_size": MIN_CLUSTER_SIZE,
+        "match_k": MATCH_K,
+        "match_max_distance": MATCH_MAX_DISTANCE,
+        "caption_pattern": CAPTION_DETECTOR.signature(),
+        "prune_neighbours": PRUNE_NEIGHBOURS,
+    }, sort_keys=True)
+
+def document_key(source):
+    """
+    PDF 내용과 파이프라인 파라미터로 정해지는 문서 키(SHA-256)를 계산합니다.
+    - source: PDF 파일 경로 또는 PDF 내용(bytes)
+    """
+    h = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        h.update(source)
+    else:
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    h.update(pipeline_fingerprint().encode("utf-8"))
+    return h.hexdigest()
+
+class RunCache:
+    """
+    파일별 마지막 처리 결과(문서 키, 출력 파일 목록)를 기록하는 실행 캐시입니다.
+    - 추가 전용(append-only) JSON Lines 파일에 기록하며, 같은 파일의 기록은 마지막 것이 유효합니다.
+    - 문서 키가 같고 출력 파일이 모두 남아 있으면 변경되지 않은 문서로 보고 처리를 건너뜁니다.
+    - 변경된 문서를 다시 처리하면, 새 출력에 포함되지 않은 이전 출력 파일을 삭제합니다.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()  # watch.py 데몬의 워커 스레드들이 함께 갱신
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["file"]] = entry
+
+    def is_current(self, file_name, key):
+        entry = self.entries.get(file_name)
+        return (entry is not None and entry["key"] == key
+                and all(os.path.exists(path) for path in entry["outputs"]))
+
+    def update(self, file_name, key, outputs):
+        with self.lock:
+            previous = self.entries.get(file_name)
+            if previous is not None:
+                for path in set(previous["outputs"]) - set(outputs):
+                    if os.path.exists(path):
+                        os.remove(path)
+            entry = {"file": file_name, "key": key, "outputs": list(outputs)}
+            self.entries[file_name] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+# ── 배치 처리: 문서 단위 프로세스 격리 ──
+class _RowCollector:
+    """워커 프로세스에서 DB에 직접 저장하지 않고 저장할 행만 모아 코디네이터로 넘기기 위한 저장소."""
+    def __init__(self):
+        self.rows = None
+
+    def write(self, *args):
+        self.rows = build_sql_rows(*args)
+
+def _batch_worker(input_path, output_path, timeout, result_queue, region_mode="files", collect_rows=False, doc_key=None,
+                  streaming=False, profile=False, cprofile_path=None, annotation_mode="pdf", save_mode="full",
+                  thumbnails=None, shards=1):
+    """
+    배치 모드의 워커 프로세스 진입점입니다.
+    - 각 워커는 자신의 프로세스 안에서 process_pdf를 호출하므로 fitz.Document, 출력 경로,
+      DB 연결을 모두 독립적으로 가집니다.
+    - timeout(초)이 주어지면 SIGALRM으로 처리 시간을 제한합니다. (MuPDF 내부 호출 중에는
+      코디네이터가 마감 시간 이후 프로세스를 강제 종료합니다.)
+    - collect_rows가 True이면 DB에 직접 저장하지 않고, 저장할 행을 결과와 함께 코디네이터로 보냅니다.
+    - profile이 True이면 StageProfiler 레코드를, cprofile_path가 주어지면 cProfile 통계를 해당 경로에 기록합니다.
+    - 결과는 (입력 경로, 상태, 오류 메시지, 소요 시간, 행 데이터, 출력 파일 목록, 프로파일 레코드) 형태로
+      result_queue에 전달됩니다.
+    """
+    def on_timeout(signum, frame):
+        raise TimeoutError(f"timed out after {timeout}s")
+
+    start = time.perf_counter()
+    collector = _RowCollector() if collect_rows else None
+    profiler = StageProfiler(os.path.basename(input_path)) if profile else None
+    stats = cProfile.Profile() if cprofile_path else None
+    outputs = []
+    if timeout and hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, on_timeout)
+        signal.alarm(int(math.ceil(timeout)))
+    try:
+        if stats is not None:
+            stats.enable()
+        outputs = process_pdf(input_path, output_path, region_mode=region_mode, sink=collector, doc_key=doc_key,
+                              streaming=streaming, profiler=profiler, annotation_mode=annotation_mode,
+                              save_mode=save_mode, thumbnails=thumbnails, shards=shards)
+        status, error = "ok", None
+    except TimeoutError as e:
+        status, error = "timeout", str(e)
+    except Exception as e:
+        status, error = "error", f"{type(e).__name__}: {e}"
+    finally:
+        if timeout and hasattr(signal, "SIGALRM"):
+            signal.alarm(0)
+        if stats is not None:
+            stats.disable()
+            stats.dump_stats(cprofile_path)
+    rows = collector.rows if collector is not None and status == "ok" else None
+    records = profiler.records() if profiler is not None else None
+    result_queue.put((input_path, status, error, time.perf_counter() - start, rows, outputs, records))
+
+class IsolatedRun:
+    """
+    문서 하나를 별도 프로세스(_batch_worker)에서 처리하는 실행 단위입니다. (run_batch / run_isolated / watch.py 공용)
+    - start() 후 poll()을 주기적으로 호출하며, 끝나면 (상태, 오류 메시지, 소요 시간, 행 데이터, 출력 파일 목록,
+      프로파일 레코드)를, 아직 실행 중이면 None을 반환합니다.
+    - timeout이 지나도 SIGALRM이 전달되지 못하면(네이티브 코드 실행 중) 마감 5초 뒤 프로세스를 강제 종료하고
+      timeout으로, 결과 없이 종료된 프로세스는 crashed로 반환합니다. 두 경우 출력 파일 목록은 None입니다.
+    - options: _batch_worker의 나머지 인자 (region_mode, streaming, profile, cprofile_path, annotation_mode,
+      save_mode, thumbnails, shards)
+    """
+    def __init__(self, input_path, output_path, doc_key, timeout=None, collect_rows=False, **options):
+        self.input_path = input_path
+        self.timeout = timeout
+        self.result_queue = multiprocessing.Queue()
+        shards = options.get("shards", 1)
+        self.process = multiprocessing.Process(
+            target=_batch_worker,
+            args=(input_path, output_path, timeout, self.result_queue),
+            kwargs=dict(options, collect_rows=collect_rows, doc_key=doc_key),
+            # daemon 프로세스는 자식 프로세스를 만들 수 없으므로 샤드 처리 시에는 일반 프로세스로 실행
+            # (강제 종료되면 샤드 워커는 작업 큐가 끊겨 처리 중인 구간을 마친 뒤 종료)
+            daemon=shards <= 1,
+        )
+        self.started = None
+
+    def start(self):
+        self.process.start()
+        self.started = time.perf_counter()
+        return self
+
+    def _result(self, block_timeout=None):
+        if block_timeout is None:
+            _, status, error, wall_time, rows, outputs, records = self.result_queue.get_nowait()
+        else:
+            _, status, error, wall_time, rows, outputs, records = self.result_queue.get(timeout=block_timeout)
+        self.process.join()
+        return status, error, wall_time, rows, outputs, records
+
+    def poll(self):
+        try:
+            return self._result()
+        except queue.Empty:
+            pass
+        elapsed = time.perf_counter() - self.started
+        if self.timeout and elapsed > self.timeout + 5:
+            # SIGALRM이 전달되지 못한 경우(네이티브 코드 실행 중)의 강제 종료
+            self.process.terminate()
+            self.process.join()
+            return "timeout", f"killed after {self.timeout}s", elapsed, None, None, None
+        if not self.process.is_alive():
+            # 종료 직전에 보낸 결과가 아직 큐에 남아 있을 수 있으므로 한 번 더 확인
+            try:
+                return self._result(block_timeout=0.5)
+            except queue.Empty:
+                self.process.join()
+                return "crashed", f"exit code {self.process.exitcode}", elapsed, None, None, None
+        return None
+
+def run_isolated(input_path, output_path, timeout=None, cache=None, collect_rows=False, poll_interval=0.2, **options):
+    """
+    문서 하나를 별도 프로세스에서 처리하고 끝날 때까지 기다립니다. (블로킹, watch.py 데몬의 워커가 사용)
+    - cache: RunCache. 주어지면 내용과 파라미터가 같은 문서는 처리하지 않고 unchanged를 반환하며,
+      처리에 성공하면 캐시를 갱신합니다. (run_batch와 같은 동작)
+    - options: IsolatedRun 참고 (region_mode, streaming, annotation_mode, save_mode, thumbnails, shards 등)
+    - 반환값: (상태, 오류 메시지, 소요 시간, 행 데이터). 상태는 run_batch의 매니페스트와 같은 값입니다.
+    """
+    try:
+        doc_key = document_key(input_path)
+    except OSError as e:
+        return "error", f"{type(e).__name__}: {e}", 0.0, None
+    file_name = os.path.basename(input_path)
+    if cache is not None and cache.is_current(file_name, doc_key):
+        return "unchanged", None, 0.0, None
+    run = IsolatedRun(input_path, output_path, doc_key, timeout=timeout, collect_rows=collect_rows, **options).start()
+    result = run.poll()
+    while result is None:
+        time.sleep(poll_interval)
+        result = run.poll()
+    status, error, wall_time, rows, outputs, _ = result
+    if cache is not None and status == "ok":
+        cache.update(file_name, doc_key, outputs)
+    return status, error, wall_time, rows
+
+def run_batch(input_dir, output_dir, workers=None, timeout=None, manifest_path=None, region_mode="files", sink=None,
+              use_cache=True, streaming=False, profile_path=None, cprofile_top=0, annotation_mode="pdf", save_mode="full",
+              thumbnails=None, shards=1):
+    """
+    input_dir 내의 모든 PDF를 프로세스 풀로 병렬 처리합니다.
+    - workers: 동시에 실행할 워커 프로세스 수 (기본값: CPU 코어 수)
+    - timeout: 파일당 최대 처리 시간(초). 초과하면 워커를 종료하고 timeout으로 기록.
+    - 문서마다 별도의 프로세스를 사용하므로 손상된 PDF가 MuPDF 내부에서 비정상 종료되더라도
+      해당 파일만 실패로 기록되고 나머지 배치는 계속 진행됩니다.
+    - manifest_path: 파일별 상태(ok / error / timeout / crashed)와 소요 시간을
+      JSON Lines 형식으로 기록할 경로 (기본값: output_dir/manifest.jsonl)
+    - region_mode: 영역 PDF 출력 방식 (process_pdf 참고)
+    - sink: SQLSink. 주어지면 워커는 DB에 접속하지 않고, 코디네이터가 결과 행을 sink에 넘깁니다.
+      없으면 각 워커가 save_to_sql로 직접 저장합니다.
+    - use_cache: 실행 캐시(output_dir/run_cache.jsonl)를 사용하여 내용과 파라미터가 같은 문서는 건너뜁니다.
+      (상태: unchanged)
+    - streaming: 문서를 페이지 단위 스트리밍으로 처리 (process_pdf 참고)
+    - profile_path: 단계별/페이지별 프로파일 레코드(StageProfiler)를 JSON Lines로 기록할 경로
+    - cprofile_top: 0보다 크면 모든 문서를 cProfile로 측정하고, 처리 시간이 가장 긴 N개 문서의
+      통계만 output_dir/profiles/<파일명>.prof로 남깁니다. (pstats / snakeviz 등으로 확인)
+    - annotation_mode, save_mode: 주석 출력 형식과 PDF 저장 방식 (AnnotationRenderer 참고)
+    - thumbnails: 영역 썸네일 옵션 dict (ThumbnailWriter 참고)
+    - shards: 2 이상이면 각 문서의 페이지를 shards개 프로세스로 나눠 처리 (process_pdf_sharded).
+      문서마다 workers x shards개의 프로세스가 동시에 실행될 수 있으므로 큰 문서 위주일 때는 workers를 줄입니다.
+    - 반환값: 매니페스트 레코드 리스트
+    """
+    workers = workers or os.cpu_count() or 1
+    if manifest_path is None:
+        manifest_path = os.path.join(output_dir, "manifest.jsonl")
+    os.makedirs(output_dir, exist_ok=True)
+
+    pending = deque(
+        (os.path.join(input_dir, filename), os.path.join(output_dir, filename))
+        for filename in sorted(os.listdir(input_dir))
+        if filename.lower().endswith(".pdf")
+    )
+    running = {}  # 입력 경로 -> IsolatedRun
+    records = []
+    cache = RunCache(os.path.join(output_dir, "run_cache.jsonl")) if use_cache else None
+    doc_keys = {}
+    profile_dir = os.path.join(output_dir, "profiles")
+    if cprofile_top > 0:
+        os.makedirs(profile_dir, exist_ok=True)
+    slowest = []  # (소요 시간, cProfile 통계 경로) - 처리 시간이 긴 순으로 최대 cprofile_top개 유지
+
+    def cprofile_path(input_path):
+        return os.path.join(profile_dir, os.path.basename(input_path) + ".prof")
+
+    with open(manifest_path, "a", encoding="utf-8") as manifest:
+        def record(input_path, status, error, wall_time):
+            entry = {
+                "file": os.path.basename(input_path),
+                "status": status,
+                "error": error,
+                "wall_time": round(wall_time, 3),
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            records.append(entry)
+            manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            manifest.flush()
+            if status == "ok":
+                print(f"Processed: {entry['file']} ({entry['wall_time']}s)")
+            elif status == "unchanged":
+                print(f"Unchanged: {entry['file']}")
+            else:
+                print(f"Skipped: {entry['file']} [{status}] {error}")
+
+        def keep_if_slowest(input_path, wall_time):
+            stats_path = cprofile_path(input_path)
+            if not os.path.exists(stats_path):
+                return
+            slowest.append((wall_time, stats_path))
+            slowest.sort(key=lambda item: item[0], reverse=True)
+            for _, dropped in slowest[cprofile_top:]:
+                os.remove(dropped)
+            del slowest[cprofile_top:]
+
+        def finish(input_path, status, error, wall_time, rows, outputs, profile_records):
+            if rows is not None and sink is not None:
+                sink.submit(rows)
+            if profile_records and profile_path:
+                write_profile_records(profile_path, profile_records)
+            if cprofile_top > 0 and outputs is not None:
+                # 강제 종료 / 비정상 종료된 워커(outputs가 None)는 cProfile 통계를 남기지 못함
+                keep_if_slowest(input_path, wall_time)
+            if cache is not None and status == "ok":
+                cache.update(os.path.basename(input_path), doc_keys[input_path], outputs)
+            record(input_path, status, error, wall_time)
+
+        while pending or running:
+            while pending and len(running) < workers:
+                input_path, output_path = pending.popleft()
+                try:
+                    doc_keys[input_path] = document_key(input_path)
+                except OSError as e:
+                    record(input_path, "error", f"{type(e).__name__}: {e}", 0.0)
+                    continue
+                if cache is not None and cache.is_current(os.path.basename(input_path), doc_keys[input_path]):
+                    record(input_path, "unchanged", None, 0.0)
+                    continue
+                running[input_path] = IsolatedRun(
+                    input_path, output_path, doc_keys[input_path], timeout=timeout, collect_rows=sink is not None,
+                    region_mode=region_mode, streaming=streaming, profile=profile_path is not None,
+                    cprofile_path=cprofile_path(input_path) if cprofile_top > 0 else None,
+                    annotation_mode=annotation_mode, save_mode=save_mode, thumbnails=thumbnails, shards=shards,
+                ).start()
+
+            finished = False
+            for input_path, run in list(running.items()):
+                result = run.poll()
+                if result is not None:
+                    running.pop(input_path)
+                    finish(input_path, *result)
+                    finished = True
+            if not finished:
+                time.sleep(0.1)
+
+    return records
 
 def main():
     """
     main 함수:
-      - 지정한 input 디렉터리 내의 모든 PDF 파일을 순차적으로 처리하여 output 디렉터리에 저장.
-      - 각 파일 처리 후 로그 출력.
+      - 지정한 input 디렉터리 내의 모든 PDF 파일을 프로세스 풀로 병렬 처리하여 output 디렉터리에 저장.
+      - 파일별 처리 결과(상태, 소요 시간)는 매니페스트 파일에 기록.
     """
-    input_dir = "data"
-    output_dir = "clustered"
-    os.makedirs(output_dir, exist_ok=True)
-    for filename in os.listdir(input_dir):
-        if filename.lower().endswith(".pdf"):
-            input_path = os.path.join(input_dir, filename)
-            output_path = os.path.join(output_dir, filename)
-            process_pdf(input_path, output_path)
-            print(f"Processed: {filename}")
-    print("모든 파일 처리 완료!")
+    parser = argparse.ArgumentParser(description="PDF 캡션/클러스터 추출 배치 실행")
+    parser.add_argument("--input-dir", default="data", help="원본 PDF 디렉터리")
+    parser.add_argument("--output-dir", default="clustered", help="주석 처리된 PDF 저장 디렉터리")
+    parser.add_argument("--workers", type=int, default=None, help="워커 프로세스 수 (기본값: CPU 코어 수)")
+    parser.add_argument("--timeout", type=float, default=None, help="파일당 최대 처리 시간(초)")
+    parser.add_argument("--manifest", default=None, help="결과 매니페스트 경로 (기본값: <output-dir>/manifest.jsonl)")
+    parser.add_argument("--commit-every", type=int, default=20, help="N개 문서마다 한 번 DB 커밋")
+    parser.add_argument("--spill", default=None,
+                        help="DB 저장이 밀리거나 실패할 때 행을 기록할 파일 (기본값: <output-dir>/sql_spill.jsonl)")
+    parser.add_argument("--export-dir", default=None,
+                        help="DB 대신 결과를 테이블별 컬럼형 파일(<dir>/<테이블>/run=<실행 ID>/)로 내보낼 디렉터리")
+    parser.add_argument("--export-format", choices=ColumnarSink.FORMATS, default="auto",
+                        help="내보내기 형식: parquet(pyarrow 필요) / csv(gzip 압축 CSV) / auto(pyarrow가 있으면 parquet)")
+    parser.add_argument("--force", action="store_true", help="실행 캐시를 무시하고 모든 파일을 다시 처리")
+    parser.add_argument("--region-mode", choices=RegionWriter.FILE_MODES, default="files",
+                        help="영역 PDF 출력 방식: files(영역별 파일) / bundle(문서당 하나의 PDF + 인덱스)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="페이지 단위 스트리밍 처리 (페이지 수가 많은 문서의 메모리 사용량 제한)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="문서 하나의 페이지를 N개 프로세스로 나눠 처리 (페이지 수가 매우 많은 문서용, --streaming보다 우선)")
+    parser.add_argument("--profile", default=None,
+                        help="단계별/페이지별 소요 시간과 객체 수를 JSON Lines로 기록할 경로")
+    parser.add_argument("--cprofile-top", type=int, default=0,
+                        help="처리 시간이 가장 긴 N개 문서의 cProfile 통계를 <output-dir>/profiles/에 저장")
+    parser.add_argument("--annotation-mode", choices=AnnotationRenderer.MODES, default="pdf",
+                        help="주석 출력 형식: pdf(주석 PDF) / json(오버레이 JSON) / svg(페이지별 오버레이 SVG)")
+    parser.add_argument("--save-mode", choices=AnnotationRenderer.SAVE_MODES, default="full",
+                        help="주석 PDF 저장 방식: full(전체 저장) / incremental(변경분만 덧붙임) / compact(정리 및 압축)")
+    parser.add_argument("--thumbnails", default=None,
+                        help="영역 썸네일 형식 (쉼표 구분: png,webp). 지정하면 output/<문서명>/thumbs/에 저장")
+    parser.add_argument("--thumbnail-dpi", default="150", help="썸네일 해상도 (쉼표 구분, 기본값: 150)")
+    parser.add_argument("--thumbnail-cache-mb", type=float, default=256,
+                        help="썸네일용 페이지 래스터 캐시 크기(MB, 워커당)")
+    parser.add_argument("--caption-languages", default=None,
+                        help=f"캡션 접두어 언어 (쉼표 구분, 기본값: {','.join(captions.DEFAULT_LANGUAGES)}, "
+                             f"사용 가능: {','.join(captions.CAPTION_LABELS)})")
+    parser.add_argument("--caption-config", default=None,
+                        help='캡션 검출 설정 JSON 경로 ({"languages": [...], "labels": {"figure": [...], "table": [...]}})')
+    parser.add_argument("--prune-pages", type=int, default=None, metavar="N",
+                        help="캡션 후보 페이지와 앞뒤 N쪽에서만 드로잉 추출/클러스터링/매칭 수행 (건너뛴 페이지는 <출력 이름>.pruned.json에 기록)")
+    args = parser.parse_args()
+
+    if args.caption_languages or args.caption_config:
+        configure_captions(args.caption_config, args.caption_languages.split(",") if args.caption_languages else None)
+    if args.prune_pages is not None:
+        if args.prune_pages < 0:
+            parser.error("--prune-pages는 0 이상이어야 합니다.")
+        configure_page_pruning(args.prune_pages)
+
+    thumbnails = None
+    if args.thumbnails:
+        thumbnails = {"formats": args.thumbnails.split(","), "dpis": [int(dpi) for dpi in args.thumbnail_dpi.split(",")],
+                      "cache_mb": args.thumbnail_cache_mb}
+        if "webp" in thumbnails["formats"] and Image is None:
+            parser.error("webp 썸네일에는 Pillow가 필요합니다. (pip install pillow)")
+    if args.export_dir:
+        try:
+            sink = ColumnarSink(args.export_dir, format=args.export_format, commit_every=args.commit_every)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        sink = SQLSink(commit_every=args.commit_every,
+                       spill_path=args.spill or os.path.join(args.output_dir, "sql_spill.jsonl"))
+    try:
+        records = run_batch(args.input_dir, args.output_dir, workers=args.workers, timeout=args.timeout,
+                            manifest_path=args.manifest, region_mode=args.region_mode, sink=sink,
+                            use_cache=not args.force, streaming=args.streaming,
+                            profile_path=args.profile, cprofile_top=args.cprofile_top,
+                            annotation_mode=args.annotation_mode, save_mode=args.save_mode, thumbnails=thumbnails,
+                            shards=args.shards)
+    finally:
+        sink.close()
+    if isinstance(sink, ColumnarSink):
+        print(f"문서 {sink.saved}개의 결과를 {sink.root}에 내보냈습니다. (형식 {sink.format}, 실행 ID {sink.run_id})")
+    elif sink.spilled:
+        print(f"DB에 저장하지 못한 문서 {sink.spilled}개를 {sink.spill_path}에 기록했습니다.")
+    failed = sum(1 for entry in records if entry["status"] not in ("ok", "unchanged"))
+    unchanged = sum(1 for entry in records if entry["status"] == "unchanged")
+    print(f"모든 파일 처리 완료! (성공 {len(records) - failed - unchanged}, 변경 없음 {unchanged}, 실패 {failed})")
 
 if __name__ == '__main__':
     main()
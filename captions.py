@@ -0,0 +1,127 @@
+import re
+import json
+
+# ── 캡션 검출기 ──
+# 언어별 캡션 접두어(라벨) 설정을 하나의 정규 표현식으로 컴파일하여, 텍스트가 피규어/테이블 캡션인지 판별합니다.
+# - 캡션 형식: <접두어><번호><특수문자>... (공백 제거 후 비교, 대소문자 무시)
+#   예) "Figure 3: ...", "Fig. 2.1 - ...", "Table 1. ...", "图 4：...", "Abb. 5: ..."
+# - 번호 뒤의 문자가 문자/숫자/공백이면 본문 문장("Figure 3 shows ...")으로 보고 캡션에서 제외합니다.
+# - 대부분의 블록은 본문이므로, 첫 글자가 어떤 접두어의 첫 글자와도 다르면 공백 제거와 정규 표현식 없이 바로 거릅니다.
+# - 라벨은 언어와 관계없이 "Figure <번호>" / "Table <번호>"로 통일하여 DB에 저장합니다.
+
+FIGURE = "figure"
+TABLE = "table"
+KIND_LABELS = {FIGURE: "Figure", TABLE: "Table"}
+
+# 언어 -> 종류 -> 접두어(정규 표현식 조각). 접두어는 리터럴 문자로 시작해야 첫 글자 거르기가 적용됩니다.
+CAPTION_LABELS = {
+    "en": {FIGURE: [r"fig(?:ure)?\.?"], TABLE: [r"table"]},
+    "ko": {FIGURE: [r"첨부자료", r"첨부파일"], TABLE: [r"테이블"]},
+    "zh": {FIGURE: [r"图", r"圖"], TABLE: [r"表"]},
+    "ja": {FIGURE: [r"図"], TABLE: [r"表"]},
+    "de": {FIGURE: [r"abb(?:ildung)?\.?"], TABLE: [r"tab(?:elle)?\.?"]},
+}
+DEFAULT_LANGUAGES = ("en", "ko")
+
+_WHITESPACE = re.compile(r'\s+')
+_REGEX_SPECIAL = set(r".^$*+?{}[]\|()")
+
+def _initial(ch):
+    """대소문자 무시 비교용 첫 글자 키."""
+    return ch.lower()[:1]
+
+class CaptionDetector:
+    """
+    설정된 접두어들로 캡션을 판별합니다.
+    - labels: {종류("figure" / "table"): [접두어 정규 표현식 조각]}
+    - 종류 순서대로(피규어 먼저) 하나의 패턴으로 묶으므로, 여러 종류에 해당하면 앞의 종류로 판별합니다.
+    """
+    def __init__(self, labels):
+        alternatives = []
+        initials = set()
+        for kind in (FIGURE, TABLE):
+            prefixes = list(dict.fromkeys(labels.get(kind, ())))
+            if not prefixes:
+                continue
+            alternatives.append(f"(?P<{kind}>{'|'.join(prefixes)})")
+            for prefix in prefixes:
+                if not prefix or prefix[0] in _REGEX_SPECIAL:
+                    initials = None  # 첫 글자를 알 수 없는 접두어: 거르기 없이 항상 정규 표현식 검사
+                elif initials is not None:
+                    initials.add(_initial(prefix[0]))
+                    initials.add(_initial(prefix[0].upper()))
+        if not alternatives:
+            raise ValueError("caption detector needs at least one label")
+        self.labels = {kind: list(dict.fromkeys(labels.get(kind, ()))) for kind in (FIGURE, TABLE)}
+        self.pattern = re.compile(rf"(?i)^(?:{'|'.join(alternatives)})(?P<number>\d+(?:\.\d+)?)(?P<special>.)")
+        self.initials = frozenset(initials) if initials is not None else None
+
+    @classmethod
+    def for_languages(cls, languages=DEFAULT_LANGUAGES, extra_labels=None):
+        """
+        CAPTION_LABELS의 언어 설정을 합쳐 검출기를 만듭니다.
+        - extra_labels: 추가 접두어 {종류: [접두어]} (선택)
+        """
+        labels = {FIGURE: [], TABLE: []}
+        for language in languages:
+            if language not in CAPTION_LABELS:
+                raise ValueError(f"unknown caption language: {language} (available: {', '.join(CAPTION_LABELS)})")
+            for kind, prefixes in CAPTION_LABELS[language].items():
+                labels[kind].extend(prefixes)
+        for kind, prefixes in (extra_labels or {}).items():
+            if kind not in labels:
+                raise ValueError(f"unknown caption kind: {kind}")
+            labels[kind].extend(prefixes)
+        return cls(labels)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        설정 dict 또는 JSON 파일 경로로 검출기를 만듭니다.
+        - {"languages": ["en", "ko", "zh"], "labels": {"figure": ["bild"], "table": []}}
+        """
+        if isinstance(config, str):
+            with open(config, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        return cls.for_languages(config.get("languages", DEFAULT_LANGUAGES), config.get("labels"))
+
+    def signature(self):
+        """검출 결과에 영향을 주는 설정 문자열 (실행 캐시 키에 사용)."""
+        return self.pattern.pattern
+
+    def detect(self, text):
+        """
+        공백을 제거한(strip) 텍스트를 판별합니다.
+        - 캡션이면 (종류, 라벨), 예) "Figure 3: Overview" -> ("figure", "Figure 3")
+        - 접두어와 번호는 맞지만 번호 뒤가 문자/숫자/공백이면 (종류, None), 예) "Figure 3 shows ..." -> ("figure", None)
+        - 그 외(본문)는 None
+        """
+        if not text:
+            return None
+        if self.initials is not None and _initial(text[0]) not in self.initials and _initial(text[0].upper()) not in self.initials:
+            return None
+        match = self.pattern.match(_WHITESPACE.sub('', text))
+        if match is None:
+            return None
+        kind = FIGURE if match.groupdict().get(FIGURE) is not None else TABLE
+        special_char = match.group("special")
+        if special_char.isalnum() or special_char.isspace():
+            return kind, None
+        return kind, f"{KIND_LABELS[kind]} {match.group('number')}"
+
+    def detect_blocks(self, blocks):
+        """
+        페이지의 텍스트 블록(page.get_text("blocks") 형식)을 한 번에 판별합니다.
+        - 반환값: 빈 블록을 제외한 [(블록, 공백을 제거한 텍스트, detect() 결과)] (블록 순서 유지)
+        """
+        found = []
+        initials = self.initials
+        for block in blocks:
+            text = block[4].strip()
+            if not text:
+                continue
+            if initials is not None and _initial(text[0]) not in initials and _initial(text[0].upper()) not in initials:
+                found.append((block, text, None))
+            else:
+                found.append((block, text, self.detect(text)))
+        return found
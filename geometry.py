@@ -0,0 +1,132 @@
+import numpy as np
+
+# ── 사각형 배치(batch) 기하 연산 ──
+# 한 페이지의 사각형들을 (N, 4) float 배열 [x0, y0, x1, y1]로 보관하고,
+# 쌍별 거리 / 겹침 비율 / 포함 여부 / 최근접 점을 벡터 연산으로 한 번에 계산합니다.
+# c.py의 rect_overlap_ratio, is_near, closest_points_between_rectangles는
+# 아래 스칼라 함수를 호출하는 얇은 래퍼로 유지됩니다.
+
+def as_array(rects):
+    """
+    사각형 시퀀스(fitz.Rect 또는 (x0, y0, x1, y1) 튜플)를 (N, 4) float64 배열로 변환합니다.
+    - 이미 (N, 4) 배열이면 그대로 반환합니다.
+    """
+    if isinstance(rects, np.ndarray):
+        return rects.reshape(-1, 4).astype(np.float64, copy=False)
+    if len(rects) == 0:
+        return np.empty((0, 4), dtype=np.float64)
+    return np.array([(r[0], r[1], r[2], r[3]) for r in rects], dtype=np.float64)
+
+def areas(a):
+    """각 사각형의 면적 (너비, 높이가 음수이면 0으로 간주)."""
+    a = as_array(a)
+    return np.clip(a[:, 2] - a[:, 0], 0, None) * np.clip(a[:, 3] - a[:, 1], 0, None)
+
+def pairwise_gaps(a, b):
+    """
+    a의 각 사각형과 b의 각 사각형 사이의 x, y 방향 간격 행렬 (dx, dy)를 반환합니다. 형태: (N, M)
+    - 두 사각형이 해당 축에서 겹치면 간격은 0입니다.
+    """
+    a, b = as_array(a), as_array(b)
+    dx = np.maximum(np.maximum(a[:, None, 0] - b[None, :, 2], b[None, :, 0] - a[:, None, 2]), 0)
+    dy = np.maximum(np.maximum(a[:, None, 1] - b[None, :, 3], b[None, :, 1] - a[:, None, 3]), 0)
+    return dx, dy
+
+def pairwise_gap_distance(a, b):
+    """두 사각형 경계 사이의 최소 거리 행렬 (is_near에서 사용하는 거리)."""
+    dx, dy = pairwise_gaps(a, b)
+    return (dx ** 2 + dy ** 2) ** 0.5
+
+def near_mask(a, b, threshold):
+    """경계 사이 거리가 threshold 이하인 쌍의 불리언 행렬."""
+    return pairwise_gap_distance(a, b) <= threshold
+
+def pairwise_overlap_ratio(a, b):
+    """
+    겹치는 면적을 두 사각형 중 작은 면적으로 나눈 비율 행렬을 반환합니다. 형태: (N, M)
+    - 면적이 있는 겹침이 없으면 0입니다.
+    """
+    a, b = as_array(a), as_array(b)
+    w = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    overlapping = (w > 0) & (h > 0)
+    inter = np.where(overlapping, w * h, 0.0)
+    min_area = np.minimum(areas(a)[:, None], areas(b)[None, :])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(overlapping, inter / np.where(min_area > 0, min_area, 1.0), 0.0)
+    return ratio
+
+def intersects_mask(a, b):
+    """면적이 있는 겹침(fitz.Rect.intersects와 동일)이 있는 쌍의 불리언 행렬."""
+    a, b = as_array(a), as_array(b)
+    a_ok = (a[:, 0] < a[:, 2]) & (a[:, 1] < a[:, 3])
+    b_ok = (b[:, 0] < b[:, 2]) & (b[:, 1] < b[:, 3])
+    return (a_ok[:, None] & b_ok[None, :]
+            & (a[:, None, 0] < b[None, :, 2]) & (b[None, :, 0] < a[:, None, 2])
+            & (a[:, None, 1] < b[None, :, 3]) & (b[None, :, 1] < a[:, None, 3]))
+
+def contains_mask(a, b):
+    """a[i]가 b[j]를 포함(fitz.Rect.contains와 동일, 경계 포함)하는지 나타내는 불리언 행렬."""
+    a, b = as_array(a), as_array(b)
+    return ((a[:, None, 0] <= b[None, :, 0]) & (b[None, :, 0] <= b[None, :, 2]) & (b[None, :, 2] <= a[:, None, 2])
+            & (a[:, None, 1] <= b[None, :, 1]) & (b[None, :, 1] <= b[None, :, 3]) & (b[None, :, 3] <= a[:, None, 3]))
+
+def _closest_axis(a0, a1, b0, b1):
+    """한 축에 대해 closest_points의 좌표 선택 규칙을 벡터로 적용합니다."""
+    mid = (np.maximum(a0, b0) + np.minimum(a1, b1)) / 2
+    pa = np.where(a1 < b0, a1, np.where(b1 < a0, a0, mid))
+    pb = np.where(a1 < b0, b0, np.where(b1 < a0, b1, mid))
+    return pa, pb
+
+def closest_point_pairs(a, b):
+    """
+    a[i]와 b[j] 경계 상의 최근접 점 쌍과 거리를 계산합니다.
+    - 반환값: (pa, pb, dist). pa, pb는 (N, M, 2) 배열, dist는 (N, M) 배열.
+    - 두 사각형이 한 축에서 겹치면 해당 축의 좌표는 겹치는 구간의 중앙으로 정합니다.
+    """
+    a, b = as_array(a), as_array(b)
+    pax, pbx = _closest_axis(a[:, None, 0], a[:, None, 2], b[None, :, 0], b[None, :, 2])
+    pay, pby = _closest_axis(a[:, None, 1], a[:, None, 3], b[None, :, 1], b[None, :, 3])
+    pa = np.stack([pax, pay], axis=-1)
+    pb = np.stack([pbx, pby], axis=-1)
+    dist = np.hypot(pax - pbx, pay - pby)
+    return pa, pb, dist
+
+# ── 스칼라 연산: 단일 쌍 비교용 ──
+
+def overlap_ratio(r1, r2):
+    """두 사각형의 겹치는 면적을 작은 사각형 면적으로 나눈 비율."""
+    x0 = max(r1[0], r2[0])
+    y0 = max(r1[1], r2[1])
+    x1 = min(r1[2], r2[2])
+    y1 = min(r1[3], r2[3])
+    if x1 > x0 and y1 > y0:
+        inter_area = (x1 - x0) * (y1 - y0)
+        area1 = max(r1[2] - r1[0], 0) * max(r1[3] - r1[1], 0)
+        area2 = max(r2[2] - r2[0], 0) * max(r2[3] - r2[1], 0)
+        return inter_area / min(area1, area2)
+    return 0
+
+def gap_distance(r1, r2):
+    """두 사각형 경계 사이의 최소 거리."""
+    dx = max(r1[0] - r2[2], r2[0] - r1[2], 0)
+    dy = max(r1[1] - r2[3], r2[1] - r1[3], 0)
+    return (dx**2 + dy**2)**0.5
+
+def closest_points(r1, r2):
+    """두 사각형 경계 상에서 서로의 최소 거리를 이루는 두 점 ((x, y), (x, y))."""
+    if r1[2] < r2[0]:
+        p1_x, p2_x = r1[2], r2[0]
+    elif r2[2] < r1[0]:
+        p1_x, p2_x = r1[0], r2[2]
+    else:
+        p1_x = p2_x = (max(r1[0], r2[0]) + min(r1[2], r2[2])) / 2
+
+    if r1[3] < r2[1]:
+        p1_y, p2_y = r1[3], r2[1]
+    elif r2[3] < r1[1]:
+        p1_y, p2_y = r1[1], r2[3]
+    else:
+        p1_y = p2_y = (max(r1[1], r2[1]) + min(r1[3], r2[3])) / 2
+
+    return (p1_x, p1_y), (p2_x, p2_y)
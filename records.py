@@ -0,0 +1,109 @@
+import sys
+import fitz
+import numpy as np
+
+# ── 추출 결과 레코드 ──
+# 파이프라인 단계들이 주고받는 캡션 / 테이블 영역 / 매칭 결과를 __slots__ 레코드로 표현합니다.
+# - 좌표는 fitz.Rect 대신 float 4개로 보관하고, rect 속성에 접근할 때마다 fitz.Rect를 만들어 반환합니다.
+#   (좌표를 바꾸려면 rect에 새 사각형을 대입)
+# - 라벨("Figure 3" 등)은 sys.intern으로 공유하여 같은 라벨 문자열이 레코드마다 따로 만들어지지 않게 합니다.
+# - 영역 PDF 경로(region_path)는 11단계(RegionWriter)에서 채워지며, 그 전에는 None입니다.
+# - RegionStore는 레코드를 삽입 순서대로 보관하면서 페이지별 목록을 함께 유지합니다. 좌표는 레코드의
+#   슬롯에만 있고, geometry 배치 연산에 쓰는 페이지별 (N, 4) 배열은 coords(n)를 호출할 때 만듭니다.
+# - 반복문에서 좌표만 비교할 때는 rect 대신 coords를 사용합니다. (fitz.Rect를 만들지 않음)
+
+class _RectRecord:
+    __slots__ = ("x0", "y0", "x1", "y1")
+
+    @property
+    def rect(self):
+        return fitz.Rect(self.x0, self.y0, self.x1, self.y1)
+
+    @rect.setter
+    def rect(self, rect):
+        self.x0, self.y0, self.x1, self.y1 = float(rect[0]), float(rect[1]), float(rect[2]), float(rect[3])
+
+    @property
+    def coords(self):
+        return (self.x0, self.y0, self.x1, self.y1)
+
+class CaptionRecord(_RectRecord):
+    """캡션 하나. kind는 "figure" / "table" (captions.FIGURE / captions.TABLE)."""
+    __slots__ = ("label", "text", "page", "kind", "region_path")
+
+    def __init__(self, rect, label, text, page, kind, region_path=None):
+        self.rect = rect
+        self.label = sys.intern(label)
+        self.text = text
+        self.page = page
+        self.kind = kind
+        self.region_path = region_path
+
+    def __repr__(self):
+        return f"CaptionRecord({self.label!r}, page={self.page}, rect={self.coords})"
+
+class TableRecord(_RectRecord):
+    """테이블 영역 하나. label은 영역을 정한 테이블 캡션의 라벨."""
+    __slots__ = ("page", "label")
+
+    def __init__(self, page, rect, label):
+        self.page = page
+        self.rect = rect
+        self.label = sys.intern(label)
+
+    def __repr__(self):
+        return f"TableRecord({self.label!r}, page={self.page}, rect={self.coords})"
+
+class MatchRecord(_RectRecord):
+    """
+    캡션과 매칭된 클러스터 영역 하나.
+    - p_cluster, p_caption: 클러스터/캡션 경계 상의 최근접 점, distance: 두 점 사이 거리
+      (10단계에서 다른 클러스터와 병합된 영역은 (0, 0), (0, 0), 0)
+    """
+    __slots__ = ("p_cluster", "p_caption", "distance", "region_path")
+
+    def __init__(self, rect, p_cluster=(0, 0), p_caption=(0, 0), distance=0, region_path=None):
+        self.rect = rect
+        self.p_cluster = p_cluster
+        self.p_caption = p_caption
+        self.distance = distance
+        self.region_path = region_path
+
+    def __repr__(self):
+        return f"MatchRecord(rect={self.coords}, distance={self.distance})"
+
+class RegionStore:
+    """
+    페이지 번호(page 속성)가 있는 레코드들의 저장소입니다.
+    - 순회 / len / append / extend는 리스트와 같이 삽입 순서를 따릅니다.
+    - page(n): n 페이지 레코드 목록, coords(n): n 페이지 좌표의 (N, 4) float64 배열 (호출 시 레코드에서 생성)
+    """
+    def __init__(self, records=()):
+        self.records = []
+        self.pages = {}  # 페이지 번호 -> [레코드]
+        self.extend(records)
+
+    def append(self, record):
+        self.records.append(record)
+        if record.page not in self.pages:
+            self.pages[record.page] = []
+        self.pages[record.page].append(record)
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def page(self, page_number):
+        return self.pages.get(page_number, [])
+
+    def coords(self, page_number):
+        records = self.pages.get(page_number)
+        if not records:
+            return np.empty((0, 4), dtype=np.float64)
+        return np.array([record.coords for record in records], dtype=np.float64)
@@ -0,0 +1,65 @@
+import os
+import sys
+import random
+import itertools
+from types import SimpleNamespace
+
+import fitz
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import c
+import captions
+from records import CaptionRecord
+
+# 9단계 매칭: min_cost_assignment를 모든 순열 비교 결과와, match_page_captions의 거리 제한(MATCH_MAX_DISTANCE)을 확인합니다.
+
+def reference_min_cost(cost):
+    """작은 쪽 크기만큼의 모든 1:1 배정 중 최소 비용 합."""
+    n, m = cost.shape
+    if n <= m:
+        return min(sum(cost[i, cols[i]] for i in range(n)) for cols in itertools.permutations(range(m), n))
+    return min(sum(cost[rows[j], j] for j in range(m)) for rows in itertools.permutations(range(n), m))
+
+def test_min_cost_assignment_matches_permutations():
+    rng = random.Random(17)
+    for _ in range(300):
+        n, m = rng.randint(1, 6), rng.randint(1, 6)
+        if rng.random() < 0.5:
+            cost = np.array([[rng.uniform(0, 100) for _ in range(m)] for _ in range(n)])
+        else:
+            cost = np.array([[float(rng.randint(0, 4)) for _ in range(m)] for _ in range(n)])  # 같은 비용이 많은 경우
+        pairs = c.min_cost_assignment(cost)
+        assert len(pairs) == min(n, m)
+        assert pairs == sorted(pairs)
+        assert len({i for i, _ in pairs}) == len(pairs) and len({j for _, j in pairs}) == len(pairs)
+        assert np.isclose(sum(cost[i, j] for i, j in pairs), reference_min_cost(cost))
+
+def test_min_cost_assignment_empty():
+    assert c.min_cost_assignment(np.zeros((0, 3))) == []
+    assert c.min_cost_assignment(np.zeros((3, 0))) == []
+
+def distant_caption_state():
+    """클러스터 하나와, 가까운 캡션 하나 / 클러스터에서 300pt 떨어진 캡션 하나."""
+    state = c.PipelineState()
+    state.merged_clusters_by_page[0] = [fitz.Rect(100, 100, 300, 300), fitz.Rect(100, 900, 300, 1000)]
+    state.figure_caption_regions.append(CaptionRecord(fitz.Rect(100, 310, 300, 320), "Figure 1", "", 0, captions.FIGURE))
+    state.figure_caption_regions.append(CaptionRecord(fitz.Rect(100, 600, 300, 610), "Figure 2", "", 0, captions.FIGURE))
+    return state
+
+def test_distant_caption_is_not_matched_by_default():
+    state = distant_caption_state()
+    c.match_page_captions(state, SimpleNamespace(number=0))
+    matching = state.page_caption_matching[0]
+    assert list(matching) == ["Figure 1"]
+    assert tuple(matching["Figure 1"].rect) == (100, 100, 300, 300)
+
+def test_distance_cap_disabled_restores_old_reach(monkeypatch):
+    monkeypatch.setattr(c, "MATCH_K", None)
+    monkeypatch.setattr(c, "MATCH_MAX_DISTANCE", None)
+    state = distant_caption_state()
+    c.match_page_captions(state, SimpleNamespace(number=0))
+    matching = state.page_caption_matching[0]
+    assert sorted(matching) == ["Figure 1", "Figure 2"]
+    assert tuple(matching["Figure 2"].rect) == (100, 900, 300, 1000)
+    assert matching["Figure 2"].distance == 290
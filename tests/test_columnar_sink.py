@@ -0,0 +1,49 @@
+import os
+import sys
+import csv
+import gzip
+
+import fitz
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import c
+from records import CaptionRecord, MatchRecord
+
+# ColumnarSink의 실행 ID / 파티션 디렉터리 생성과 CSV 내보내기를 임시 디렉터리에서 확인합니다.
+
+def make_rows(file_name):
+    figure = CaptionRecord(fitz.Rect(10, 200, 200, 215), "Figure 1", "Figure 1: overview", 0, "figure")
+    matching = {0: {"Figure 1": MatchRecord(fitz.Rect(10, 50, 200, 190))}}
+    return c.build_sql_rows(file_name, [], [figure], [], matching)
+
+def test_default_run_ids_are_unique(tmp_path):
+    # 같은 초에 시작한 실행들도 서로 다른 실행 ID / 파티션을 가짐
+    sinks = [c.ColumnarSink(str(tmp_path), format="csv") for _ in range(20)]
+    assert len({sink.run_id for sink in sinks}) == len(sinks)
+    for sink in sinks:
+        assert all(os.path.isdir(sink.partition_dir(table)) for table in c.EXPORT_COLUMNS)
+
+def test_existing_run_id_is_rejected(tmp_path):
+    first = c.ColumnarSink(str(tmp_path), format="csv", run_id="r1")
+    with pytest.raises(ValueError):
+        c.ColumnarSink(str(tmp_path), format="csv", run_id="r1")
+    # 실패한 쪽이 먼저 시작한 실행의 디렉터리를 지우지 않음
+    assert all(os.path.isdir(first.partition_dir(table)) for table in c.EXPORT_COLUMNS)
+    # 일부 테이블 디렉터리만 있어도 거부하고, 새로 만든 디렉터리는 정리함
+    os.makedirs(os.path.join(str(tmp_path), "clusters", "run=r2"))
+    with pytest.raises(ValueError):
+        c.ColumnarSink(str(tmp_path), format="csv", run_id="r2")
+    assert not os.path.exists(os.path.join(str(tmp_path), "pdf_documents", "run=r2"))
+
+def test_csv_export(tmp_path):
+    sink = c.ColumnarSink(str(tmp_path), format="csv", run_id="r1", commit_every=2)
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        sink.submit(make_rows(name))
+    sink.close()
+    assert sink.saved == 3 and sink.shards == 2
+    with gzip.open(os.path.join(sink.partition_dir("captions"), "part-00001.csv.gz"), "rt", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == [name for name, _ in c.EXPORT_COLUMNS["captions"]]
+    assert rows[1][:3] == ["3", "Figure 1", "3"]
+    assert os.listdir(sink.partition_dir("tables")) == []
@@ -0,0 +1,70 @@
+import os
+import sys
+import random
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import c
+
+# detect_columns(격자 색인 그룹 대표)를 기존의 대표 순차 비교 방식과 비교합니다.
+# x0/x1 일부는 격자 칸 경계(tolerance의 배수)에 놓거나 대표와 정확히 tolerance만큼 떨어지도록 만듭니다.
+
+def reference_detect_columns(entries, tolerance=c.GROUP_TOLERANCE):
+    """격자 색인 도입 전의 컬럼 검출 (그룹 대표를 앞에서부터 하나씩 비교)."""
+    columns = []
+    remaining = list(entries)
+    while remaining:
+        groups = []
+        for entry in remaining:
+            rect = entry[1]
+            for group in groups:
+                rep_rect = group[0][1]
+                if abs(rect.x0 - rep_rect.x0) <= tolerance and abs(rect.x1 - rep_rect.x1) <= tolerance:
+                    group.append(entry)
+                    break
+            else:
+                groups.append([entry])
+        dominant = max(groups, key=lambda g: sum(entry[1].get_area() for entry in g))
+        columns.append(dominant)
+        dom_x0 = min(entry[1].x0 for entry in dominant)
+        dom_x1 = max(entry[1].x1 for entry in dominant)
+        remaining = [entry for entry in remaining if not (entry[1].x1 > dom_x0 and entry[1].x0 < dom_x1)]
+    return columns
+
+def random_blocks(rng, n, tolerance, width=600):
+    lefts = [rng.uniform(0, width / 2) for _ in range(rng.randint(1, 4))]
+    blocks = []
+    for i in range(n):
+        kind = rng.random()
+        if kind < 0.2:
+            # 칸 경계에 놓인 블록
+            x0 = rng.randrange(0, int(width / tolerance)) * tolerance
+            x1 = x0 + rng.randint(1, 20) * tolerance
+        elif kind < 0.35 and blocks:
+            # 기존 블록과 x0/x1이 정확히 tolerance 차이
+            base = rng.choice(blocks)[1]
+            x0, x1 = base.x0 + rng.choice([-tolerance, 0, tolerance]), base.x1 + rng.choice([-tolerance, 0, tolerance])
+            x1 = max(x1, x0 + tolerance)  # 너비가 0 이하인 블록은 컬럼에서 제외되지 않으므로 만들지 않음
+        else:
+            x0 = rng.choice(lefts) + rng.uniform(-1.5, 1.5) * tolerance
+            x1 = x0 + rng.uniform(40, 300)
+        y0 = rng.uniform(0, 800)
+        blocks.append((0, fitz.Rect(x0, y0, x1, y0 + rng.uniform(0, 60)), "block %d" % i))
+    return blocks
+
+def as_tuples(columns):
+    return [[(entry[0], tuple(entry[1]), entry[2]) for entry in column] for column in columns]
+
+def test_detect_columns_matches_reference():
+    rng = random.Random(14)
+    for _ in range(300):
+        tolerance = rng.choice([c.GROUP_TOLERANCE, 2.5, 25])
+        blocks = random_blocks(rng, rng.randint(0, 80), tolerance)
+        assert as_tuples(c.detect_columns(blocks, tolerance)) == as_tuples(reference_detect_columns(blocks, tolerance))
+
+def test_detect_columns_zero_tolerance():
+    rng = random.Random(15)
+    for _ in range(100):
+        blocks = random_blocks(rng, rng.randint(1, 40), 5)
+        assert as_tuples(c.detect_columns(blocks, 0)) == as_tuples(reference_detect_columns(blocks, 0))
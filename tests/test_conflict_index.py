@@ -0,0 +1,79 @@
+import os
+import sys
+import random
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import c
+import captions
+from records import CaptionRecord, TableRecord
+
+# ConflictIndex(페이지별 격자 색인)를 10단계의 기존 전체 비교 충돌 검사와 비교합니다.
+# 좌표 일부는 GridIndex 칸 경계(cell_size의 배수)에 놓아 맞닿기만 하는 경우를 확인합니다.
+
+CELL = c.GridIndex().cell_size
+PAGES = 3
+
+def reference_conflicts(state, page_number, candidate_union):
+    """인덱스 도입 전의 10단계 충돌 검사."""
+    for pn, dr in state.drawn_rectangles:
+        if pn == page_number and (candidate_union.intersects(dr) or candidate_union.contains(dr)):
+            return True
+    for table in state.drawn_table_regions:
+        tr = table.rect
+        if table.page == page_number and (candidate_union.intersects(tr) or candidate_union.contains(tr)):
+            return True
+    for caption in list(state.figure_caption_regions) + list(state.table_caption_regions):
+        cap_rect = caption.rect
+        if caption.page == page_number and (candidate_union.intersects(cap_rect) or
+                                            candidate_union.contains(cap_rect) or
+                                            cap_rect.contains(candidate_union)):
+            return True
+    return False
+
+def random_rect(rng, extent=600):
+    if rng.random() < 0.3:
+        # 칸 경계에 놓인 사각형 / 선분
+        x0, y0 = rng.randrange(0, int(extent / CELL)) * CELL, rng.randrange(0, int(extent / CELL)) * CELL
+        return fitz.Rect(x0, y0, x0 + rng.choice([0, CELL, 2 * CELL]), y0 + rng.choice([0, CELL]))
+    x0, y0 = rng.uniform(0, extent), rng.uniform(0, extent)
+    if rng.random() < 0.05:
+        return fitz.Rect(-10, -10, extent * 40, extent * 40)  # 많은 칸에 걸치는 큰 영역
+    return fitz.Rect(x0, y0, x0 + rng.uniform(0, 120), y0 + rng.uniform(0, 60))
+
+def random_state(rng):
+    state = c.PipelineState()
+    for _ in range(rng.randint(0, 40)):
+        state.drawn_rectangles.append((rng.randrange(PAGES), random_rect(rng)))
+    for i in range(rng.randint(0, 10)):
+        state.drawn_table_regions.append(TableRecord(rng.randrange(PAGES), random_rect(rng), "Table %d" % i))
+    for i in range(rng.randint(0, 15)):
+        kind = rng.choice([captions.FIGURE, captions.TABLE])
+        regions = state.figure_caption_regions if kind == captions.FIGURE else state.table_caption_regions
+        regions.append(CaptionRecord(random_rect(rng), "%s %d" % (kind, i), "", rng.randrange(PAGES), kind))
+    return state
+
+def test_conflict_index_matches_brute_force():
+    rng = random.Random(18)
+    for _ in range(150):
+        state = random_state(rng)
+        indexes = c.build_conflict_indexes(state)
+        assert state.conflict_indexes is indexes
+        for _ in range(30):
+            page_number = rng.randrange(PAGES + 1)  # 영역이 없는 페이지 포함
+            probe = random_rect(rng) | random_rect(rng)
+            index = indexes.get(page_number)
+            found = index.conflicts(probe) if index is not None else False
+            assert found == reference_conflicts(state, page_number, probe)
+
+def test_conflict_on_cell_boundaries():
+    state = c.PipelineState()
+    state.figure_caption_regions.append(CaptionRecord(fitz.Rect(0, 0, 4 * CELL, 4 * CELL), "Figure 1", "", 0, captions.FIGURE))
+    state.drawn_rectangles.append((0, fitz.Rect(5 * CELL, CELL, 6 * CELL, 2 * CELL)))
+    indexes = c.build_conflict_indexes(state)
+    # 캡션 안에 완전히 들어간 병합 영역은 충돌, 처리된 영역과 칸 경계의 변만 맞닿은 병합 영역은 충돌 아님
+    inside = fitz.Rect(CELL / 2, CELL / 2, CELL, CELL)
+    touching = fitz.Rect(6 * CELL, CELL, 7 * CELL, 2 * CELL)
+    assert indexes[0].conflicts(inside) and reference_conflicts(state, 0, inside)
+    assert not indexes[0].conflicts(touching) and not reference_conflicts(state, 0, touching)
@@ -0,0 +1,80 @@
+import os
+import sys
+import random
+
+import fitz
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import geometry
+
+# geometry의 배치(행렬) 연산을 스칼라 함수 / fitz.Rect 판정과 원소별로 비교합니다.
+
+def random_batch(rng, n, extent=300):
+    rects = []
+    for _ in range(n):
+        x0, y0 = rng.choice([rng.uniform(0, extent), rng.randrange(0, extent, 25)]), rng.uniform(0, extent)
+        kind = rng.random()
+        if kind < 0.15:
+            rects.append((x0, y0, x0 + rng.uniform(0, 60), y0))  # 면적 없는 가로선
+        elif kind < 0.25:
+            rects.append((x0, y0, x0, y0 + rng.uniform(0, 60)))  # 면적 없는 세로선
+        elif kind < 0.3 and rects:
+            rects.append(rng.choice(rects))  # 중복
+        else:
+            rects.append((x0, y0, x0 + rng.uniform(1, 80), y0 + rng.uniform(1, 80)))
+    return rects
+
+def batches(seed, count=40):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield random_batch(rng, rng.randint(1, 25)), random_batch(rng, rng.randint(1, 25))
+
+def test_as_array_shapes():
+    assert geometry.as_array([]).shape == (0, 4)
+    assert geometry.as_array([fitz.Rect(1, 2, 3, 4)]).tolist() == [[1, 2, 3, 4]]
+    arr = np.arange(8, dtype=np.float64)
+    assert geometry.as_array(arr).shape == (2, 4)
+
+def test_areas_matches_scalar():
+    for a, _ in batches(1):
+        expected = [max(r[2] - r[0], 0) * max(r[3] - r[1], 0) for r in a]
+        assert np.allclose(geometry.areas(a), expected)
+
+def test_pairwise_gap_distance_and_near_mask_match_scalar():
+    for a, b in batches(2):
+        dist = geometry.pairwise_gap_distance(a, b)
+        assert dist.shape == (len(a), len(b))
+        for threshold in (0, 10, 40):
+            mask = geometry.near_mask(a, b, threshold)
+            for i, r1 in enumerate(a):
+                for j, r2 in enumerate(b):
+                    assert np.isclose(dist[i, j], geometry.gap_distance(r1, r2))
+                    assert mask[i, j] == (geometry.gap_distance(r1, r2) <= threshold)
+
+def test_pairwise_overlap_ratio_matches_scalar():
+    for a, b in batches(3):
+        ratio = geometry.pairwise_overlap_ratio(a, b)
+        assert ratio.shape == (len(a), len(b))
+        for i, r1 in enumerate(a):
+            for j, r2 in enumerate(b):
+                assert np.isclose(ratio[i, j], geometry.overlap_ratio(r1, r2))
+
+def test_intersects_and_contains_masks_match_fitz():
+    for a, b in batches(4):
+        intersects = geometry.intersects_mask(a, b)
+        contains = geometry.contains_mask(a, b)
+        for i, r1 in enumerate(a):
+            for j, r2 in enumerate(b):
+                assert intersects[i, j] == fitz.Rect(r1).intersects(fitz.Rect(r2))
+                assert contains[i, j] == fitz.Rect(r1).contains(fitz.Rect(r2))
+
+def test_closest_point_pairs_match_scalar():
+    for a, b in batches(5):
+        pa, pb, dist = geometry.closest_point_pairs(a, b)
+        assert pa.shape == (len(a), len(b), 2) and dist.shape == (len(a), len(b))
+        for i, r1 in enumerate(a):
+            for j, r2 in enumerate(b):
+                p1, p2 = geometry.closest_points(r1, r2)
+                assert np.allclose(pa[i, j], p1) and np.allclose(pb[i, j], p2)
+                assert np.isclose(dist[i, j], np.hypot(p1[0] - p2[0], p1[1] - p2[1]))
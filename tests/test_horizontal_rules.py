@@ -0,0 +1,92 @@
+import os
+import sys
+import random
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import c
+
+# HorizontalRuleIndex(bisect 질의)와 group_by_x_span을 3단계의 기존 선형 탐색과 비교합니다.
+# 질의 값은 가로선의 중심 x ± tol, x0, x1과 정확히 같아지도록 일부러 골라 경계 처리를 확인합니다.
+
+def reference_rules(drawings):
+    return [r for r in drawings if (r.y1 - r.y0) < 2 and (r.x1 - r.x0) > 20]
+
+def reference_near_center_x(rules, center_x, tol):
+    return [line for line in rules if abs((line.x0 + line.x1) / 2 - center_x) <= tol]
+
+def reference_overlapping_x(rules, x_min, x_max):
+    """기존 3단계: 겹치는 가로선을 차례로 담되 이미 담긴 선분(좌표가 같은 Rect)은 건너뜀."""
+    selected = []
+    for line in rules:
+        if line.x0 <= x_max and line.x1 >= x_min:
+            if line not in selected:
+                selected.append(line)
+    return selected
+
+def reference_group_by_x_span(lines, tolerance):
+    groups = []
+    for line in lines:
+        for group in groups:
+            if abs(line.x0 - group[0].x0) <= tolerance and abs(line.x1 - group[0].x1) <= tolerance:
+                group.append(line)
+                break
+        else:
+            groups.append([line])
+    return groups
+
+def random_drawings(rng, n, extent=600):
+    drawings = []
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.3:
+            # 정수 격자 위의 선분: 중심/끝점이 서로 정확히 맞닿음
+            x0 = rng.randrange(0, extent, 10)
+            x1 = x0 + rng.choice([20, 30, 40, 100])
+        else:
+            x0 = rng.uniform(0, extent)
+            x1 = x0 + rng.uniform(0, 200)
+        y0 = rng.uniform(0, 800)
+        height = rng.choice([0, 0, 0.5, 1.99, 2, 10])
+        drawings.append(fitz.Rect(x0, y0, x1, y0 + height))
+        if drawings and rng.random() < 0.1:
+            drawings.append(fitz.Rect(rng.choice(drawings)))  # 좌표가 같은 선분
+    return drawings
+
+def probes(rng, rules, extent=600):
+    values = [rng.uniform(-20, extent + 20) for _ in range(10)]
+    for line in rng.sample(rules, min(len(rules), 10)):
+        values.extend([line.x0, line.x1, (line.x0 + line.x1) / 2])
+    return values
+
+def as_tuples(rects):
+    return [tuple(r) for r in rects]
+
+def test_rule_index_matches_linear_scan():
+    rng = random.Random(15)
+    for _ in range(100):
+        drawings = random_drawings(rng, rng.randint(0, 80))
+        index = c.HorizontalRuleIndex(drawings)
+        rules = reference_rules(drawings)
+        assert len(index) == len(rules)
+        assert as_tuples(index.rules) == as_tuples(rules)
+        values = probes(rng, rules)
+        for value in values:
+            for tol in (0, 10, 25):
+                # 중심 x가 정확히 value ± tol에 놓인 선분도 포함되어야 함
+                for center_x in (value, value - tol, value + tol):
+                    assert as_tuples(index.near_center_x(center_x, tol)) == as_tuples(reference_near_center_x(rules, center_x, tol))
+        for _ in range(20):
+            x_min, x_max = sorted(rng.sample(values, 2)) if len(values) > 1 else (values[0], values[0])
+            for margin in (0, 10):
+                lo, hi = x_min - margin, x_max + margin
+                assert as_tuples(index.overlapping_x(lo, hi)) == as_tuples(reference_overlapping_x(rules, lo, hi))
+
+def test_group_by_x_span_matches_linear_scan():
+    rng = random.Random(16)
+    for _ in range(200):
+        lines = reference_rules(random_drawings(rng, rng.randint(0, 60)))
+        for tolerance in (0, 10, 25):
+            groups = c.group_by_x_span(lines, tolerance)
+            assert [as_tuples(g) for g in groups] == [as_tuples(g) for g in reference_group_by_x_span(lines, tolerance)]
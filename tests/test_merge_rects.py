@@ -0,0 +1,81 @@
+import os
+import sys
+import random
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import c
+
+# merge_overlapping_rects(sweep-line + union-find)를 기존 반복 병합 방식과 비교합니다.
+
+def reference_merge(rects, tol=0):
+    """sweep 도입 전의 반복 병합 (tol > 0이면 가로/세로 간격이 모두 tol 이하인 쌍도 병합)."""
+    def overlapping(a, b):
+        if tol > 0:
+            return b.x0 - tol <= a.x1 and a.x0 - tol <= b.x1 and b.y0 - tol <= a.y1 and a.y0 - tol <= b.y1
+        return a.intersects(b) or a.contains(b) or b.contains(a)
+
+    merged = [fitz.Rect(r) for r in rects]
+    changed = True
+    while changed:
+        changed = False
+        new_merged = []
+        while merged:
+            current = merged.pop(0)
+            i = 0
+            while i < len(merged):
+                if overlapping(current, merged[i]):
+                    current |= merged.pop(i)
+                    changed = True
+                else:
+                    i += 1
+            new_merged.append(current)
+        merged = new_merged
+    return merged
+
+def random_boxes(rng, n, extent=500):
+    rects = []
+    for _ in range(n):
+        if rng.random() < 0.3:
+            # 정수 격자 위의 사각형: 변이 맞닿거나 꼭짓점만 닿는 경우
+            x0, y0 = rng.randrange(0, extent, 20), rng.randrange(0, extent, 20)
+            rects.append(fitz.Rect(x0, y0, x0 + rng.choice([20, 40]), y0 + rng.choice([20, 40])))
+        else:
+            x0, y0 = rng.uniform(0, extent), rng.uniform(0, extent)
+            rects.append(fitz.Rect(x0, y0, x0 + rng.uniform(5, 80), y0 + rng.uniform(5, 80)))
+    return rects
+
+def as_tuples(rects):
+    return [tuple(r) for r in rects]
+
+def test_merge_matches_iterative_reference():
+    rng = random.Random(11)
+    for _ in range(300):
+        rects = random_boxes(rng, rng.randint(0, 60))
+        assert as_tuples(c.merge_overlapping_rects(rects)) == as_tuples(reference_merge(rects))
+
+def test_merge_with_tolerance_matches_iterative_reference():
+    rng = random.Random(12)
+    for _ in range(300):
+        rects = random_boxes(rng, rng.randint(0, 60))
+        tol = rng.choice([0.5, 3, 10, 20])
+        assert as_tuples(c.merge_overlapping_rects(rects, tol=tol)) == as_tuples(reference_merge(rects, tol=tol))
+
+def test_merge_does_not_modify_input():
+    rects = [fitz.Rect(0, 0, 10, 10), fitz.Rect(5, 5, 20, 20)]
+    c.merge_overlapping_rects(rects)
+    assert as_tuples(rects) == [(0, 0, 10, 10), (5, 5, 20, 20)]
+
+def test_merge_with_zero_area_rects_matches_iterative_reference():
+    # 선분은 합집합에 반영되지 않으므로 병합 순서가 결과를 바꿈: 맞닿은 두 상자 사이의 선분
+    boxes = [fitz.Rect(0, 0, 10, 10), fitz.Rect(10, 2, 10, 8), fitz.Rect(10, 0, 20, 10)]
+    assert as_tuples(c.merge_overlapping_rects(boxes)) == as_tuples(reference_merge(boxes))
+    rng = random.Random(13)
+    for _ in range(200):
+        rects = random_boxes(rng, rng.randint(1, 40))
+        for _ in range(rng.randint(1, 5)):
+            x0, y0 = rng.randrange(0, 500, 20), rng.uniform(0, 500)
+            rects.insert(rng.randrange(len(rects) + 1), fitz.Rect(x0, y0, x0, y0 + rng.uniform(0, 60)))
+        tol = rng.choice([0, 0, 5])
+        assert as_tuples(c.merge_overlapping_rects(rects, tol=tol)) == as_tuples(reference_merge(rects, tol=tol))
@@ -0,0 +1,141 @@
+import os
+import sys
+import math
+import random
+from collections import deque
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import c
+
+# GridIndex / PageRectIndex / cluster_elements를 전체 비교(brute force) 결과와 비교합니다.
+# 좌표 일부는 격자 칸 경계(cell_size의 배수)에 정확히 놓이도록 만들어 경계 처리를 확인합니다.
+
+CELL = 40
+
+def random_rect(rng, cell=CELL, extent=600):
+    kind = rng.random()
+    if kind < 0.25:
+        # 칸 경계에 놓인 사각형 / 선분
+        x0, y0 = rng.randrange(0, extent // cell) * cell, rng.randrange(0, extent // cell) * cell
+        return fitz.Rect(x0, y0, x0 + rng.choice([0, cell, 2 * cell]), y0 + rng.choice([0, cell]))
+    x0, y0 = rng.uniform(0, extent), rng.uniform(0, extent)
+    if kind < 0.4:
+        return fitz.Rect(x0, y0, x0 + rng.uniform(0, 80), y0)  # 가로선
+    if kind < 0.5:
+        return fitz.Rect(x0, y0, x0, y0 + rng.uniform(0, 80))  # 세로선
+    if kind < 0.53:
+        return fitz.Rect(-50, -50, extent * 20, extent * 20)  # 많은 칸에 걸치는 큰 사각형
+    return fitz.Rect(x0, y0, x0 + rng.uniform(0, 60), y0 + rng.uniform(0, 60))
+
+def random_rects(rng, n):
+    rects = [random_rect(rng) for _ in range(n)]
+    for _ in range(n // 10):
+        rects.append(fitz.Rect(rng.choice(rects)))  # 중복
+    rng.shuffle(rects)
+    return rects
+
+def reference_cluster_elements(rects, threshold):
+    """인덱스 도입 전의 전체 비교 BFS."""
+    clusters = []
+    visited = set()
+    for i in range(len(rects)):
+        if i in visited:
+            continue
+        cluster = []
+        queue = deque([i])
+        while queue:
+            idx = queue.popleft()
+            if idx in visited:
+                continue
+            visited.add(idx)
+            cluster.append(rects[idx])
+            for j, other in enumerate(rects):
+                if j not in visited and c.is_near(rects[idx], other, threshold):
+                    queue.append(j)
+        clusters.append(cluster)
+    return clusters
+
+def as_tuples(clusters):
+    return [[tuple(r) for r in cluster] for cluster in clusters]
+
+def test_grid_queries_match_brute_force():
+    rng = random.Random(3)
+    for _ in range(60):
+        rects = random_rects(rng, rng.randint(1, 120))
+        grid = c.GridIndex(cell_size=CELL)
+        for r in rects:
+            grid.insert(r)
+        for probe in [random_rect(rng) for _ in range(20)] + rects[:10]:
+            for threshold in (0, 5, CELL):
+                assert grid.near(probe, threshold) == [i for i, r in enumerate(rects) if c.is_near(probe, r, threshold)]
+            assert grid.intersecting(probe) == [i for i, r in enumerate(rects) if r.intersects(probe)]
+            assert grid.containing(probe) == [i for i, r in enumerate(rects) if r.contains(probe)]
+
+def test_page_rect_index_matches_list():
+    rng = random.Random(4)
+    entries = [(rng.randrange(3), random_rect(rng)) for _ in range(200)]
+    index = c.PageRectIndex(entries, cell_size=CELL)
+    assert list(index) == entries
+    for _ in range(200):
+        page, probe = rng.randrange(3), random_rect(rng)
+        assert c.already_drawn(page, probe, index) == c.already_drawn(page, probe, entries)
+        assert c.is_in_blocks(page, probe, index) == c.is_in_blocks(page, probe, entries)
+        assert c.is_intersects_blocks(page, probe, index) == c.is_intersects_blocks(page, probe, entries)
+
+def test_cluster_elements_matches_brute_force():
+    rng = random.Random(5)
+    for _ in range(80):
+        rects = random_rects(rng, rng.randint(0, 150))
+        threshold = rng.choice([0, 5, 20, CELL / 2])
+        assert as_tuples(c.cluster_elements(rects, threshold)) == as_tuples(reference_cluster_elements(rects, threshold))
+
+def dense_drawings(rng, n, extent=300, with_nan=False, with_cover=False):
+    """차트 페이지처럼 좁은 영역에 몰린 드로잉: 선분, 중첩 상자, 중복 (+ 좌표가 NaN인 사각형, 페이지 전체를 덮는 상자)."""
+    rects = []
+    for _ in range(n):
+        kind = rng.random()
+        x0, y0 = rng.uniform(0, extent), rng.uniform(0, extent)
+        if kind < 0.25:
+            rects.append(fitz.Rect(x0, y0, x0 + rng.uniform(0, 30), y0))  # 가로선 (면적 없음)
+        elif kind < 0.4:
+            rects.append(fitz.Rect(x0, y0, x0, y0 + rng.uniform(0, 30)))  # 세로선 (면적 없음)
+        elif kind < 0.55 and rects:
+            # 기존 사각형 안에 중첩된 상자
+            outer = rng.choice(rects)
+            if outer.is_valid and all(map(math.isfinite, outer)):
+                x0, x1 = sorted(rng.uniform(outer.x0, outer.x1) for _ in range(2))
+                y0, y1 = sorted(rng.uniform(outer.y0, outer.y1) for _ in range(2))
+                rects.append(fitz.Rect(x0, y0, x1, y1))
+        elif kind < 0.6 and rects:
+            rects.append(fitz.Rect(rng.choice(rects)))  # 중복
+        elif kind < 0.62 and with_nan:
+            rects.append(fitz.Rect(x0, float("nan"), x0 + 5, y0))  # 비정상 좌표
+        elif kind < 0.64 and with_cover:
+            rects.append(fitz.Rect(-20, -20, extent + 20, extent + 20))  # 페이지 전체를 덮는 상자
+        else:
+            rects.append(fitz.Rect(x0, y0, x0 + rng.uniform(0, 20), y0 + rng.uniform(0, 20)))
+    return rects
+
+def as_index_sets(clusters, rects):
+    index_of = {id(r): i for i, r in enumerate(rects)}
+    return [frozenset(index_of[id(r)] for r in cluster) for cluster in clusters]
+
+def test_cluster_drawings_matches_cluster_elements_partition():
+    rng = random.Random(25)
+    for _ in range(60):
+        rects = dense_drawings(rng, rng.randint(0, 400), extent=rng.choice([100, 300, 1200]),
+                               with_nan=rng.random() < 0.3, with_cover=rng.random() < 0.2)
+        threshold = rng.choice([0, 2, 5, 20])
+        expected = as_index_sets(c.cluster_elements(rects, threshold), rects)
+        found = as_index_sets(c.cluster_drawings(rects, threshold), rects)
+        assert set(found) == set(expected)
+        # 클러스터 순서도 같음
+        assert found == expected
+        if all(math.isfinite(v) for r in rects for v in r):
+            # 클러스터 안의 요소는 입력 순서 (NaN이 있으면 cluster_elements 결과를 그대로 사용)
+            index_of = {id(r): i for i, r in enumerate(rects)}
+            for cluster in c.cluster_drawings(rects, threshold):
+                indexes = [index_of[id(r)] for r in cluster]
+                assert indexes == sorted(indexes)
@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import c
+from records import CaptionRecord, TableRecord, MatchRecord
+
+# SQLSink / build_sql_rows / insert_sql_rows를 로컬 SQLite 파일에 대해 확인합니다.
+
+def make_rows(file_name, figure_text="Figure 1: overview"):
+    figure = CaptionRecord(fitz.Rect(10, 200, 200, 215), "Figure 1", figure_text, 0, "figure")
+    table_caption = CaptionRecord(fitz.Rect(10, 300, 200, 315), "Table 1", "Table 1: results", 0, "table",
+                                  region_path="output/Table 1_x.pdf")
+    tables = [TableRecord(0, fitz.Rect(10, 320, 200, 400), "Table 1")]
+    matching = {0: {"Figure 1": MatchRecord(fitz.Rect(10, 50, 200, 190), region_path="output/Figure 1_x.pdf")}}
+    return c.build_sql_rows(file_name, [table_caption], [figure], tables, matching)
+
+class CountingConnection:
+    """commit 횟수를 세는 sqlite3 연결 래퍼."""
+    commits = 0
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    def commit(self):
+        CountingConnection.commits += 1
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+def connect_sqlite(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(c.SQLITE_SCHEMA)
+    return conn
+
+def scalar(path, sql, params=()):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+def test_commit_every_batches_documents(tmp_path):
+    db = str(tmp_path / "pdf.db")
+    CountingConnection.commits = 0
+    sink = c.SQLSink(connect=lambda: CountingConnection(connect_sqlite(db)), placeholder="?", commit_every=2,
+                     spill_path=str(tmp_path / "spill.jsonl"))
+    for i in range(5):
+        sink.submit(make_rows(f"{i}.pdf"))
+    sink.close()
+    # 2개, 2개, close() 시 남은 1개
+    assert CountingConnection.commits == 3
+    assert sink.saved == 5 and sink.spilled == 0
+    assert scalar(db, "SELECT COUNT(*) FROM pdf_documents") == 5
+    assert scalar(db, "SELECT COUNT(*) FROM captions") == 10
+    assert scalar(db, "SELECT COUNT(*) FROM tables") == 5
+    assert scalar(db, "SELECT COUNT(*) FROM clusters") == 5
+
+def test_rerun_replaces_previous_rows(tmp_path):
+    db = str(tmp_path / "pdf.db")
+    sink = c.SQLSink.sqlite(db, spill_path=str(tmp_path / "spill.jsonl"))
+    sink.submit(make_rows("a.pdf", "Figure 1: first run"))
+    sink.submit(make_rows("a.pdf", "Figure 1: second run"))
+    sink.close()
+    assert scalar(db, "SELECT COUNT(*) FROM pdf_documents WHERE file_name = ?", ("a.pdf",)) == 1
+    assert scalar(db, "SELECT COUNT(*) FROM captions") == 2
+    assert scalar(db, "SELECT COUNT(*) FROM tables") == 1
+    assert scalar(db, "SELECT COUNT(*) FROM clusters") == 1
+    assert scalar(db, "SELECT caption_text FROM captions WHERE caption_name = 'Figure 1'") == "Figure 1: second run"
+
+def test_full_queue_spills_and_replays(tmp_path):
+    db = str(tmp_path / "pdf.db")
+    spill = str(tmp_path / "spill" / "sql_spill.jsonl")
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_connect():
+        # 첫 문서를 꺼낸 백그라운드 스레드를 붙잡아 두어 대기열이 비지 않게 함
+        entered.set()
+        release.wait(5)
+        return connect_sqlite(db)
+
+    sink = c.SQLSink(connect=slow_connect, placeholder="?", spill_path=spill, queue_size=1)
+    sink.submit(make_rows("0.pdf"))
+    assert entered.wait(5)
+    sink.submit(make_rows("1.pdf"))  # 대기열(크기 1)에 들어감
+    sink.submit(make_rows("2.pdf"))  # 대기열이 가득 차 spill
+    release.set()
+    sink.close()
+    assert sink.saved == 2 and sink.spilled == 1
+    with open(spill, encoding="utf-8") as f:
+        assert [json.loads(line)["file_name"] for line in f] == ["2.pdf"]
+    assert scalar(db, "SELECT COUNT(*) FROM pdf_documents") == 2
+
+    assert sink.replay_spill() == 1
+    assert os.path.getsize(spill) == 0
+    assert scalar(db, "SELECT COUNT(*) FROM pdf_documents") == 3
@@ -0,0 +1,226 @@
+import os
+import json
+import signal
+import asyncio
+import argparse
+from datetime import datetime
+import c
+
+# ── 감시 폴더 수집 데몬 ──
+# 입력 폴더를 주기적으로 확인하여 새로 들어온 PDF를 큐에 넣고, 크기가 제한된 워커 풀로 처리합니다.
+# - 파일은 크기와 수정 시각이 한 번의 확인 주기 동안 그대로일 때(쓰기 완료)만 큐에 넣습니다.
+# - 큐가 가득 차면 폴더 확인을 멈추고 기다리므로(backpressure), 처리하지 못한 파일은 입력 폴더에 남습니다.
+# - 문서마다 c.run_isolated로 별도 프로세스에서 처리하므로 손상된 PDF가 데몬을 중단시키지 않습니다.
+#   (c.py 배치 실행과 같은 옵션과 실행 캐시(<output-dir>/run_cache.jsonl)를 사용)
+# - 처리가 끝난 파일은 done/, 실패한 파일은 failed/로 옮기고, 결과를 매니페스트(JSON Lines)에 기록합니다.
+#   처리 중에 입력 폴더에서 파일이 사라져 옮기지 못하면 moved_to를 null로, 옮기기 오류를 move_error로 기록합니다.
+# - SIGINT/SIGTERM을 받으면 새 파일을 받지 않고, 처리 중인 문서를 마친 뒤 종료합니다.
+#   아직 시작하지 않은 파일은 입력 폴더에 그대로 남아 다음 실행에서 처리됩니다.
+#
+#   python watch.py --input-dir inbox --output-dir clustered --workers 4
+
+def _move(path, folder):
+    """파일을 folder로 옮깁니다. 같은 이름이 있으면 시각을 붙여 덮어쓰지 않습니다."""
+    os.makedirs(folder, exist_ok=True)
+    target = os.path.join(folder, os.path.basename(path))
+    if os.path.exists(target):
+        stem, ext = os.path.splitext(os.path.basename(path))
+        target = os.path.join(folder, f"{stem}_{datetime.now():%Y%m%d%H%M%S%f}{ext}")
+    os.replace(path, target)
+    return target
+
+class WatchDaemon:
+    """
+    입력 폴더를 감시하며 새 PDF를 처리하는 asyncio 데몬입니다.
+    - workers: 동시에 처리할 문서 수 (워커 프로세스 수)
+    - queue_size: 대기 큐 크기. 가득 차면 폴더 확인을 멈춥니다. (기본값: workers * 2)
+    - poll_interval: 입력 폴더 확인 주기(초)
+    - done_dir / failed_dir: 처리 완료 / 실패 파일을 옮길 폴더 (기본값: <input-dir>/done, <input-dir>/failed)
+    - timeout, region_mode, streaming, annotation_mode, save_mode, thumbnails, shards: process_pdf 및 run_batch 참고
+    - sink: SQLSink. 주어지면 워커 대신 데몬이 결과 행을 sink에 넘깁니다.
+    - use_cache: run_batch와 같은 실행 캐시(<output-dir>/run_cache.jsonl)로 이미 처리한 문서는 건너뜁니다. (상태: unchanged)
+    """
+    def __init__(self, input_dir, output_dir, workers=2, queue_size=None, poll_interval=1.0, done_dir=None,
+                 failed_dir=None, timeout=None, region_mode="files", streaming=False, sink=None, manifest_path=None,
+                 annotation_mode="pdf", save_mode="full", thumbnails=None, shards=1, use_cache=True):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.workers = workers
+        self.queue_size = queue_size or workers * 2
+        self.poll_interval = poll_interval
+        self.done_dir = done_dir or os.path.join(input_dir, "done")
+        self.failed_dir = failed_dir or os.path.join(input_dir, "failed")
+        self.timeout = timeout
+        self.region_mode = region_mode
+        self.streaming = streaming
+        self.sink = sink
+        self.manifest_path = manifest_path or os.path.join(output_dir, "manifest.jsonl")
+        self.options = {"region_mode": region_mode, "streaming": streaming, "annotation_mode": annotation_mode,
+                        "save_mode": save_mode, "thumbnails": thumbnails, "shards": shards}
+        self.use_cache = use_cache
+        self.cache = None  # c.RunCache (run()에서 생성)
+        self.stopping = None  # asyncio.Event (run()에서 생성)
+        self.queued = set()  # 큐에 들어갔거나 처리 중인 파일 경로
+        self.processed = 0
+        self.failed = 0
+
+    def stop(self):
+        """새 파일 수집을 멈추고, 처리 중인 문서가 끝나면 종료하도록 요청합니다."""
+        if self.stopping is not None and not self.stopping.is_set():
+            print("종료 요청: 처리 중인 문서를 마친 뒤 종료합니다.")
+            self.stopping.set()
+
+    def _scan(self, sizes):
+        """
+        입력 폴더의 PDF 중 직전 확인 이후 크기/수정 시각이 변하지 않은 파일을 이름순으로 반환합니다.
+        - sizes: 파일 경로 -> (크기, 수정 시각). 이번 확인 결과로 갱신됩니다.
+        """
+        ready = []
+        current = {}
+        with os.scandir(self.input_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.startswith(".") or not entry.name.lower().endswith(".pdf"):
+                    continue
+                if entry.path in self.queued:
+                    continue
+                stat = entry.stat()
+                current[entry.path] = (stat.st_size, stat.st_mtime)
+                if sizes.get(entry.path) == current[entry.path]:
+                    ready.append(entry.path)
+        sizes.clear()
+        sizes.update(current)
+        return sorted(ready)
+
+    async def _until_stopped(self, coro):
+        """coro를 기다리되 종료 요청이 먼저 오면 취소합니다. 완료되었으면 (True, 결과), 아니면 (False, None)."""
+        task = asyncio.ensure_future(coro)
+        stop = asyncio.ensure_future(self.stopping.wait())
+        await asyncio.wait({task, stop}, return_when=asyncio.FIRST_COMPLETED)
+        stop.cancel()
+        if not task.done():
+            task.cancel()
+            return False, None
+        return True, task.result()
+
+    async def _watch(self, jobs):
+        sizes = {}
+        while not self.stopping.is_set():
+            for path in self._scan(sizes):
+                if self.stopping.is_set():
+                    break
+                self.queued.add(path)
+                # 큐가 가득 차면 여기서 대기 (backpressure)
+                queued, _ = await self._until_stopped(jobs.put(path))
+                if not queued:
+                    self.queued.discard(path)
+                    break
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self, jobs, manifest):
+        while not self.stopping.is_set():
+            received, input_path = await self._until_stopped(jobs.get())
+            if not received:
+                return
+            output_path = os.path.join(self.output_dir, os.path.basename(input_path))
+            status, error, wall_time, rows = await asyncio.to_thread(
+                c.run_isolated, input_path, output_path, timeout=self.timeout, cache=self.cache,
+                collect_rows=self.sink is not None, **self.options)
+            if rows is not None and self.sink is not None:
+                self.sink.submit(rows)
+            succeeded = status in ("ok", "unchanged")
+            try:
+                moved_to, move_error = _move(input_path, self.done_dir if succeeded else self.failed_dir), None
+            except OSError as e:
+                # 처리 중에 파일이 입력 폴더에서 삭제/이동된 경우 등: 기록만 남기고 다음 파일을 계속 처리
+                moved_to, move_error = None, f"{type(e).__name__}: {e}"
+            self.queued.discard(input_path)
+            entry = {
+                "file": os.path.basename(input_path),
+                "status": status,
+                "error": error,
+                "wall_time": round(wall_time, 3),
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+                "moved_to": moved_to,
+            }
+            if move_error is not None:
+                entry["move_error"] = move_error
+            manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            manifest.flush()
+            if succeeded:
+                self.processed += 1
+                print(f"{'Processed' if status == 'ok' else 'Unchanged'}: {entry['file']} ({entry['wall_time']}s)")
+            else:
+                self.failed += 1
+                print(f"Failed: {entry['file']} [{status}] {error}")
+            if move_error is not None:
+                print(f"파일을 옮기지 못했습니다: {entry['file']} ({move_error})")
+
+    async def run(self):
+        """데몬을 실행합니다. stop()이 호출되거나 SIGINT/SIGTERM을 받을 때까지 반환하지 않습니다."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.use_cache:
+            self.cache = c.RunCache(os.path.join(self.output_dir, "run_cache.jsonl"))
+        self.stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass  # 신호 처리를 지원하지 않는 플랫폼/스레드
+        jobs = asyncio.Queue(maxsize=self.queue_size)
+        print(f"감시 시작: {self.input_dir} (워커 {self.workers}, 큐 {self.queue_size})")
+        with open(self.manifest_path, "a", encoding="utf-8") as manifest:
+            await asyncio.gather(self._watch(jobs), *(self._work(jobs, manifest) for _ in range(self.workers)))
+        # 큐에만 있던 파일은 입력 폴더에 그대로 남음
+        print(f"감시 종료: 성공 {self.processed}, 실패 {self.failed}, 미처리 {jobs.qsize()}")
+
+def main():
+    parser = argparse.ArgumentParser(description="감시 폴더의 PDF를 계속 처리하는 데몬")
+    parser.add_argument("--input-dir", default="data", help="감시할 입력 폴더")
+    parser.add_argument("--output-dir", default="clustered", help="주석 처리된 PDF 저장 디렉터리")
+    parser.add_argument("--done-dir", default=None, help="처리 완료 파일을 옮길 폴더 (기본값: <input-dir>/done)")
+    parser.add_argument("--failed-dir", default=None, help="실패한 파일을 옮길 폴더 (기본값: <input-dir>/failed)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="동시에 처리할 문서 수")
+    parser.add_argument("--queue-size", type=int, default=None, help="대기 큐 크기 (기본값: 워커 수의 2배)")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="입력 폴더 확인 주기(초)")
+    parser.add_argument("--timeout", type=float, default=None, help="파일당 최대 처리 시간(초)")
+    parser.add_argument("--region-mode", choices=c.RegionWriter.FILE_MODES, default="files", help="영역 PDF 출력 방식")
+    parser.add_argument("--streaming", action="store_true", help="페이지 단위 스트리밍 처리")
+    parser.add_argument("--shards", type=int, default=1, help="문서 하나의 페이지를 N개 프로세스로 나눠 처리")
+    parser.add_argument("--annotation-mode", choices=c.AnnotationRenderer.MODES, default="pdf", help="주석 출력 형식")
+    parser.add_argument("--save-mode", choices=c.AnnotationRenderer.SAVE_MODES, default="full", help="주석 PDF 저장 방식")
+    parser.add_argument("--thumbnails", default=None, help="영역 썸네일 형식 (쉼표 구분: png,webp)")
+    parser.add_argument("--thumbnail-dpi", default="150", help="썸네일 해상도 (쉼표 구분, 기본값: 150)")
+    parser.add_argument("--thumbnail-cache-mb", type=float, default=256,
+                        help="썸네일용 페이지 래스터 캐시 크기(MB, 워커당)")
+    parser.add_argument("--force", action="store_true", help="실행 캐시를 무시하고 모든 파일을 다시 처리")
+    parser.add_argument("--commit-every", type=int, default=20, help="N개 문서마다 한 번 DB 커밋")
+    parser.add_argument("--spill", default=None,
+                        help="DB 저장이 밀리거나 실패할 때 행을 기록할 파일 (기본값: <output-dir>/sql_spill.jsonl)")
+    args = parser.parse_args()
+
+    thumbnails = None
+    if args.thumbnails:
+        thumbnails = {"formats": args.thumbnails.split(","), "dpis": [int(dpi) for dpi in args.thumbnail_dpi.split(",")],
+                      "cache_mb": args.thumbnail_cache_mb}
+        if "webp" in thumbnails["formats"] and c.Image is None:
+            parser.error("webp 썸네일에는 Pillow가 필요합니다. (pip install pillow)")
+    sink = c.SQLSink(commit_every=args.commit_every,
+                     spill_path=args.spill or os.path.join(args.output_dir, "sql_spill.jsonl"))
+    daemon = WatchDaemon(args.input_dir, args.output_dir, workers=args.workers, queue_size=args.queue_size,
+                         poll_interval=args.poll_interval, done_dir=args.done_dir, failed_dir=args.failed_dir,
+                         timeout=args.timeout, region_mode=args.region_mode, streaming=args.streaming, sink=sink,
+                         annotation_mode=args.annotation_mode, save_mode=args.save_mode, thumbnails=thumbnails,
+                         shards=args.shards, use_cache=not args.force)
+    try:
+        asyncio.run(daemon.run())
+    finally:
+        sink.close()
+    if sink.spilled:
+        print(f"DB에 저장하지 못한 문서 {sink.spilled}개를 {sink.spill_path}에 기록했습니다.")
+
+if __name__ == '__main__':
+    main()